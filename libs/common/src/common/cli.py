@@ -3,6 +3,7 @@ from calibre.utils.config import OptionParser
 import calibre.utils.logging as calibre_logging
 from calibre.utils.logging import ThreadSafeLog
 from calibre import setup_cli_handlers
+import asyncio
 import logging
 import re
 import threading
@@ -23,6 +24,12 @@ class MetadataCliHelper:
         parser.add_option(
             "--debug-api", default=False, action="store_true", dest="debug_api"
         )
+        parser.add_option(
+            "--async", default=False, action="store_true", dest="use_async"
+        )
+        parser.add_option(
+            "--timings", default=False, action="store_true", dest="timings"
+        )
         return parser
 
     def run(self, args):
@@ -50,12 +57,29 @@ class MetadataCliHelper:
 
         result_queue = Queue()
         abort = threading.Event()
-        self.plugin.identify(
-            log, result_queue, abort, title=title, authors=authors, identifiers=ids
-        )
+        identify_async = getattr(self.plugin, "identify_async", None)
+        if opts.use_async and identify_async is not None:
+            # Drive the plugin's async pipeline on a private event loop
+            asyncio.run(
+                identify_async(
+                    log,
+                    result_queue,
+                    abort,
+                    title=title,
+                    authors=authors,
+                    identifiers=ids,
+                )
+            )
+        else:
+            self.plugin.identify(
+                log, result_queue, abort, title=title, authors=authors, identifiers=ids
+            )
         ranking = self.plugin.identify_results_keygen(title, authors, ids)
         for rank, result in enumerate(sorted(result_queue.queue, key=ranking), start=1):
             self._print_result(result, rank)
+        metrics = getattr(self.plugin, "request_metrics", None)
+        if opts.timings and metrics is not None:
+            print(metrics.format_summary())
 
     def _print_result(self, result, ranking):
         if result.pubdate:
@@ -0,0 +1,458 @@
+from collections import deque
+from concurrent import futures
+from http import client as http_client
+from typing import Any, Coroutine, NamedTuple, Optional, TypeVar, Union
+from urllib import error
+from urllib.request import getproxies
+import asyncio
+import io
+import logging
+import socket
+import ssl
+import threading
+import time
+import weakref
+
+from .batch import Operation, merge_operations
+from .cache import ResponseCache
+from .client import BaseGraphQLClient
+from .codec import CHUNK_SIZE, ResponseDecoder, create_decompressor
+from .document import Document, as_document
+from .instrumentation import RequestMetrics, RequestObserver, RequestTiming
+from .pool import RESET_ERRORS, PoolKey, proxy_for, split_proxy, split_url
+from .ratelimit import RateLimiter, RetryPolicy
+from .singleflight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+ASYNC_RESET_ERRORS = RESET_ERRORS + (asyncio.IncompleteReadError,)
+# Responses that never have a body, as http.client treats them
+NO_BODY_STATUSES = (204, 304)
+
+T = TypeVar("T")
+
+
+class AsyncResponse(NamedTuple):
+    status: int
+    reason: str
+    headers: http_client.HTTPMessage
+    body: bytearray
+    received: int
+    will_close: bool
+
+
+async def _read_head(reader: asyncio.StreamReader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise http_client.RemoteDisconnected(
+            "Remote end closed connection without response"
+        )
+    version, status, reason = (
+        status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""]
+    )[:3]
+    header_lines = []
+    while line := await reader.readline():
+        if line in (b"\r\n", b"\n"):
+            break
+        header_lines.append(line)
+    headers = http_client.parse_headers(io.BytesIO(b"".join(header_lines) + b"\r\n"))
+    return version, int(status), reason, headers
+
+
+def _tunnel(
+    proxy: tuple[str, int],
+    host: str,
+    port: int,
+    headers: dict[str, str],
+    timeout: float,
+) -> socket.socket:
+    # A socket through the proxy's CONNECT tunnel to host:port, for TLS to
+    # start over. The handshake is http.client's, so this blocks.
+    conn = http_client.HTTPConnection(*proxy, timeout=timeout)
+    conn.set_tunnel(host, port, headers)
+    conn.connect()
+    sock, conn.sock = conn.sock, None
+    return sock  # pyright: ignore[reportReturnType]
+
+
+class _AsyncConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class _LoopState:
+    def __init__(self, maxsize: int):
+        self.slots = asyncio.Semaphore(maxsize)
+        self.idle: dict[PoolKey, deque[tuple[float, _AsyncConnection]]] = {}
+
+
+class AsyncConnectionPool:
+    # asyncio streams belong to the loop that opened them, so each event loop
+    # gets its own set of idle connections and its own concurrency cap
+    def __init__(
+        self,
+        maxsize: int = 8,
+        idle_timeout: float = 60.0,
+        proxies: Optional[dict[str, str]] = None,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        # As for ConnectionPool, HTTP(S)_PROXY unless given
+        self.proxies = getproxies() if proxies is None else proxies
+        self._loops: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, _LoopState
+        ] = weakref.WeakKeyDictionary()
+        self._context: Optional[ssl.SSLContext] = None
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = _LoopState(self.maxsize)
+        return state
+
+    async def _connect(
+        self, key: PoolKey, timeout: float, timing: RequestTiming
+    ) -> _AsyncConnection:
+        start = time.perf_counter()
+        scheme, host, port = key
+        context = None
+        if scheme == "https":
+            if self._context is None:
+                self._context = ssl.create_default_context()
+            context = self._context
+        proxy = proxy_for(self.proxies, key)
+        if proxy is None:
+            connecting = asyncio.open_connection(host, port, ssl=context)
+        elif scheme == "https":
+            proxy_host, proxy_port, proxy_headers = split_proxy(proxy)
+            sock = await asyncio.to_thread(
+                _tunnel, (proxy_host, proxy_port), host, port, proxy_headers, timeout
+            )
+            connecting = asyncio.open_connection(
+                sock=sock, ssl=context, server_hostname=host
+            )
+        else:
+            connecting = asyncio.open_connection(*split_proxy(proxy)[:2])
+        reader, writer = await asyncio.wait_for(connecting, timeout)
+        timing.connect_time += time.perf_counter() - start
+        return _AsyncConnection(reader, writer)
+
+    def _checkout(self, state: _LoopState, key: PoolKey) -> Optional[_AsyncConnection]:
+        now = time.monotonic()
+        idle = state.idle.get(key)
+        while idle:
+            last_used, conn = idle.pop()
+            if now - last_used > self.idle_timeout or conn.reader.at_eof():
+                conn.close()
+                continue
+            return conn
+        return None
+
+    def _checkin(self, state: _LoopState, key: PoolKey, conn: _AsyncConnection):
+        idle = state.idle.setdefault(key, deque())
+        idle.append((time.monotonic(), conn))
+        if len(idle) > self.maxsize:
+            _, evicted = idle.popleft()
+            evicted.close()
+
+    @staticmethod
+    async def _roundtrip(
+        conn: _AsyncConnection,
+        key: PoolKey,
+        method: str,
+        path: str,
+        body: bytes,
+        headers: dict[str, str],
+        timing: RequestTiming,
+    ) -> AsyncResponse:
+        start = time.perf_counter()
+        scheme, host, port = key
+        default_port = 443 if scheme == "https" else 80
+        host_header = host if port == default_port else f"{host}:{port}"
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {host_header}",
+            f"Content-Length: {len(body)}",
+        ]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        conn.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await conn.writer.drain()
+
+        reader = conn.reader
+        while True:
+            version, status, reason, res_headers = await _read_head(reader)
+            # Interim responses (e.g. 100 Continue) come ahead of the real one
+            if not 100 <= status < 200:
+                break
+        timing.time_to_first_byte = time.perf_counter() - start
+
+        decompressor = create_decompressor(res_headers.get("Content-Encoding"))
+        payload = bytearray()
+        received = 0
+
+        def feed(chunk: bytes):
+            nonlocal received
+            received += len(chunk)
+            payload.extend(decompressor.decompress(chunk) if decompressor else chunk)
+
+        will_close = (
+            version == "HTTP/1.0"
+            or res_headers.get("Connection", "").lower() == "close"
+        )
+        if method == "HEAD" or status in NO_BODY_STATUSES:
+            # No body follows, whatever the headers say
+            pass
+        elif res_headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Skip any trailers
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                feed(await reader.readexactly(size))
+                await reader.readexactly(2)
+        elif (length := res_headers.get("Content-Length")) is not None:
+            remaining = int(length)
+            while remaining > 0:
+                chunk = await reader.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(bytes(payload), remaining)
+                remaining -= len(chunk)
+                feed(chunk)
+        else:
+            while chunk := await reader.read(CHUNK_SIZE):
+                feed(chunk)
+            will_close = True
+        if decompressor:
+            payload.extend(decompressor.flush())
+        return AsyncResponse(status, reason, res_headers, payload, received, will_close)
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        body: bytes = b"",
+        headers: Optional[dict[str, str]] = None,
+        timeout: float = 30,
+        timing: Optional[RequestTiming] = None,
+    ) -> AsyncResponse:
+        key, path = split_url(url)
+        headers = headers or {}
+        if key[0] == "http" and (proxy := proxy_for(self.proxies, key)):
+            # Plain HTTP is sent to the proxy as it is, for the whole URL
+            path = url
+            headers = {**headers, **split_proxy(proxy)[2]}
+        timing = timing or RequestTiming()
+        state = self._state()
+        async with state.slots:
+            conn = self._checkout(state, key)
+            reused = conn is not None
+            if conn is None:
+                conn = await self._connect(key, timeout, timing)
+            try:
+                response = await asyncio.wait_for(
+                    self._roundtrip(conn, key, method, path, body, headers, timing),
+                    timeout,
+                )
+            except ASYNC_RESET_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                logger.debug("Pooled connection was reset, reconnecting")
+                conn = await self._connect(key, timeout, timing)
+                try:
+                    response = await asyncio.wait_for(
+                        self._roundtrip(conn, key, method, path, body, headers, timing),
+                        timeout,
+                    )
+                except BaseException:
+                    conn.close()
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(state, key, conn)
+            return response
+
+    async def close(self):
+        # Closes the idle connections of the running event loop
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is None:
+            return
+        for connections in state.idle.values():
+            for _, conn in connections:
+                conn.close()
+
+
+class AsyncGraphQLClient(BaseGraphQLClient):
+    def __init__(
+        self,
+        endpoint: str,
+        useragent: Optional[str] = None,
+        pool: Optional[AsyncConnectionPool] = None,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+        observers: Optional[list[RequestObserver]] = None,
+        persisted_queries: bool = False,
+        coalesce: bool = True,
+    ):
+        super().__init__(
+            endpoint,
+            useragent,
+            cache,
+            rate_limiter,
+            retry,
+            observers,
+            persisted_queries,
+            coalesce,
+        )
+        self._flights = AsyncSingleFlight()
+        self.pool = pool or AsyncConnectionPool()
+
+    async def close(self):
+        await self.pool.close()
+
+    async def execute(
+        self,
+        query: Union[str, Document],
+        variables: Optional[dict] = None,
+        timeout=30,
+        decoder: Optional[ResponseDecoder] = None,
+    ):
+        start = time.perf_counter()
+        document = as_document(query)
+        metrics = self._start_metrics(document, variables)
+        cache_key, cached = self._cache_lookup(document.text, variables, decoder)
+        if cached is not None:
+            metrics.cached = True
+            self._notify(metrics, start)
+            return cached
+
+        async def fetch():
+            payload = await self._send_with_retry(document, variables, timeout, metrics)
+            json_result = self._decode(metrics, payload, decoder)
+            return self._complete(cache_key, json_result, len(payload))
+
+        flight_key = self._flight_key(cache_key, document.text, variables, decoder)
+        try:
+            if flight_key is None:
+                return await fetch()
+            result, metrics.coalesced = await self._flights.do(flight_key, fetch)
+            return result
+        except error.HTTPError as e:
+            metrics.error = str(e)
+            logger.exception("GraphQL request failed")
+            raise e
+        except Exception as e:
+            metrics.error = repr(e)
+            raise
+        finally:
+            self._notify(metrics, start)
+
+    async def _send_with_retry(
+        self,
+        document: Document,
+        variables: Optional[dict],
+        timeout,
+        metrics: RequestMetrics,
+    ) -> bytearray:
+        deadline = self._deadline(timeout)
+        attempt = 0
+        while True:
+            metrics.retries = attempt
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.reserve(max(0.0, deadline - time.monotonic()))
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            try:
+                return await self._send(document, variables, timeout, metrics)
+            except error.HTTPError as e:
+                retry = self._retry_delay(e, attempt, deadline)
+                if retry is None:
+                    raise
+                delay, deferred = retry
+                if not deferred:
+                    await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _send(
+        self,
+        document: Document,
+        variables: Optional[dict],
+        timeout,
+        metrics: RequestMetrics,
+    ) -> bytearray:
+        hash_only = self.persisted_queries
+        while True:
+            body, headers = self._build_request(document, variables, hash_only)
+            timing = RequestTiming()
+            res = await self.pool.request(
+                "POST", self.endpoint, body, headers, timeout, timing
+            )
+            self._record_response(metrics, timing, res.status, res.received)
+            if not hash_only or not self._persisted_query_missing(res.status, res.body):
+                break
+            hash_only = False
+        if res.status >= 400:
+            raise self._http_error(res.status, res.reason, res.headers, res.body)
+        return res.body
+
+    async def execute_batch(
+        self,
+        operations: list[Operation],
+        timeout=30,
+        decoder: Optional[ResponseDecoder] = None,
+    ) -> list[dict]:
+        batch = merge_operations(operations)
+        result = await self.execute(batch.query, batch.variables, timeout, decoder)
+        return batch.split(result)
+
+
+class EventLoopThread:
+    # A private event loop running on a daemon thread, so synchronous callers
+    # on any thread can drive coroutines on one shared loop (and its pool)
+    def __init__(self, name: str = "graphql-event-loop"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name=self.name, daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or thread is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+
+from .document import Document
+from .language import Definition, Token, matching, parse_definitions, render
+
+Operation = tuple[Union[str, Document], Optional[dict]]
+
+
+@dataclass
+class BatchedQuery:
+    query: str
+    variables: dict[str, Any]
+    # Per operation: original response key -> aliased key in the merged query
+    aliases: list[dict[str, str]]
+
+    def split(self, result: dict) -> list[dict]:
+        return [
+            {key: result.get(alias) for key, alias in aliases.items()}
+            for aliases in self.aliases
+        ]
+
+
+def _alias_root_fields(
+    selections: list[Token], prefix: str
+) -> tuple[list[Token], dict[str, str]]:
+    tokens: list[Token] = []
+    aliases: dict[str, str] = {}
+    i = 0
+    while i < len(selections):
+        token = selections[i]
+        if token.kind != "name":
+            raise ValueError(
+                f"Only fields can be batched at the operation root, got {token.value!r}"
+            )
+        key = field_name = token.value
+        i += 1
+        if i < len(selections) and selections[i].value == ":":
+            field_name = selections[i + 1].value
+            i += 2
+        alias = f"{prefix}{key}"
+        aliases[key] = alias
+        tokens += [Token("name", alias), Token("punctuator", ":")]
+        tokens.append(Token("name", field_name))
+        # Arguments, directives and the sub-selection belong to this field
+        while i < len(selections):
+            value = selections[i].value
+            if value in ("(", "{"):
+                end = matching(selections, i)
+                tokens += selections[i : end + 1]
+                i = end + 1
+                if value == "{":
+                    break
+            elif value == "@":
+                tokens += selections[i : i + 2]
+                i += 2
+            else:
+                break
+    return tokens, aliases
+
+
+def _spreads(tokens: list[Token]) -> set[str]:
+    return {
+        tokens[i + 1].value
+        for i in range(len(tokens) - 1)
+        if tokens[i].kind == "spread"
+        and tokens[i + 1].kind == "name"
+        and tokens[i + 1].value != "on"
+    }
+
+
+def _scoped_fragments(fragments: dict[str, Definition]) -> set[str]:
+    # Fragments using variables, directly or through the fragments they
+    # spread, get a renamed copy per operation
+    scoped = {
+        name
+        for name, fragment in fragments.items()
+        if any(token.kind == "variable" for token in fragment.tokens)
+    }
+    changed = True
+    while changed:
+        changed = False
+        for name, fragment in fragments.items():
+            if name not in scoped and _spreads(fragment.tokens) & scoped:
+                scoped.add(name)
+                changed = True
+    return scoped
+
+
+def _rename_variables(
+    tokens: list[Token], prefix: str, scoped: frozenset[str] | set[str] = frozenset()
+) -> list[Token]:
+    # Prefixes the variables, and the spreads of any scoped fragments
+    renamed: list[Token] = []
+    for token in tokens:
+        if token.kind == "variable":
+            token = Token("variable", f"${prefix}{token.value[1:]}")
+        elif token.kind == "name" and token.value in scoped:
+            if renamed and renamed[-1].kind == "spread":
+                token = Token("name", f"{prefix}{token.value}")
+        renamed.append(token)
+    return renamed
+
+
+def merge_operations(operations: list[Operation]) -> BatchedQuery:
+    kind = None
+    variable_tokens: list[Token] = []
+    selection_tokens: list[Token] = []
+    fragments: dict[str, Definition] = {}
+    variables: dict[str, Any] = {}
+    aliases: list[dict[str, str]] = []
+
+    for index, (query, query_variables) in enumerate(operations):
+        prefix = f"b{index}_"
+        definitions = parse_definitions(str(query))
+        operation_defs = [d for d in definitions if d.kind != "fragment"]
+        if len(operation_defs) != 1:
+            raise ValueError("Each batched document must contain exactly one operation")
+        operation = operation_defs[0]
+        if kind is None:
+            kind = operation.kind
+        elif operation.kind != kind:
+            raise ValueError(f"Cannot batch a {operation.kind} with a {kind}")
+
+        operation_fragments = {
+            d.name: d for d in definitions if d.kind == "fragment" and d.name
+        }
+        scoped = _scoped_fragments(operation_fragments)
+        for name, fragment in operation_fragments.items():
+            if name in scoped:
+                tokens = _rename_variables(fragment.tokens, prefix, scoped)
+                name = f"{prefix}{name}"
+                tokens[1] = Token("name", name)
+                fragment = Definition("fragment", name, tokens)
+            existing = fragments.get(name)
+            if existing and existing.tokens != fragment.tokens:
+                raise ValueError(f"Conflicting definitions of fragment {name}")
+            fragments[name] = fragment
+
+        selections, operation_aliases = _alias_root_fields(operation.selections, prefix)
+        selection_tokens += _rename_variables(selections, prefix, scoped)
+        variable_tokens += _rename_variables(operation.variables, prefix)
+        for name, value in (query_variables or {}).items():
+            variables[f"{prefix}{name}"] = value
+        aliases.append(operation_aliases)
+
+    if kind is None:
+        raise ValueError("No operations to batch")
+
+    header = f"{kind} Batched"
+    if variable_tokens:
+        header += f"({render(variable_tokens)})"
+    parts = [f"{header}{{{render(selection_tokens)}}}"]
+    parts += [render(fragment.tokens) for fragment in fragments.values()]
+    return BatchedQuery("\n".join(parts), variables, aliases)
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional
+import hashlib
+import json
+import threading
+import time
+
+from .language import minify, parse_definitions
+
+
+class _Entry(NamedTuple):
+    expires: float
+    size: int
+    value: Any
+
+
+@lru_cache(maxsize=128)
+def _normalize(query: str) -> str:
+    return minify(query)
+
+
+@lru_cache(maxsize=128)
+def is_cacheable(query: str) -> bool:
+    # Never serve mutations (or subscriptions) from the cache
+    definitions = parse_definitions(query)
+    return all(d.kind in ("query", "fragment") for d in definitions)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttl: float = 900.0,
+        max_entries: int = 256,
+        max_bytes: int = 32 * 1024 * 1024,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query: str, variables: Optional[dict] = None) -> str:
+        digest = hashlib.sha256(_normalize(query).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(
+            json.dumps(variables, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        )
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: str, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def invalidate(self, query: Optional[str] = None, variables: Optional[dict] = None):
+        with self._lock:
+            if query is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            # Responses decoded into typed objects are kept under the same key
+            # with the decoder's name after it
+            key = self.make_key(query, variables)
+            prefix = f"{key}:"
+            for cached in [
+                k for k in self._entries if k == key or k.startswith(prefix)
+            ]:
+                self._remove(cached)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -1,23 +1,119 @@
-from typing import Optional
-from urllib import request, error
+from typing import Any, Optional, Union
+from urllib import error
+import io
 import json
 import logging
+import time
+
+from .batch import Operation, merge_operations
+from .cache import ResponseCache, is_cacheable
+from .codec import ACCEPT_ENCODING, ResponseDecoder, loads, read_body
+from .document import Document, as_document
+from .instrumentation import RequestMetrics, RequestObserver, RequestTiming
+from .pool import ConnectionPool
+from .ratelimit import RateLimiter, RetryPolicy, parse_retry_after
+from .singleflight import SingleFlight
+
+PERSISTED_QUERY_NOT_FOUND = ("PERSISTED_QUERY_NOT_FOUND", "PersistedQueryNotFound")
+PERSISTED_QUERY_NOT_SUPPORTED = (
+    "PERSISTED_QUERY_NOT_SUPPORTED",
+    "PersistedQueryNotSupported",
+)
 
 logger = logging.getLogger(__name__)
 
 
-class GraphQLClient:
-    def __init__(self, endpoint: str, useragent: Optional[str] = None):
+class BaseGraphQLClient:
+    # Request building, caching and retry decisions shared by the sync and
+    # asyncio clients, which only differ in how the request is sent
+    def __init__(
+        self,
+        endpoint: str,
+        useragent: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+        observers: Optional[list[RequestObserver]] = None,
+        persisted_queries: bool = False,
+        coalesce: bool = True,
+    ):
         self.endpoint = endpoint
         self.token = None
         self.useragent = useragent
+        # Cached results are shared between callers and must not be mutated
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.observers: list[RequestObserver] = list(observers or [])
+        # Send only the query hash first, and the full text when the server
+        # has not seen it yet (automatic persisted queries)
+        self.persisted_queries = persisted_queries
+        # Join identical queries already in flight instead of resending them
+        self.coalesce = coalesce
 
     def set_token(self, token: str):
         self.token = token
 
-    def execute(self, query: str, variables: Optional[dict] = None, timeout=30):
-        data = {"query": query, "variables": variables}
-        headers = {"Accept": "application/json", "Content-Type": "application/json"}
+    def add_observer(self, observer: RequestObserver):
+        self.observers.append(observer)
+
+    def _start_metrics(
+        self, document: Document, variables: Optional[dict]
+    ) -> RequestMetrics:
+        metrics = RequestMetrics(document.operation_name)
+        if self.observers and variables:
+            metrics.variable_sizes = {
+                name: len(json.dumps(value)) for name, value in variables.items()
+            }
+        return metrics
+
+    def _notify(self, metrics: RequestMetrics, start: float):
+        metrics.total_time = time.perf_counter() - start
+        for observer in self.observers:
+            try:
+                observer.on_request(metrics)
+            except Exception:
+                logger.exception("GraphQL request observer failed")
+
+    def _record_response(
+        self,
+        metrics: RequestMetrics,
+        timing: RequestTiming,
+        status: int,
+        received: int,
+    ):
+        metrics.status = status
+        metrics.connect_time = timing.connect_time
+        metrics.time_to_first_byte = timing.time_to_first_byte
+        metrics.response_bytes = received
+
+    def _decode(
+        self,
+        metrics: RequestMetrics,
+        payload: bytes | bytearray,
+        decoder: Optional[ResponseDecoder],
+    ) -> dict:
+        start = time.perf_counter()
+        result = loads(payload) if decoder is None else decoder.decode(payload)
+        metrics.decode_time = time.perf_counter() - start
+        return result
+
+    def _build_request(
+        self, document: Document, variables: Optional[dict], hash_only: bool = False
+    ) -> tuple[bytes, dict[str, str]]:
+        data: dict[str, Any] = {}
+        if not hash_only:
+            data["query"] = document.text
+        data["variables"] = variables
+        if self.persisted_queries:
+            data["extensions"] = {
+                "persistedQuery": {"version": 1, "sha256Hash": document.sha256}
+            }
+        headers = {
+            "Accept": "application/json",
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Content-Type": "application/json",
+        }
 
         if self.token:
             token = self.token
@@ -33,16 +129,231 @@ class GraphQLClient:
 
         if not self.endpoint.startswith(("http:", "https:")):
             raise ValueError("invalid endpoint")
+        return body, headers
+
+    def _persisted_query_missing(self, status: int, payload: bytes | bytearray) -> bool:
+        # Whether a hash-only request has to be resent with the query text
+        if status not in (200, 400) or (
+            b"ersisted" not in payload and b"PERSISTED" not in payload
+        ):
+            return False
+        try:
+            errors = loads(payload).get("errors") or []
+        except (ValueError, AttributeError):
+            return False
+        for e in errors:
+            code = (e.get("extensions") or {}).get("code")
+            message = e.get("message")
+            if code in PERSISTED_QUERY_NOT_SUPPORTED or (
+                message in PERSISTED_QUERY_NOT_SUPPORTED
+            ):
+                logger.info("Server does not support persisted queries")
+                self.persisted_queries = False
+                return True
+            if (
+                code in PERSISTED_QUERY_NOT_FOUND
+                or message in PERSISTED_QUERY_NOT_FOUND
+            ):
+                return True
+        return False
+
+    @staticmethod
+    def _request_key(
+        query: str, variables: Optional[dict], decoder: Optional[ResponseDecoder]
+    ) -> str:
+        key = ResponseCache.make_key(query, variables)
+        if decoder is not None:
+            key += f":{decoder.name}"
+        return key
+
+    def _cache_lookup(
+        self,
+        query: str,
+        variables: Optional[dict],
+        decoder: Optional[ResponseDecoder] = None,
+    ) -> tuple[Optional[str], Optional[Any]]:
+        if self.cache is None or not is_cacheable(query):
+            return None, None
+        cache_key = self._request_key(query, variables, decoder)
+        return cache_key, self.cache.get(cache_key)
 
-        req = request.Request(self.endpoint, body, headers)  # noqa: S310
+    def _flight_key(
+        self,
+        cache_key: Optional[str],
+        query: str,
+        variables: Optional[dict],
+        decoder: Optional[ResponseDecoder] = None,
+    ) -> Optional[str]:
+        if not self.coalesce:
+            return None
+        if cache_key is not None:
+            return cache_key
+        # Mutations are never joined
+        if not is_cacheable(query):
+            return None
+        return self._request_key(query, variables, decoder)
 
+    def _complete(self, cache_key: Optional[str], json_result: dict, size: int):
+        if cache_key is not None and self.cache is not None:
+            if "errors" not in json_result:
+                self.cache.put(cache_key, json_result.get("data"), size)
+        if "data" in json_result:
+            json_result = json_result.get("data")
+        return json_result
+
+    def _deadline(self, timeout) -> float:
+        return time.monotonic() + (self.retry.deadline if self.retry else timeout)
+
+    def _retry_delay(
+        self, e: error.HTTPError, attempt: int, deadline: float
+    ) -> Optional[tuple[float, bool]]:
+        # Returns how long to wait before retrying, and whether that wait was
+        # handed to the shared rate limiter, or None to give up
+        if self.retry is None or not self.retry.should_retry(e.code, attempt):
+            return None
+        retry_after = parse_retry_after(e.headers.get("Retry-After"))
+        delay = self.retry.delay(attempt, retry_after)
+        if time.monotonic() + delay > deadline:
+            return None
+        logger.warning(
+            "GraphQL request failed with %d, retrying in %.1fs", e.code, delay
+        )
+        if retry_after is not None and self.rate_limiter is not None:
+            # Every thread and process sharing the limiter backs off
+            self.rate_limiter.defer(retry_after)
+            return delay, True
+        return delay, False
+
+    def _http_error(self, status: int, reason: str, headers, payload: bytes):
+        return error.HTTPError(
+            self.endpoint, status, reason, headers, io.BytesIO(payload)
+        )
+
+
+class GraphQLClient(BaseGraphQLClient):
+    def __init__(
+        self,
+        endpoint: str,
+        useragent: Optional[str] = None,
+        pool: Optional[ConnectionPool] = None,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+        observers: Optional[list[RequestObserver]] = None,
+        persisted_queries: bool = False,
+        coalesce: bool = True,
+    ):
+        super().__init__(
+            endpoint,
+            useragent,
+            cache,
+            rate_limiter,
+            retry,
+            observers,
+            persisted_queries,
+            coalesce,
+        )
+        self._flights = SingleFlight()
+        # A single client is shared between calibre's identify worker threads,
+        # so the pool keeps their HTTPS connections alive between queries
+        self.pool = pool or ConnectionPool()
+
+    def close(self):
+        self.pool.close()
+
+    def execute(
+        self,
+        query: Union[str, Document],
+        variables: Optional[dict] = None,
+        timeout=30,
+        decoder: Optional[ResponseDecoder] = None,
+    ):
+        start = time.perf_counter()
+        document = as_document(query)
+        metrics = self._start_metrics(document, variables)
+        cache_key, cached = self._cache_lookup(document.text, variables, decoder)
+        if cached is not None:
+            metrics.cached = True
+            self._notify(metrics, start)
+            return cached
+
+        def fetch():
+            payload = self._send_with_retry(document, variables, timeout, metrics)
+            json_result = self._decode(metrics, payload, decoder)
+            return self._complete(cache_key, json_result, len(payload))
+
+        flight_key = self._flight_key(cache_key, document.text, variables, decoder)
         try:
-            with request.urlopen(req, timeout=timeout) as res:  # noqa: S310
-                body = res.read()
-                json_result = json.loads(body.decode("utf-8"))
-                if "data" in json_result:
-                    json_result = json_result.get("data")
-                return json_result
+            if flight_key is None:
+                return fetch()
+            result, metrics.coalesced = self._flights.do(flight_key, fetch)
+            return result
         except error.HTTPError as e:
+            metrics.error = str(e)
             logger.exception("GraphQL request failed")
             raise e
+        except Exception as e:
+            metrics.error = repr(e)
+            raise
+        finally:
+            self._notify(metrics, start)
+
+    def _send_with_retry(
+        self,
+        document: Document,
+        variables: Optional[dict],
+        timeout,
+        metrics: RequestMetrics,
+    ) -> bytearray:
+        deadline = self._deadline(timeout)
+        attempt = 0
+        while True:
+            metrics.retries = attempt
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(max(0.0, deadline - time.monotonic()))
+            try:
+                return self._send(document, variables, timeout, metrics)
+            except error.HTTPError as e:
+                retry = self._retry_delay(e, attempt, deadline)
+                if retry is None:
+                    raise
+                delay, deferred = retry
+                if not deferred:
+                    time.sleep(delay)
+                attempt += 1
+
+    def _send(
+        self,
+        document: Document,
+        variables: Optional[dict],
+        timeout,
+        metrics: RequestMetrics,
+    ) -> bytearray:
+        hash_only = self.persisted_queries
+        while True:
+            body, headers = self._build_request(document, variables, hash_only)
+            timing = RequestTiming()
+            with self.pool.request(
+                "POST", self.endpoint, body, headers, timeout, timing
+            ) as res:
+                status, reason, res_headers = res.status, res.reason, res.headers
+                payload, received = read_body(res, res_headers.get("Content-Encoding"))
+            self._record_response(metrics, timing, status, received)
+            if not hash_only or not self._persisted_query_missing(status, payload):
+                break
+            hash_only = False
+        if status >= 400:
+            raise self._http_error(status, reason, res_headers, payload)
+        return payload
+
+    def execute_batch(
+        self,
+        operations: list[Operation],
+        timeout=30,
+        decoder: Optional[ResponseDecoder] = None,
+    ) -> list[dict]:
+        # Merge independent operations into one request by aliasing their root
+        # fields, then hand every caller back the keys it asked for
+        batch = merge_operations(operations)
+        result = self.execute(batch.query, batch.variables, timeout, decoder)
+        return batch.split(result)
@@ -0,0 +1,99 @@
+from typing import Any, BinaryIO, Optional, Protocol
+import json
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 64 * 1024
+
+ACCEPT_ENCODING = "gzip, deflate"
+if brotli is not None:
+    ACCEPT_ENCODING += ", br"
+
+
+class Decompressor(Protocol):
+    def decompress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class _DeflateDecompressor:
+    # "deflate" is meant to be zlib-wrapped, but some servers send raw deflate
+    def __init__(self):
+        self._decompressor = zlib.decompressobj()
+        self._started = False
+
+    def decompress(self, data: bytes) -> bytes:
+        if not self._started:
+            self._started = True
+            try:
+                return self._decompressor.decompress(data)
+            except zlib.error:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decompressor.decompress(data)
+
+    def flush(self) -> bytes:
+        return self._decompressor.flush()
+
+
+class _BrotliDecompressor:
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()  # pyright: ignore[reportOptionalMemberAccess]
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.process(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class ResponseDecoder(Protocol):
+    # Decodes a response body into a {"data": ..., "errors": ...} dict, e.g.
+    # with typed objects in place of plain dicts. The name keeps differently
+    # decoded results apart in the response cache.
+    name: str
+
+    def decode(self, payload: bytes | bytearray) -> dict: ...
+
+
+def create_decompressor(encoding: Optional[str]) -> Optional[Decompressor]:
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return _DeflateDecompressor()
+    if encoding == "br" and brotli is not None:
+        return _BrotliDecompressor()
+    raise ValueError(f"Unsupported Content-Encoding {encoding!r}")
+
+
+def read_body(stream: BinaryIO, encoding: Optional[str]) -> tuple[bytearray, int]:
+    # Decompress chunk by chunk so the compressed body is never held in full,
+    # returns the decoded body and the number of bytes received on the wire
+    decompressor = create_decompressor(encoding)
+    body = bytearray()
+    received = 0
+    while chunk := stream.read(CHUNK_SIZE):
+        received += len(chunk)
+        body += decompressor.decompress(chunk) if decompressor else chunk
+    if decompressor:
+        body += decompressor.flush()
+    return body, received
+
+
+def loads(body: bytes | bytearray) -> Any:
+    # Parse straight from bytes, without an intermediate decoded str copy
+    # where orjson is available (json.loads still decodes internally)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
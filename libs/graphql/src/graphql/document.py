@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Union
+import hashlib
+
+from .language import Definition, operation_name, parse_definitions, render
+
+
+@dataclass(frozen=True)
+class Document:
+    # A query ready to send: the text is sent as is and the hash identifies it
+    # for persisted queries
+    text: str
+    sha256: str
+    operation_name: Optional[str]
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _spreads(definition: Definition) -> list[str]:
+    tokens = definition.tokens
+    return [
+        tokens[i + 1].value
+        for i, token in enumerate(tokens[:-1])
+        if token.kind == "spread"
+        and tokens[i + 1].kind == "name"
+        and tokens[i + 1].value != "on"
+    ]
+
+
+def compile_document(source: str, fragments: str = "") -> Document:
+    # Minifies a single operation and appends only the fragments it uses,
+    # directly or through other fragments, in the order they are defined
+    operations = parse_definitions(source)
+    if len(operations) != 1 or operations[0].kind == "fragment":
+        raise ValueError("Expected a document with exactly one operation")
+    operation = operations[0]
+    available = {
+        definition.name: definition
+        for definition in parse_definitions(fragments)
+        if definition.kind == "fragment"
+    }
+
+    used: set[str] = set()
+    pending = _spreads(operation)
+    while pending:
+        name = pending.pop()
+        if name in used:
+            continue
+        if name not in available:
+            raise ValueError(f"Unknown fragment {name!r}")
+        used.add(name)
+        pending += _spreads(available[name])
+
+    text = render(operation.tokens) + "".join(
+        render(definition.tokens)
+        for name, definition in available.items()
+        if name in used
+    )
+    return Document(text, _hash(text), operation.name)
+
+
+@lru_cache(maxsize=128)
+def _from_text(text: str) -> Document:
+    return Document(text, _hash(text), operation_name(text))
+
+
+def as_document(query: Union[str, Document]) -> Document:
+    # Plain query strings are sent unchanged
+    if isinstance(query, Document):
+        return query
+    return _from_text(query)
@@ -0,0 +1,114 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Protocol
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+TIMING_FIELDS = (
+    "connect_time",
+    "time_to_first_byte",
+    "decode_time",
+    "total_time",
+    "response_bytes",
+)
+
+
+@dataclass
+class RequestTiming:
+    # Filled in by the connection pools for the request that was sent
+    connect_time: float = 0.0
+    time_to_first_byte: float = 0.0
+
+
+@dataclass
+class RequestMetrics:
+    operation: Optional[str]
+    variable_sizes: dict[str, int] = field(default_factory=dict)
+    # Zero when a pooled connection was reused
+    connect_time: float = 0.0
+    time_to_first_byte: float = 0.0
+    total_time: float = 0.0
+    # Bytes received on the wire, before decompression
+    response_bytes: int = 0
+    decode_time: float = 0.0
+    status: Optional[int] = None
+    retries: int = 0
+    cached: bool = False
+    # Joined an identical request that was already in flight
+    coalesced: bool = False
+    error: Optional[str] = None
+
+
+class RequestObserver(Protocol):
+    def on_request(self, metrics: RequestMetrics) -> None: ...
+
+
+def percentile(values: list[float], pct: float) -> float:
+    # Nearest-rank percentile of already sorted values
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+class MetricsCollector:
+    def __init__(self, max_samples: int = 10000):
+        self._samples: deque[RequestMetrics] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def on_request(self, metrics: RequestMetrics) -> None:
+        with self._lock:
+            self._samples.append(metrics)
+
+    @property
+    def samples(self) -> list[RequestMetrics]:
+        with self._lock:
+            return list(self._samples)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(
+        self, percentiles: tuple[float, ...] = (50, 90, 99)
+    ) -> dict[str, dict[str, dict[str, float]]]:
+        by_operation: dict[str, list[RequestMetrics]] = {}
+        for sample in self.samples:
+            if sample.cached or sample.coalesced:
+                continue
+            by_operation.setdefault(sample.operation or "anonymous", []).append(sample)
+        summary = {}
+        for operation, samples in by_operation.items():
+            stats: dict[str, dict[str, float]] = {
+                "count": {"total": len(samples)},
+                "retries": {"total": sum(s.retries for s in samples)},
+            }
+            for name in TIMING_FIELDS:
+                values = sorted(getattr(s, name) for s in samples)
+                stats[name] = {f"p{p:g}": percentile(values, p) for p in percentiles}
+            summary[operation] = stats
+        return summary
+
+    def format_summary(self, percentiles: tuple[float, ...] = (50, 90, 99)) -> str:
+        lines = []
+        for operation, stats in sorted(self.summary(percentiles).items()):
+            lines.append(
+                f"{operation}: {stats['count']['total']:g} requests, "
+                f"{stats['retries']['total']:g} retries"
+            )
+            for name in TIMING_FIELDS:
+                values = ", ".join(
+                    f"{key}={value:.3f}"
+                    if name != "response_bytes"
+                    else f"{key}={value:g}"
+                    for key, value in stats[name].items()
+                )
+                lines.append(f"  {name}: {values}")
+        return "\n".join(lines)
+
+    def dump(self, log=logger.info):
+        for line in self.format_summary().splitlines():
+            log(line)
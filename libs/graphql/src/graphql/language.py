@@ -0,0 +1,149 @@
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import re
+
+# Just enough of the GraphQL lexical grammar to rewrite and minify documents.
+# Commas are insignificant in GraphQL, so they are skipped with whitespace.
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ignored>[\s,\ufeff]+|\#[^\n\r]*)
+    | (?P<block_string>\"\"\"(?:\\\"\"\"|(?!\"\"\")[\s\S])*\"\"\")
+    | (?P<string>"(?:\\.|[^"\\\n\r])*")
+    | (?P<spread>\.\.\.)
+    | (?P<variable>\$[_A-Za-z][_0-9A-Za-z]*)
+    | (?P<name>[_A-Za-z][_0-9A-Za-z]*)
+    | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    | (?P<punctuator>[!&():=@\[\]{|}])
+    """,
+    re.VERBOSE,
+)
+
+_WORD_KINDS = frozenset(["name", "number", "variable"])
+_PAIRS = {"(": ")", "[": "]", "{": "}"}
+OPERATION_KINDS = frozenset(["query", "mutation", "subscription"])
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+
+
+@dataclass
+class Definition:
+    kind: str
+    name: Optional[str]
+    tokens: list[Token]
+    # Variable definitions and root selections, without their brackets
+    variables: list[Token] = field(default_factory=list)
+    selections: list[Token] = field(default_factory=list)
+
+
+def tokenize(document: str) -> list[Token]:
+    tokens = []
+    pos = 0
+    while pos < len(document):
+        match = _TOKEN_RE.match(document, pos)
+        if not match:
+            raise ValueError(f"Unexpected character {document[pos]!r} at {pos}")
+        kind = match.lastgroup
+        if kind and kind != "ignored":
+            tokens.append(Token(kind, match.group()))
+        pos = match.end()
+    return tokens
+
+
+def render(tokens: list[Token]) -> str:
+    parts = []
+    previous = None
+    for token in tokens:
+        if previous in _WORD_KINDS and token.kind in _WORD_KINDS:
+            parts.append(" ")
+        parts.append(token.value)
+        previous = token.kind
+    return "".join(parts)
+
+
+def minify(document: str) -> str:
+    return render(tokenize(document))
+
+
+def matching(tokens: list[Token], start: int) -> int:
+    opening = tokens[start].value
+    closing = _PAIRS[opening]
+    depth = 0
+    for i in range(start, len(tokens)):
+        value = tokens[i].value
+        if tokens[i].kind != "punctuator":
+            continue
+        if value == opening:
+            depth += 1
+        elif value == closing:
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError(f"Unbalanced {opening!r} in document")
+
+
+def parse_definitions(document: str) -> list[Definition]:
+    tokens = tokenize(document)
+    definitions = []
+    i = 0
+    while i < len(tokens):
+        start = i
+        token = tokens[i]
+        if token.value == "{":
+            end = matching(tokens, i)
+            definitions.append(
+                Definition(
+                    "query", None, tokens[start : end + 1], [], tokens[i + 1 : end]
+                )
+            )
+            i = end + 1
+            continue
+        if token.kind != "name" or (
+            token.value not in OPERATION_KINDS and token.value != "fragment"
+        ):
+            raise ValueError(f"Unexpected token {token.value!r} in document")
+        kind = token.value
+        i += 1
+        name = None
+        if i < len(tokens) and tokens[i].kind == "name" and tokens[i].value != "on":
+            name = tokens[i].value
+            i += 1
+        variables: list[Token] = []
+        if i < len(tokens) and tokens[i].value == "(":
+            end = matching(tokens, i)
+            variables = tokens[i + 1 : end]
+            i = end + 1
+        # Skip type condition / directives until the selection set
+        while i < len(tokens) and tokens[i].value != "{":
+            if tokens[i].value == "(":
+                i = matching(tokens, i)
+            i += 1
+        if i >= len(tokens):
+            raise ValueError(f"Missing selection set for {kind} {name}")
+        end = matching(tokens, i)
+        definitions.append(
+            Definition(
+                kind,
+                name,
+                tokens[start : end + 1],
+                variables,
+                tokens[i + 1 : end],
+            )
+        )
+        i = end + 1
+    return definitions
+
+
+@lru_cache(maxsize=128)
+def operation_name(document: str) -> Optional[str]:
+    try:
+        definitions = parse_definitions(document)
+    except ValueError:
+        return None
+    for definition in definitions:
+        if definition.kind != "fragment":
+            return definition.name
+    return None
@@ -0,0 +1,231 @@
+from collections import deque
+from contextlib import contextmanager
+from http import client as http_client
+from typing import Iterator, Optional
+from urllib.parse import unquote, urlsplit
+from urllib.request import getproxies, proxy_bypass
+import base64
+import logging
+import ssl
+import threading
+import time
+
+from .instrumentation import RequestTiming
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean a kept-alive connection was dropped by the server while idle
+RESET_ERRORS = (
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+    http_client.RemoteDisconnected,
+)
+
+PoolKey = tuple[str, str, int]
+
+
+def split_url(url: str) -> tuple[PoolKey, str]:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("invalid endpoint")
+    default_port = 443 if parts.scheme == "https" else 80
+    key = (parts.scheme, parts.hostname, parts.port or default_port)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return key, path
+
+
+def split_proxy(proxy: str) -> tuple[str, int, dict[str, str]]:
+    # (host, port, headers) for a proxy URL, its credentials (if any) going
+    # in a Proxy-Authorization header
+    parts = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+    if not parts.hostname:
+        raise ValueError("invalid proxy")
+    headers = {}
+    if parts.username:
+        credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+        token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+        headers["Proxy-Authorization"] = f"Basic {token}"
+    default_port = 443 if parts.scheme == "https" else 80
+    return parts.hostname, parts.port or default_port, headers
+
+
+def proxy_for(proxies: dict[str, str], key: PoolKey) -> Optional[str]:
+    # The proxy URL for requests to `key`, unless no_proxy excludes the host
+    scheme, host, _ = key
+    proxy = proxies.get(scheme)
+    if not proxy or proxy_bypass(host):
+        return None
+    return proxy
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        maxsize: int = 4,
+        idle_timeout: float = 60.0,
+        proxies: Optional[dict[str, str]] = None,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        # Proxy URLs by scheme, the HTTP(S)_PROXY settings urlopen would use
+        # unless given
+        self.proxies = getproxies() if proxies is None else proxies
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self._idle: dict[PoolKey, deque[tuple[float, http_client.HTTPConnection]]] = {}
+        self._context: Optional[ssl.SSLContext] = None
+
+    def _new_connection(self, key: PoolKey, timeout: float):
+        scheme, host, port = key
+        proxy = proxy_for(self.proxies, key)
+        address, tunnel_headers = (host, port), None
+        if proxy is not None:
+            proxy_host, proxy_port, tunnel_headers = split_proxy(proxy)
+            address = (proxy_host, proxy_port)
+        if scheme == "https":
+            if self._context is None:
+                self._context = ssl.create_default_context()
+            conn = http_client.HTTPSConnection(
+                *address, timeout=timeout, context=self._context
+            )
+            if proxy is not None:
+                # TLS runs end to end through a CONNECT tunnel
+                conn.set_tunnel(host, port, tunnel_headers)
+        else:
+            conn = http_client.HTTPConnection(*address, timeout=timeout)
+        conn.connect()
+        return conn
+
+    def _checkout(
+        self, key: PoolKey, timeout: float, timing: RequestTiming
+    ) -> tuple[http_client.HTTPConnection, bool]:
+        now = time.monotonic()
+        expired = []
+        conn = None
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                last_used, candidate = idle.pop()
+                if now - last_used > self.idle_timeout:
+                    expired.append(candidate)
+                    continue
+                conn = candidate
+                break
+        for stale in expired:
+            stale.close()
+        if conn is None:
+            return self._timed_connect(key, timeout, timing), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _timed_connect(self, key: PoolKey, timeout: float, timing: RequestTiming):
+        start = time.perf_counter()
+        conn = self._new_connection(key, timeout)
+        timing.connect_time += time.perf_counter() - start
+        return conn
+
+    def _checkin(
+        self,
+        key: PoolKey,
+        conn: http_client.HTTPConnection,
+        res: http_client.HTTPResponse,
+    ):
+        # Only connections whose response was fully consumed can be reused
+        if res.will_close or not res.isclosed():
+            conn.close()
+            return
+        evicted = None
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            idle.append((time.monotonic(), conn))
+            if len(idle) > self.maxsize:
+                _, evicted = idle.popleft()
+        if evicted is not None:
+            evicted.close()
+
+    @staticmethod
+    def _roundtrip(
+        conn: http_client.HTTPConnection,
+        method: str,
+        path: str,
+        body: Optional[bytes],
+        headers: dict[str, str],
+        timing: RequestTiming,
+    ) -> http_client.HTTPResponse:
+        start = time.perf_counter()
+        conn.request(method, path, body, headers)
+        res = conn.getresponse()
+        timing.time_to_first_byte = time.perf_counter() - start
+        return res
+
+    def _send(
+        self,
+        key: PoolKey,
+        method: str,
+        path: str,
+        body: Optional[bytes],
+        headers: dict[str, str],
+        timeout: float,
+        timing: RequestTiming,
+    ) -> tuple[http_client.HTTPConnection, http_client.HTTPResponse]:
+        conn, reused = self._checkout(key, timeout, timing)
+        try:
+            return conn, self._roundtrip(conn, method, path, body, headers, timing)
+        except RESET_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+        except BaseException:
+            conn.close()
+            raise
+        logger.debug("Pooled connection was reset, reconnecting")
+        conn = self._timed_connect(key, timeout, timing)
+        try:
+            return conn, self._roundtrip(conn, method, path, body, headers, timing)
+        except BaseException:
+            conn.close()
+            raise
+
+    @contextmanager
+    def request(
+        self,
+        method: str,
+        url: str,
+        body: Optional[bytes] = None,
+        headers: Optional[dict[str, str]] = None,
+        timeout: float = 30,
+        timing: Optional[RequestTiming] = None,
+    ) -> Iterator[http_client.HTTPResponse]:
+        key, path = split_url(url)
+        headers = headers or {}
+        if key[0] == "http" and (proxy := proxy_for(self.proxies, key)):
+            # Plain HTTP is sent to the proxy as it is, for the whole URL
+            path = url
+            headers = {**headers, **split_proxy(proxy)[2]}
+        timing = timing or RequestTiming()
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a pooled connection")
+        try:
+            conn, res = self._send(key, method, path, body, headers, timeout, timing)
+            try:
+                yield res
+            except BaseException:
+                conn.close()
+                raise
+            self._checkin(key, conn, res)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, conn in connections:
+                conn.close()
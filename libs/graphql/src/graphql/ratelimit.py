@@ -0,0 +1,148 @@
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional
+import logging
+import os
+import random
+import threading
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        deadline: float = 120.0,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def should_retry(self, status: int, attempt: int) -> bool:
+        return status in RETRY_STATUSES and attempt + 1 < self.max_attempts
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return retry_after
+        # "Full jitter" keeps retrying threads from hitting the API in lockstep
+        ceiling = min(self.max_delay, self.base_delay * 2**attempt)
+        return random.uniform(0, ceiling)  # noqa: S311
+
+
+class _State:
+    __slots__ = ("tokens", "updated", "blocked_until")
+
+    def __init__(self, tokens: float, updated: float, blocked_until: float = 0.0):
+        self.tokens = tokens
+        self.updated = updated
+        self.blocked_until = blocked_until
+
+
+# Token bucket shared by every thread using it. When given a state file the
+# bucket is also shared with other processes (e.g. calibre's metadata workers),
+# with a lock on the file serialising access to the stored state.
+class RateLimiter:
+    def __init__(self, rate: float, burst: int = 1, state_file: Optional[str] = None):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._state = _State(float(burst), time.time())
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[_State]:
+        with self._lock:
+            if self.state_file is None:
+                yield self._state
+                return
+            if self._fd is None:
+                self._fd = os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o600)
+            fd = self._fd
+            os.lseek(fd, 0, os.SEEK_SET)
+            if os.name == "nt":
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = self._read(fd)
+                yield state
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(
+                    fd,
+                    f"{state.tokens} {state.updated} {state.blocked_until}".encode(),
+                )
+            finally:
+                os.lseek(fd, 0, os.SEEK_SET)
+                if os.name == "nt":
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _read(self, fd: int) -> _State:
+        try:
+            tokens, updated, blocked_until = os.read(fd, 128).split()
+            return _State(float(tokens), float(updated), float(blocked_until))
+        except ValueError:
+            return _State(float(self.burst), time.time())
+
+    def reserve(self, timeout: Optional[float]) -> float:
+        with self._locked_state() as state:
+            now = time.time()
+            elapsed = max(0.0, now - state.updated)
+            tokens = min(float(self.burst), state.tokens + elapsed * self.rate)
+            # Tokens go negative while requests are queued, which spaces
+            # waiting callers out at exactly the configured rate
+            wait = max(0.0, (1.0 - tokens) / self.rate, state.blocked_until - now)
+            if timeout is not None and wait > timeout:
+                raise TimeoutError(f"Rate limited for another {wait:.1f}s")
+            state.tokens = tokens - 1.0
+            state.updated = now
+            return wait
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        wait = self.reserve(timeout)
+        if wait > 0:
+            logger.debug("Rate limited, waiting %.2fs", wait)
+            time.sleep(wait)
+        return wait
+
+    def defer(self, seconds: float):
+        # Pause every caller, e.g. when the server responds with Retry-After
+        with self._locked_state() as state:
+            state.blocked_until = max(state.blocked_until, time.time() + seconds)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
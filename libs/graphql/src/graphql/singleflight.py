@@ -0,0 +1,94 @@
+from typing import Any, Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+import asyncio
+import threading
+import weakref
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+# Runs one call per key at a time: threads asking for a key that is already
+# in flight wait for that call and share its result (or its exception)
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> tuple[T, bool]:
+        # Returns the result and whether it came from another caller's call
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True  # pyright: ignore[reportReturnType]
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class _AsyncCall:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    # The shared call runs as its own task, so a cancelled waiter only stops
+    # waiting. The call itself is cancelled once nobody is waiting for it.
+    def __init__(self):
+        self._loops: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[Hashable, _AsyncCall]
+        ] = weakref.WeakKeyDictionary()
+
+    def _calls(self) -> dict[Hashable, _AsyncCall]:
+        loop = asyncio.get_running_loop()
+        calls = self._loops.get(loop)
+        if calls is None:
+            calls = self._loops[loop] = {}
+        return calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        calls = self._calls()
+        call = calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = calls[key] = _AsyncCall(asyncio.ensure_future(fn()))
+
+            def forget(_: Any, call: _AsyncCall = call):
+                if calls.get(key) is call:
+                    del calls[key]
+
+            call.task.add_done_callback(forget)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                if calls.get(key) is call:
+                    del calls[key]
+                call.task.cancel()
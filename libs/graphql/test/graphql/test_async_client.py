@@ -0,0 +1,244 @@
+import asyncio
+import gzip
+import json
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import error
+from graphql.async_client import (
+    AsyncConnectionPool,
+    AsyncGraphQLClient,
+    EventLoopThread,
+)
+from graphql.instrumentation import MetricsCollector
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections: set = set()
+    responses: list = []
+
+    def do_POST(self):
+        Handler.connections.add(self.client_address)
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        status, body, headers = Handler.responses.pop(0)
+        if callable(body):
+            body = body(request)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if headers.get("Transfer-Encoding") == "chunked":
+            self.end_headers()
+            for chunk in (body[:10], body[10:]):
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.connections = set()
+    Handler.responses = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client(server):
+    host, port = server.server_address
+    return AsyncGraphQLClient(f"http://{host}:{port}/graphql")
+
+
+def echo(request):
+    return json.dumps({"data": {"echo": request["variables"]}}).encode()
+
+
+def test_execute(client: AsyncGraphQLClient):
+    Handler.responses = [(200, echo, {})]
+
+    async def run():
+        try:
+            return await client.execute("query { echo }", {"a": 1})
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == {"echo": {"a": 1}}
+
+
+def test_execute_concurrently_reuses_connections(client: AsyncGraphQLClient):
+    Handler.responses = [(200, echo, {}) for _ in range(20)]
+
+    async def run():
+        try:
+            first = await client.execute("query { echo }", {"n": -1})
+            rest = await asyncio.gather(
+                *(client.execute("query { echo }", {"n": n}) for n in range(19))
+            )
+            return [first, *rest]
+        finally:
+            await client.close()
+
+    results = asyncio.run(run())
+
+    assert [result["echo"]["n"] for result in results] == list(range(-1, 19))
+    assert len(Handler.connections) <= client.pool.maxsize
+
+
+def test_execute_chunked_gzip(client: AsyncGraphQLClient):
+    body = gzip.compress(b'{"data": {"test": "' + b"x" * 1000 + b'"}}')
+    headers = {"Content-Encoding": "gzip", "Transfer-Encoding": "chunked"}
+    Handler.responses = [(200, body, headers)]
+
+    async def run():
+        try:
+            return await client.execute("query { test }")
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == {"test": "x" * 1000}
+
+
+def test_execute_http_error(client: AsyncGraphQLClient):
+    Handler.responses = [(500, b"failed", {})]
+
+    async def run():
+        try:
+            return await client.execute("query { test }")
+        finally:
+            await client.close()
+
+    with pytest.raises(error.HTTPError) as exc:
+        asyncio.run(run())
+    assert exc.value.code == 500
+
+
+def test_execute_batch(client: AsyncGraphQLClient):
+    Handler.responses = [(200, b'{"data": {"b0_a": 1, "b1_a": 2}}', {})]
+
+    async def run():
+        try:
+            return await client.execute_batch([("{ a }", None), ("{ a }", None)])
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == [{"a": 1}, {"a": 2}]
+
+
+def test_event_loop_thread(client: AsyncGraphQLClient):
+    Handler.responses = [(200, echo, {}), (200, echo, {})]
+    loop = EventLoopThread()
+
+    assert loop.run(client.execute("query { echo }", {"a": 1})) == {"echo": {"a": 1}}
+    assert loop.run(client.execute("query { echo }", {"a": 2})) == {"echo": {"a": 2}}
+    # Both calls ran on the same private loop, so the connection was reused
+    assert len(Handler.connections) == 1
+    loop.run(client.close())
+    loop.close()
+
+
+def test_execute_records_timings(server):
+    collector = MetricsCollector()
+    host, port = server.server_address
+    client = AsyncGraphQLClient(f"http://{host}:{port}/graphql", observers=[collector])
+    Handler.responses = [(200, echo, {}), (200, echo, {})]
+
+    async def run():
+        try:
+            await client.execute("query Echo { echo }", {"a": 1})
+            await client.execute("query Echo { echo }", {"a": 2})
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+
+    first, second = collector.samples
+    assert first.operation == "Echo"
+    assert first.status == 200
+    assert first.connect_time > 0
+    assert first.time_to_first_byte > 0
+    assert first.response_bytes > 0
+    # The second request reuses the pooled connection
+    assert second.connect_time == 0
+
+
+def test_responses_without_a_body_keep_the_connection():
+    # Neither response has a Content-Length, and the connection stays open
+    responses = [
+        b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 204 No Content\r\n\r\n",
+        b'HTTP/1.1 304 Not Modified\r\nETag: "v1"\r\n\r\n',
+    ]
+    connections = []
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connections.append(writer)
+        for response in responses:
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            writer.write(response)
+            await writer.drain()
+        await reader.read()
+
+    async def run():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        pool = AsyncConnectionPool()
+        try:
+            url = f"http://{host}:{port}/"
+            first = await pool.request("GET", url, timeout=2)
+            second = await pool.request("GET", url, timeout=2)
+            return first, second
+        finally:
+            await pool.close()
+            server.close()
+
+    first, second = asyncio.run(run())
+    assert (first.status, bytes(first.body)) == (204, b"")
+    assert (second.status, bytes(second.body)) == (304, b"")
+    assert len(connections) == 1
+
+
+def test_requests_go_through_the_proxy():
+    requests = []
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        head = []
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            head.append(line.decode().strip())
+        requests.append(head)
+        if head[0].startswith("CONNECT"):
+            writer.write(b"HTTP/1.1 407 Proxy Authentication Required\r\n\r\n")
+        else:
+            writer.write(b"HTTP/1.1 204 No Content\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        proxy = f"http://user:secret@{host}:{port}"
+        pool = AsyncConnectionPool(proxies={"http": proxy, "https": proxy})
+        try:
+            response = await pool.request("GET", "http://books.test/cover", timeout=2)
+            with pytest.raises(OSError):
+                await pool.request("GET", "https://books.test/cover", timeout=2)
+            return response
+        finally:
+            await pool.close()
+            server.close()
+
+    assert asyncio.run(run()).status == 204
+    authorization = "Proxy-Authorization: Basic dXNlcjpzZWNyZXQ="
+    assert requests[0][0] == "GET http://books.test/cover HTTP/1.1"
+    assert authorization in requests[0]
+    assert requests[1][0].startswith("CONNECT books.test:443 ")
+    assert authorization in requests[1]
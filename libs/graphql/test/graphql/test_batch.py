@@ -0,0 +1,100 @@
+import pytest
+from graphql.batch import merge_operations
+from graphql.language import minify
+
+FRAGMENT = """
+fragment BookData on books {
+  id
+  title
+}
+"""
+
+BY_SLUG = (
+    FRAGMENT
+    + """
+query FindBookBySlug($slug: String) {
+  books(where: {slug: {_eq: $slug}}) {
+    ...BookData
+  }
+}
+"""
+)
+
+BY_ID = (
+    FRAGMENT
+    + """
+query FindBookById($id: Int!) {
+  books: books_by_pk(id: $id) {
+    ...BookData
+  }
+}
+"""
+)
+
+
+def test_minify():
+    query = (
+        'query Test($a: [Int!], $b: String = "a b") {\n  test(a: $a, b: $b) { id }\n}'
+    )
+    assert minify(query) == 'query Test($a:[Int!]$b:String="a b"){test(a:$a b:$b){id}}'
+
+
+def test_merge_operations():
+    batch = merge_operations([(BY_SLUG, {"slug": "the-hobbit"}), (BY_ID, {"id": 1})])
+
+    assert batch.query == (
+        "query Batched($b0_slug:String $b1_id:Int!)"
+        "{b0_books:books(where:{slug:{_eq:$b0_slug}}){...BookData}"
+        "b1_books:books_by_pk(id:$b1_id){...BookData}}\n"
+        "fragment BookData on books{id title}"
+    )
+    assert batch.variables == {"b0_slug": "the-hobbit", "b1_id": 1}
+    assert batch.aliases == [{"books": "b0_books"}, {"books": "b1_books"}]
+
+
+def test_split_result():
+    batch = merge_operations([(BY_SLUG, {"slug": "the-hobbit"}), (BY_ID, {"id": 1})])
+
+    result = batch.split({"b0_books": [], "b1_books": {"id": 1}})
+
+    assert result == [{"books": []}, {"books": {"id": 1}}]
+
+
+def test_merge_rejects_mixed_operations():
+    with pytest.raises(ValueError):
+        merge_operations([(BY_ID, None), ("mutation { test }", None)])
+
+
+def test_merge_rejects_conflicting_fragments():
+    other = "fragment BookData on books { slug }\nquery { books { ...BookData } }"
+    with pytest.raises(ValueError):
+        merge_operations([(BY_ID, None), (other, None)])
+
+
+def test_merge_renames_variables_in_fragments():
+    editions = """
+fragment Editions on books {
+  editions(limit: $limit) { id }
+}
+fragment BookData on books {
+  id
+  ...Editions
+}
+fragment Title on books { title }
+query FindBookById($id: Int!, $limit: Int) {
+  books: books_by_pk(id: $id) { ...BookData ...Title }
+}
+"""
+    batch = merge_operations([(editions, {"id": 1, "limit": 5}), (editions, {"id": 2})])
+
+    assert batch.query == (
+        "query Batched($b0_id:Int!$b0_limit:Int $b1_id:Int!$b1_limit:Int)"
+        "{b0_books:books_by_pk(id:$b0_id){...b0_BookData...Title}"
+        "b1_books:books_by_pk(id:$b1_id){...b1_BookData...Title}}\n"
+        "fragment b0_Editions on books{editions(limit:$b0_limit){id}}\n"
+        "fragment b0_BookData on books{id...b0_Editions}\n"
+        "fragment Title on books{title}\n"
+        "fragment b1_Editions on books{editions(limit:$b1_limit){id}}\n"
+        "fragment b1_BookData on books{id...b1_Editions}"
+    )
+    assert batch.variables == {"b0_id": 1, "b0_limit": 5, "b1_id": 2}
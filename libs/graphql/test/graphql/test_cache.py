@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+from graphql.cache import ResponseCache, is_cacheable
+from graphql.client import GraphQLClient
+
+QUERY = "query Test($id: Int) { test(id: $id) { id } }"
+
+
+def test_key_ignores_formatting_and_variable_order():
+    reformatted = "query Test($id: Int) {\n  test(id: $id) {\n    id\n  }\n}"
+    assert ResponseCache.make_key(QUERY, {"id": 1, "a": 2}) == ResponseCache.make_key(
+        reformatted, {"a": 2, "id": 1}
+    )
+    assert ResponseCache.make_key(QUERY, {"id": 1}) != ResponseCache.make_key(
+        QUERY, {"id": 2}
+    )
+
+
+def test_hit_and_miss_counters():
+    cache = ResponseCache()
+    key = cache.make_key(QUERY, {"id": 1})
+
+    assert cache.get(key) is None
+    cache.put(key, {"test": 1}, 10)
+    assert cache.get(key) == {"test": 1}
+
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "bytes": 10}
+
+
+def test_expired_entries_are_dropped(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("time.monotonic", lambda: now)
+    cache = ResponseCache(ttl=10)
+    cache.put("key", {}, 1)
+
+    now += 11
+
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", 1, 1)
+    cache.put("b", 2, 1)
+    cache.get("a")
+    cache.put("c", 3, 1)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_evicts_to_max_bytes():
+    cache = ResponseCache(max_bytes=10)
+    cache.put("a", 1, 6)
+    cache.put("b", 2, 6)
+    cache.put("too-big", 3, 11)
+
+    assert cache.stats()["entries"] == 1
+    assert cache.get("b") == 2
+
+
+def test_invalidate():
+    cache = ResponseCache()
+    cache.put(cache.make_key(QUERY, {"id": 1}), 1, 1)
+    cache.put(cache.make_key(QUERY, {"id": 2}), 2, 1)
+
+    cache.invalidate(QUERY, {"id": 1})
+    assert cache.stats()["entries"] == 1
+
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_drops_decoded_responses():
+    decoder = SimpleNamespace(name="typed")
+    cache = ResponseCache()
+    key = GraphQLClient._request_key(QUERY, {"id": 1}, decoder)  # pyright: ignore[reportArgumentType]
+    cache.put(key, 1, 1)
+    cache.put(cache.make_key(QUERY, {"id": 1}), 1, 1)
+
+    cache.invalidate(QUERY, {"id": 1})
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_mutations_are_not_cacheable():
+    assert is_cacheable(QUERY)
+    assert not is_cacheable("mutation Test { test { id } }")
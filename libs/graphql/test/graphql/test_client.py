@@ -1,7 +1,20 @@
+import gzip
+import io
 import json
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPMessage
+from typing import Optional
 import pytest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+from urllib import error
+from graphql.cache import ResponseCache
 from graphql.client import GraphQLClient
+from graphql.document import compile_document
+from graphql.instrumentation import MetricsCollector
+from graphql.ratelimit import RetryPolicy
 
 ENDPOINT = "https://test.endpoint/graphql"
 
@@ -11,8 +24,34 @@ def client():
     yield GraphQLClient(ENDPOINT)
 
 
-@patch("urllib.request.urlopen")
-def test_execute_no_token(urlopen, client: GraphQLClient):
+@pytest.fixture
+def connection():
+    with patch("http.client.HTTPSConnection") as connection_cls:
+        yield connection_cls.return_value
+
+
+def create_response(body: bytes, status=200, headers: Optional[dict] = None):
+    response = MagicMock()
+    response.status = status
+    response.reason = "OK" if status < 400 else "Error"
+    response.will_close = False
+    response.isclosed.return_value = True
+    response.headers = HTTPMessage()
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+    response.read = io.BytesIO(body).read
+    return response
+
+
+def set_response(
+    connection: MagicMock, body: bytes, status=200, encoding: Optional[str] = None
+):
+    headers = {"Content-Encoding": encoding} if encoding else {}
+    # Every request gets a fresh stream of the same body
+    connection.getresponse.side_effect = lambda: create_response(body, status, headers)
+
+
+def test_execute_no_token(connection, client: GraphQLClient):
     query = """
 query TestQuery($test: String) {
     test(test: $test) {
@@ -24,10 +63,269 @@ query TestQuery($test: String) {
     response = json.dumps({"data": {"test": "foo"}}).encode("utf-8")
     request_body = json.dumps({"query": query, "variables": vars}).encode("utf-8")
 
-    urlopen.return_value.__enter__.return_value.read.return_value = response
+    set_response(connection, response)
+
+    assert client.execute(query, vars) == {"test": "foo"}
+    (method, path, body, headers), _ = connection.request.call_args
+    assert method == "POST"
+    assert path == "/graphql"
+    assert body == request_body
+    assert "Authorization" not in headers
+
+
+def test_execute_with_token(connection, client: GraphQLClient):
+    set_response(connection, b'{"data": {}}')
+    client.set_token("abc")
+
+    client.execute("query { test }")
+
+    (_, _, _, headers), _ = connection.request.call_args
+    assert headers["Authorization"] == "Bearer abc"
+
+
+def test_execute_http_error(connection, client: GraphQLClient):
+    set_response(connection, b"rate limited", status=429)
+
+    with pytest.raises(error.HTTPError) as exc:
+        client.execute("query { test }")
+
+    assert exc.value.code == 429
+
+
+def test_execute_reuses_connection(connection, client: GraphQLClient):
+    set_response(connection, b'{"data": {}}')
+
+    client.execute("query { test }")
+    client.execute("query { test }")
+
+    assert connection.connect.call_count == 1
+    assert connection.request.call_count == 2
+
+
+def test_execute_batch(connection, client: GraphQLClient):
+    set_response(
+        connection, b'{"data": {"b0_test": "foo", "b1_test": "bar", "b1_other": 1}}'
+    )
+
+    result = client.execute_batch(
+        [
+            ("query A($a: String) { test(a: $a) }", {"a": "x"}),
+            ("query B($a: String) { test(a: $a) other }", {"a": "y"}),
+        ]
+    )
+
+    assert result == [{"test": "foo"}, {"test": "bar", "other": 1}]
+    assert connection.request.call_count == 1
+    (_, _, body, _), _ = connection.request.call_args
+    assert json.loads(body)["variables"] == {"b0_a": "x", "b1_a": "y"}
+
+
+def test_execute_cached(connection):
+    client = GraphQLClient(ENDPOINT, cache=ResponseCache())
+    set_response(connection, b'{"data": {"test": "foo"}}')
+
+    assert client.execute("query { test }", {"a": 1}) == {"test": "foo"}
+    assert client.execute("query { test }", {"a": 1}) == {"test": "foo"}
+
+    assert connection.request.call_count == 1
+    assert client.cache and client.cache.hits == 1
+
+
+def test_execute_does_not_cache_errors(connection):
+    client = GraphQLClient(ENDPOINT, cache=ResponseCache())
+    set_response(connection, b'{"errors": [{"message": "failed"}]}')
+
+    client.execute("query { test }")
+    client.execute("query { test }")
+
+    assert connection.request.call_count == 2
+
+
+def test_execute_sends_accept_encoding(connection, client: GraphQLClient):
+    set_response(connection, b'{"data": {}}')
+
+    client.execute("query { test }")
+
+    (_, _, _, headers), _ = connection.request.call_args
+    assert "gzip" in headers["Accept-Encoding"]
+
+
+@pytest.mark.parametrize(
+    "encoding, compress",
+    [
+        pytest.param("gzip", gzip.compress, id="gzip"),
+        pytest.param("deflate", zlib.compress, id="deflate"),
+        pytest.param(
+            "deflate",
+            lambda data: zlib.compress(data, wbits=-zlib.MAX_WBITS),
+            id="raw-deflate",
+        ),
+    ],
+)
+def test_execute_compressed_response(
+    encoding, compress, connection, client: GraphQLClient
+):
+    body = json.dumps({"data": {"test": ["foo"] * 50000}}).encode("utf-8")
+    set_response(connection, compress(body), encoding=encoding)
+
+    assert client.execute("query { test }") == {"test": ["foo"] * 50000}
+
+
+def test_execute_retries_rate_limited(connection, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("time.sleep", sleeps.append)
+    client = GraphQLClient(ENDPOINT, retry=RetryPolicy())
+    connection.getresponse.side_effect = [
+        create_response(b"{}", 429, {"Retry-After": "2"}),
+        create_response(b'{"data": {"test": 1}}'),
+    ]
+
+    assert client.execute("query { test }") == {"test": 1}
+    assert sleeps == [2.0]
+
+
+def test_execute_gives_up_after_max_attempts(connection, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    client = GraphQLClient(ENDPOINT, retry=RetryPolicy(max_attempts=2))
+    set_response(connection, b"{}", status=503)
+
+    with pytest.raises(error.HTTPError):
+        client.execute("query { test }")
+
+    assert connection.request.call_count == 2
+
+
+def test_execute_notifies_observers(connection):
+    collector = MetricsCollector()
+    client = GraphQLClient(ENDPOINT, cache=ResponseCache(), observers=[collector])
+    body = b'{"data": {"test": "foo"}}'
+    set_response(connection, body)
+
+    client.execute("query Test($a: Int) { test }", {"a": 1})
+    client.execute("query Test($a: Int) { test }", {"a": 1})
+
+    sent, cached = collector.samples
+    assert sent.operation == "Test"
+    assert sent.variable_sizes == {"a": 1}
+    assert sent.status == 200
+    assert sent.response_bytes == len(body)
+    assert sent.total_time >= sent.decode_time
+    assert not sent.cached
+    assert cached.cached
+
+
+def test_execute_observer_records_failures(connection, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    collector = MetricsCollector()
+    client = GraphQLClient(
+        ENDPOINT, retry=RetryPolicy(max_attempts=3), observers=[collector]
+    )
+    set_response(connection, b"{}", status=503)
+
+    with pytest.raises(error.HTTPError):
+        client.execute("query { test }")
+
+    (metrics,) = collector.samples
+    assert metrics.status == 503
+    assert metrics.retries == 2
+    assert metrics.error
+
+
+def test_execute_ignores_failing_observer(connection, client: GraphQLClient):
+    observer = MagicMock()
+    observer.on_request.side_effect = RuntimeError("broken")
+    client.add_observer(observer)
+    set_response(connection, b'{"data": {"test": 1}}')
+
+    assert client.execute("query { test }") == {"test": 1}
+    assert observer.on_request.call_count == 1
+
+
+def test_execute_document(connection, client: GraphQLClient):
+    document = compile_document("query Test { test }")
+    set_response(connection, b'{"data": {"test": 1}}')
+
+    assert client.execute(document) == {"test": 1}
+
+    (_, _, body, _), _ = connection.request.call_args
+    assert json.loads(body) == {"query": "query Test{test}", "variables": None}
+
+
+def test_execute_persisted_query(connection):
+    client = GraphQLClient(ENDPOINT, persisted_queries=True)
+    document = compile_document("query Test { test }")
+    connection.getresponse.side_effect = [
+        create_response(
+            b'{"errors": [{"message": "PersistedQueryNotFound",'
+            b' "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"}}]}'
+        ),
+        create_response(b'{"data": {"test": 1}}'),
+        create_response(b'{"data": {"test": 2}}'),
+    ]
+
+    assert client.execute(document) == {"test": 1}
+    assert client.execute(document) == {"test": 2}
+
+    bodies = [json.loads(call.args[2]) for call in connection.request.call_args_list]
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": document.sha256}}
+    assert bodies == [
+        {"variables": None, "extensions": extensions},
+        {"query": document.text, "variables": None, "extensions": extensions},
+        {"variables": None, "extensions": extensions},
+    ]
+
+
+def test_execute_persisted_query_not_supported(connection):
+    client = GraphQLClient(ENDPOINT, persisted_queries=True)
+    connection.getresponse.side_effect = [
+        create_response(b'{"errors": [{"message": "PersistedQueryNotSupported"}]}'),
+        create_response(b'{"data": {"test": 1}}'),
+    ]
+
+    assert client.execute("query { test }") == {"test": 1}
+
+    assert not client.persisted_queries
+    (_, _, body, _), _ = connection.request.call_args
+    assert json.loads(body) == {"query": "query { test }", "variables": None}
+
+
+def test_execute_coalesces_identical_requests(connection):
+    collector = MetricsCollector()
+    client = GraphQLClient(ENDPOINT, observers=[collector])
+    release = threading.Event()
+
+    def getresponse():
+        release.wait()
+        return create_response(b'{"data": {"test": 1}}')
+
+    connection.getresponse.side_effect = getresponse
+
+    with ThreadPoolExecutor(3) as executor:
+        futures = [
+            executor.submit(client.execute, "query { test }", {"a": 1})
+            for _ in range(3)
+        ]
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == [{"test": 1}] * 3
+    assert connection.request.call_count == 1
+    assert sorted(s.coalesced for s in collector.samples) == [False, True, True]
+
+
+def test_execute_with_decoder(connection):
+    class Decoder:
+        name = "upper"
+
+        def decode(self, payload):
+            return {"data": payload.decode().upper()}
+
+    client = GraphQLClient(ENDPOINT, cache=ResponseCache())
+    set_response(connection, b'{"data": "foo"}')
 
-    client.execute(query, vars)
-    (request,), _ = urlopen.call_args
-    assert request.full_url == ENDPOINT
-    assert request.data == request_body
-    assert "Authorization" not in request.headers
+    assert client.execute("query { test }", decoder=Decoder()) == '{"DATA": "FOO"}'
+    # Results decoded differently are cached separately
+    assert client.execute("query { test }") == "foo"
+    assert client.execute("query { test }", decoder=Decoder()) == '{"DATA": "FOO"}'
+    assert connection.request.call_count == 2
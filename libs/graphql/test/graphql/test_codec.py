@@ -0,0 +1,41 @@
+import gzip
+import io
+import pytest
+from graphql import codec
+
+
+def test_read_body_identity():
+    body, received = codec.read_body(io.BytesIO(b'{"a": 1}'), None)
+
+    assert body == b'{"a": 1}'
+    assert received == 8
+
+
+def test_read_body_gzip_reports_wire_size():
+    data = b'{"a": "' + b"x" * 100000 + b'"}'
+    compressed = gzip.compress(data)
+
+    body, received = codec.read_body(io.BytesIO(compressed), "gzip")
+
+    assert body == data
+    assert received == len(compressed)
+
+
+def test_read_body_unsupported_encoding():
+    with pytest.raises(ValueError):
+        codec.read_body(io.BytesIO(b""), "compress")
+
+
+def test_read_body_brotli():
+    brotli = pytest.importorskip("brotli")
+    data = b'{"a": 1}'
+
+    body, _ = codec.read_body(io.BytesIO(brotli.compress(data)), "br")
+
+    assert body == data
+
+
+def test_loads_without_orjson(monkeypatch):
+    monkeypatch.setattr(codec, "orjson", None)
+
+    assert codec.loads(bytearray(b'{"a": "\\u00e9"}')) == {"a": "é"}
@@ -0,0 +1,52 @@
+import hashlib
+import pytest
+from graphql.document import Document, as_document, compile_document
+
+FRAGMENTS = """
+fragment A on a { id ...C }
+fragment B on b { id }
+fragment C on c { name }
+"""
+
+
+def test_compile_document_keeps_used_fragments():
+    document = compile_document(
+        """
+query Test($id: Int!) {
+  a(id: $id) {
+    ...A
+    ... on a { extra }
+  }
+}
+""",
+        FRAGMENTS,
+    )
+
+    assert document.text == (
+        "query Test($id:Int!){a(id:$id){...A...on a{extra}}}"
+        "fragment A on a{id...C}fragment C on c{name}"
+    )
+    assert document.operation_name == "Test"
+    assert document.sha256 == hashlib.sha256(document.text.encode()).hexdigest()
+    assert str(document) == document.text
+
+
+def test_compile_document_unknown_fragment():
+    with pytest.raises(ValueError):
+        compile_document("query { a { ...Missing } }", FRAGMENTS)
+
+
+def test_compile_document_requires_one_operation():
+    with pytest.raises(ValueError):
+        compile_document("query A { a } query B { b }")
+
+
+def test_as_document():
+    document = compile_document("query { a }")
+
+    assert as_document(document) is document
+    assert as_document("query Plain { a }") == Document(
+        "query Plain { a }",
+        hashlib.sha256(b"query Plain { a }").hexdigest(),
+        "Plain",
+    )
@@ -0,0 +1,43 @@
+import pytest
+from graphql.instrumentation import MetricsCollector, RequestMetrics, percentile
+
+
+@pytest.mark.parametrize(
+    "pct, expected",
+    [
+        pytest.param(50, 5, id="p50"),
+        pytest.param(90, 9, id="p90"),
+        pytest.param(99, 10, id="p99"),
+        pytest.param(0, 1, id="p0"),
+    ],
+)
+def test_percentile(pct, expected):
+    assert percentile(list(range(1, 11)), pct) == expected
+
+
+def test_percentile_empty():
+    assert percentile([], 50) == 0.0
+
+
+def test_summary_groups_by_operation():
+    collector = MetricsCollector()
+    for total in (0.1, 0.2, 0.3):
+        collector.on_request(RequestMetrics("Search", total_time=total, retries=1))
+    collector.on_request(RequestMetrics("Search", cached=True))
+    collector.on_request(RequestMetrics(None, total_time=1.0))
+
+    summary = collector.summary((50,))
+
+    assert summary["Search"]["count"] == {"total": 3}
+    assert summary["Search"]["retries"] == {"total": 3}
+    assert summary["Search"]["total_time"] == {"p50": 0.2}
+    assert summary["anonymous"]["total_time"] == {"p50": 1.0}
+    assert "Search: 3 requests, 3 retries" in collector.format_summary()
+
+
+def test_collector_keeps_latest_samples():
+    collector = MetricsCollector(max_samples=2)
+    for name in ("a", "b", "c"):
+        collector.on_request(RequestMetrics(name))
+
+    assert [s.operation for s in collector.samples] == ["b", "c"]
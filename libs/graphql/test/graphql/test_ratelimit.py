@@ -0,0 +1,94 @@
+import pytest
+from graphql import ratelimit
+from graphql.ratelimit import RateLimiter, RetryPolicy, parse_retry_after
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    state = {"now": 1000.0, "slept": []}
+
+    def sleep(seconds):
+        state["slept"].append(seconds)
+        state["now"] += seconds
+
+    monkeypatch.setattr(ratelimit.time, "time", lambda: state["now"])
+    monkeypatch.setattr(ratelimit.time, "sleep", sleep)
+    return state
+
+
+def test_burst_then_paced(clock):
+    limiter = RateLimiter(rate=2, burst=2)
+
+    waits = [limiter.acquire() for _ in range(4)]
+
+    assert waits == [0, 0, 0.5, 0.5]
+
+
+def test_queued_callers_are_spaced_out(clock):
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.acquire()
+
+    # Reservations made at the same instant each wait one interval longer
+    assert [limiter.reserve(None) for _ in range(3)] == [1.0, 2.0, 3.0]
+
+
+def test_refills_over_time(clock):
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.acquire()
+    clock["now"] += 5
+
+    assert limiter.acquire() == 0
+
+
+def test_acquire_timeout(clock):
+    limiter = RateLimiter(rate=0.1, burst=1)
+    limiter.acquire()
+
+    with pytest.raises(TimeoutError):
+        limiter.acquire(timeout=1)
+    # A timed out caller doesn't consume a token
+    clock["now"] += 10
+    assert limiter.acquire() == 0
+
+
+def test_defer(clock):
+    limiter = RateLimiter(rate=10, burst=10)
+    limiter.defer(30)
+
+    assert limiter.acquire() == 30
+
+
+def test_state_file_is_shared(clock, tmp_path):
+    state_file = str(tmp_path / "ratelimit")
+    first = RateLimiter(rate=1, burst=1, state_file=state_file)
+    second = RateLimiter(rate=1, burst=1, state_file=state_file)
+
+    assert first.acquire() == 0
+    assert second.acquire() == 1.0
+    first.defer(10)
+    assert second.acquire() == 10
+    first.close()
+    second.close()
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        pytest.param(None, None, id="missing"),
+        pytest.param("5", 5.0, id="seconds"),
+        pytest.param("garbage", None, id="invalid"),
+        pytest.param("Wed, 21 Oct 2015 07:28:00 GMT", 0.0, id="past-date"),
+    ],
+)
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_attempts=3, base_delay=1, max_delay=4)
+
+    assert policy.should_retry(429, 0)
+    assert not policy.should_retry(400, 0)
+    assert not policy.should_retry(503, 2)
+    assert policy.delay(0, retry_after=7) == 7
+    assert all(0 <= policy.delay(10) <= 4 for _ in range(20))
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from graphql.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait()
+        return "result"
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(flight.do, "key", fn) for _ in range(4)]
+        # Give every caller time to join the call in flight
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+
+
+def test_single_flight_shares_errors():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait()
+        raise ValueError("failed")
+
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(flight.do, "key", fn) for _ in range(2)]
+        time.sleep(0.1)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+
+    # Nothing is left behind, so the next call runs again
+    assert flight.do("key", lambda: 1) == (1, False)
+
+
+def test_async_single_flight_shares_result():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", fn) for _ in range(3)))
+
+    assert asyncio.run(run()) == [("result", False), ("result", True), ("result", True)]
+    assert len(calls) == 1
+
+
+def test_async_single_flight_cancellation():
+    flight = AsyncSingleFlight()
+    cancelled = []
+
+    async def fn():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "result"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("key", fn))
+        second = asyncio.ensure_future(flight.do("key", fn))
+        await asyncio.sleep(0)
+        # One waiter giving up leaves the call running for the other
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not cancelled
+        second.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return first.cancelled() and second.cancelled()
+
+    assert asyncio.run(run())
+    assert cancelled == [1]
@@ -1,4 +1,5 @@
 from queue import Empty, Queue
+import atexit
 
 from calibre.ebooks.metadata.sources.base import Option, Source
 
@@ -48,6 +49,15 @@ class Hardcover(Source):
                 "The lower the number, the less relevant the matches. > 1.0 will return 0 matches"
             ),
         ),
+        Option(
+            name="good_enough_score",
+            type_="number",
+            default=0.0,
+            label=_("Good Enough Score"),
+            desc=_(
+                "Stop comparing a book's editions once enough of them score at least this much. 0 compares every edition"
+            ),
+        ),
         Option(
             name="languages",
             type_="string",
@@ -55,6 +65,46 @@ class Hardcover(Source):
             label=_("Language"),
             desc=_("Languages to filter books by (comma-separated)"),
         ),
+        Option(
+            name="local_mirror",
+            type_="bool",
+            default=False,
+            label=_("Local Mirror"),
+            desc=_(
+                "Keep a local copy of the books found on Hardcover and answer from it first, refreshing it in the background"
+            ),
+        ),
+        Option(
+            name="prefetch_covers",
+            type_="bool",
+            default=True,
+            label=_("Prefetch Covers"),
+            desc=_("Start downloading a book's cover as soon as it is found"),
+        ),
+        Option(
+            name="warm_caches",
+            type_="bool",
+            default=False,
+            label=_("Warm Caches"),
+            desc=_(
+                "Preload the cover URLs of library books that already have Hardcover identifiers in the background, so downloading their covers needs no search"
+            ),
+        ),
+        Option(
+            name="lookup_mode",
+            type_="choices",
+            default="batched",
+            label=_("Identifier Lookups"),
+            desc=_(
+                "How to look up books by identifier - batched sends every lookup in a single request"
+            ),
+            choices={
+                "batched": _("Batched (single request)"),
+                "sequential": _("Sequential (one request per identifier)"),
+                "async": _("Concurrent (all requests at once)"),
+                "race": _("Race (all lookups and the title search at once)"),
+            },
+        ),
     )
 
     def __init__(self, *args, **kwargs):
@@ -65,7 +115,12 @@ class Hardcover(Source):
             from .provider import HardcoverProvider
 
             self.provider = HardcoverProvider(self)
+            atexit.register(self.provider.close)
             self.cli_helper = MetadataCliHelper(self, self.name, self.ID_NAME)
+            if self.prefs["warm_caches"] and self.is_configured():
+                from calibre.utils.logging import default_log
+
+                self.provider.warm_up(default_log)
 
     def is_configured(self) -> bool:  # pyright: ignore[reportIncompatibleMethodOverride]
         return bool(self.prefs["api_key"])
@@ -73,16 +128,12 @@ class Hardcover(Source):
     def cli_main(self, args):
         self.cli_helper.run(args)
 
+    @property
+    def request_metrics(self):
+        return self.provider.metrics
+
     def get_cached_cover_url(self, identifiers):
-        url = None
-        hardcover_id = identifiers.get(self.ID_NAME, None)
-        if hardcover_id is None:
-            isbn = identifiers.get("isbn", None)
-            if isbn is not None:
-                hardcover_id = self.cached_isbn_to_identifier(isbn)
-        if hardcover_id is not None:
-            url = self.cached_identifier_to_cover_url(hardcover_id)
-        return url
+        return self.provider.get_cached_cover_url(identifiers)
 
     def get_book_url(self, identifiers):  # pyright: ignore[reportIncompatibleMethodOverride]
         return self.provider.get_book_url(identifiers)
@@ -101,6 +152,20 @@ class Hardcover(Source):
             log, result_queue, abort, title, authors, identifiers, timeout
         )
 
+    async def identify_async(
+        self,
+        log,
+        result_queue,
+        abort,
+        title=None,
+        authors=None,
+        identifiers={},
+        timeout=30,
+    ):
+        await self.provider.identify_async(
+            log, result_queue, abort, title, authors, identifiers, timeout
+        )
+
     def download_cover(
         self,
         log,
@@ -143,9 +208,10 @@ class Hardcover(Source):
         if abort.is_set():
             return
 
-        log("Downloading cover from: ", cached_url)
         try:
-            cdata = self.browser.open_novisit(cached_url, timeout=timeout).read()
+            cdata = self.provider.download_cover(
+                log, cached_url, timeout, get_best_cover
+            )
             result_queue.put((self, cdata))
         except Exception:
             log.exception("Failed to download cover from: ", cached_url)
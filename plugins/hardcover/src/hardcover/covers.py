@@ -0,0 +1,364 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Sequence
+from urllib import error
+from urllib.parse import urljoin
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+
+from graphql.pool import ConnectionPool, split_url
+from graphql.singleflight import SingleFlight
+
+from .storage import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# Cover files kept on disk, least recently used evicted first
+MAX_CACHE_SIZE = 200 * 1024 * 1024
+# How long a cached cover is used before asking the server if it changed
+FRESH_FOR = 24 * 60 * 60
+# Enough of an image to find its dimensions in, for all but JPEGs with
+# very large EXIF blocks ahead of the frame header
+PROBE_BYTES = 64 * 1024
+MAX_REDIRECTS = 3
+# Books whose candidate cover URLs are kept for get_best_cover
+MAX_CANDIDATES = 1024
+# A cover read again within this long keeps its last access time, rather
+# than writing to the cache on every hit
+ACCESS_RESOLUTION = 60 * 60
+# Least recently used covers looked at per query while evicting
+EVICT_BATCH = 32
+
+
+def image_size(data: bytes) -> Optional[tuple[int, int]]:
+    # (width, height) from the start of a PNG, GIF, JPEG or WebP image
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return _webp_size(data)
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_size(data)
+    return None
+
+
+def _webp_size(data: bytes) -> Optional[tuple[int, int]]:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def _jpeg_size(data: bytes) -> Optional[tuple[int, int]]:
+    # Walks the segments up to the first start of frame marker
+    position = 2
+    while position + 9 < len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[position + 5 : position + 9])
+            return width, height
+        (length,) = struct.unpack(">H", data[position + 2 : position + 4])
+        position += 2 + length
+    return None
+
+
+class CoverCache(SQLiteStore):
+    # Cover images on disk, stored under the hash of their content (so
+    # editions sharing an image share the file) and indexed by URL with the
+    # validators the server sent, so stale entries can be revalidated
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS covers (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    validated REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS covers_digest ON covers (digest);
+CREATE INDEX IF NOT EXISTS covers_accessed ON covers (accessed);
+"""
+
+    def __init__(
+        self,
+        path: str,
+        directory: str,
+        max_size: int = MAX_CACHE_SIZE,
+        timeout: float = 30.0,
+    ):
+        super().__init__(path, timeout)
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def _file(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def entry(self, url: str) -> Optional[dict]:
+        rows = self.query("SELECT * FROM covers WHERE url = ?", (url,))
+        return dict(rows[0]) if rows else None
+
+    def read(self, entry: dict) -> Optional[bytes]:
+        try:
+            with open(self._file(entry["digest"]), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        now = time.time()
+        if now - entry["accessed"] > ACCESS_RESOLUTION:
+            with self.transaction() as db:
+                db.execute(
+                    "UPDATE covers SET accessed = ? WHERE url = ?", (now, entry["url"])
+                )
+        return data
+
+    def revalidated(self, url: str):
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE covers SET validated = ? WHERE url = ?", (time.time(), url)
+            )
+
+    def put(
+        self,
+        url: str,
+        data: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._file(digest)
+        if not os.path.exists(path):
+            # Written aside and moved into place, so readers in other
+            # processes never see half a file
+            fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        now = time.time()
+        with self.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO covers"
+                " (url, digest, size, etag, last_modified, validated, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, len(data), etag, last_modified, now, now),
+            )
+        if self.total_size() > self.max_size:
+            self.evict()
+
+    def total_size(self) -> int:
+        rows = self.query(
+            "SELECT coalesce(sum(size), 0) AS total"
+            " FROM (SELECT DISTINCT digest, size FROM covers)"
+        )
+        return rows[0]["total"]
+
+    def evict(self):
+        # Drops the least recently used URLs until the files left fit
+        removed = []
+        with self.transaction() as db:
+            total = self.total_size()
+            while total > self.max_size:
+                rows = db.execute(
+                    "SELECT url, digest, size FROM covers ORDER BY accessed LIMIT ?",
+                    (EVICT_BATCH,),
+                ).fetchall()
+                if not rows:
+                    break
+                for row in rows:
+                    if total <= self.max_size:
+                        break
+                    db.execute("DELETE FROM covers WHERE url = ?", (row["url"],))
+                    shared = db.execute(
+                        "SELECT 1 FROM covers WHERE digest = ? LIMIT 1",
+                        (row["digest"],),
+                    ).fetchone()
+                    if shared is None:
+                        total -= row["size"]
+                        removed.append(row["digest"])
+        for digest in removed:
+            try:
+                os.unlink(self._file(digest))
+            except OSError:
+                pass
+
+
+class Covers:
+    # Downloads covers through the on-disk cache. build_metadata starts a
+    # download as soon as it sees an edition's image, so by the time calibre
+    # asks for the cover it's usually already there.
+    def __init__(
+        self,
+        useragent: str,
+        cache: Optional[CoverCache] = None,
+        pool: Optional[ConnectionPool] = None,
+        workers: int = 4,
+        fresh_for: float = FRESH_FOR,
+    ):
+        self.useragent = useragent
+        self.cache = cache
+        self.pool = pool or ConnectionPool(maxsize=workers)
+        self.fresh_for = fresh_for
+        self._executor = ThreadPoolExecutor(workers, "hardcover-covers")
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._candidates: OrderedDict[str, tuple[str, ...]] = OrderedDict()
+
+    def remember_candidates(self, url: str, candidates: Sequence[str]):
+        # Other edition images of the book whose cover is at `url`
+        with self._lock:
+            self._candidates[url] = tuple(candidates)
+            self._candidates.move_to_end(url)
+            while len(self._candidates) > MAX_CANDIDATES:
+                self._candidates.popitem(last=False)
+
+    def candidates(self, url: str) -> list[str]:
+        with self._lock:
+            others = self._candidates.get(url, ())
+        return [url, *(other for other in others if other != url)]
+
+    def prefetch(self, url: str, timeout: float = 30) -> Future:
+        future = self._executor.submit(self.fetch, url, timeout)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.debug("Cover prefetch failed: %s", future.exception())
+
+    def fetch(self, url: str, timeout: float = 30) -> bytes:
+        # A prefetch already downloading the cover is waited for, not repeated
+        data, _ = self._flights.do(url, lambda: self._fetch(url, timeout))
+        return data
+
+    def _cached(self, url: str) -> tuple[Optional[dict], Optional[bytes]]:
+        if self.cache is None:
+            return None, None
+        entry = self.cache.entry(url)
+        if entry is None:
+            return None, None
+        return entry, self.cache.read(entry)
+
+    def _fetch(self, url: str, timeout: float) -> bytes:
+        entry, cached = self._cached(url)
+        if cached is not None and time.time() - entry["validated"] < self.fresh_for:  # pyright: ignore[reportOptionalSubscript]
+            return cached
+        headers = {"User-Agent": self.useragent}
+        if cached is not None:
+            if entry["etag"]:  # pyright: ignore[reportOptionalSubscript]
+                headers["If-None-Match"] = entry["etag"]  # pyright: ignore[reportOptionalSubscript]
+            if entry["last_modified"]:  # pyright: ignore[reportOptionalSubscript]
+                headers["If-Modified-Since"] = entry["last_modified"]  # pyright: ignore[reportOptionalSubscript]
+        try:
+            status, res_headers, data = self._get(url, headers, timeout)
+        except (OSError, error.HTTPError):
+            if cached is None:
+                raise
+            # Better an old cover than none
+            logger.debug("Using the cached cover for %s", url, exc_info=True)
+            return cached
+        if status == 304 and cached is not None:
+            self.cache.revalidated(url)  # pyright: ignore[reportOptionalMemberAccess]
+            return cached
+        if self.cache is not None:
+            try:
+                self.cache.put(
+                    url,
+                    data,
+                    res_headers.get("ETag"),
+                    res_headers.get("Last-Modified"),
+                )
+            except (OSError, sqlite3.Error):
+                logger.debug("Unable to cache the cover for %s", url, exc_info=True)
+        return data
+
+    def _get(
+        self,
+        url: str,
+        headers: dict[str, str],
+        timeout: float,
+        limit: Optional[int] = None,
+    ):
+        # (status, headers, body) for `url`, following redirects. With a
+        # limit, only that many bytes of the body are read.
+        for _ in range(MAX_REDIRECTS + 1):
+            try:
+                split_url(url)
+            except ValueError as e:
+                # Not an http(s) URL, so it fails like any unreachable one
+                raise error.URLError(f"{url}: {e}") from e
+            with self.pool.request("GET", url, headers=headers, timeout=timeout) as res:
+                status, reason, res_headers = res.status, res.reason, res.headers
+                location = res_headers.get("Location")
+                data = res.read(limit) if limit else res.read()
+            if status in (301, 302, 303, 307, 308) and location:
+                # Locations may be relative to the URL redirected from
+                url = urljoin(url, location)
+                continue
+            if status >= 400:
+                raise error.HTTPError(
+                    url, status, reason, res_headers, io.BytesIO(data)
+                )
+            return status, res_headers, data
+        raise error.HTTPError(url, 310, "Too many redirects", None, None)  # pyright: ignore[reportArgumentType]
+
+    def probe(self, url: str, timeout: float = 30) -> Optional[tuple[int, int]]:
+        # The image's dimensions, from the cache or the first few KB of it
+        _, cached = self._cached(url)
+        if cached is not None:
+            return image_size(cached)
+        headers = {
+            "User-Agent": self.useragent,
+            "Range": f"bytes=0-{PROBE_BYTES - 1}",
+        }
+        try:
+            _, _, data = self._get(url, headers, timeout, PROBE_BYTES)
+        except (OSError, error.HTTPError) as e:
+            logger.debug("Unable to probe the cover at %s: %s", url, e)
+            return None
+        return image_size(data)
+
+    def best(self, urls: Sequence[str], timeout: float = 30) -> Optional[str]:
+        # The largest of the images, probed in parallel. The first URL wins
+        # ties and when no sizes could be read.
+        if len(urls) < 2:
+            return urls[0] if urls else None
+        sizes = list(self._executor.map(lambda url: self.probe(url, timeout), urls))
+        best = max(
+            range(len(urls)),
+            key=lambda index: (
+                sizes[index][0] * sizes[index][1] if sizes[index] else -1,  # pyright: ignore[reportOptionalSubscript]
+                -index,
+            ),
+        )
+        return urls[best]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
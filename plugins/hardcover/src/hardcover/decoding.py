@@ -0,0 +1,197 @@
+from datetime import date, datetime
+from typing import Any, Optional, Union
+import logging
+
+from graphql.codec import loads
+
+from .models import Author, Book, Edition, Series, Tags, intern, make_author
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+logger = logging.getLogger(__name__)
+
+# Decodes responses for the book and edition queries straight from bytes into
+# typed structs, skipping the dict tree that json.loads builds. Needs msgspec
+# (bundled with calibre), otherwise the plain dict path in models is used.
+if msgspec is not None:
+
+    class _Person(msgspec.Struct):
+        name: Optional[str] = None
+
+    class _Contributor(msgspec.Struct):
+        author: Optional[_Person] = None
+        contribution: Optional[str] = None
+
+    class _Image(msgspec.Struct):
+        url: Optional[str] = None
+
+    class _Language(msgspec.Struct):
+        code3: Optional[str] = None
+
+    class _Publisher(msgspec.Struct):
+        name: Optional[str] = None
+
+    class _SeriesName(msgspec.Struct):
+        name: Optional[str] = None
+
+    class _FeaturedSeries(msgspec.Struct):
+        series: Optional[_SeriesName] = None
+        position: Optional[float] = None
+
+    class _Tag(msgspec.Struct):
+        tag: str
+
+    class _BookData(msgspec.Struct):
+        id: int
+        title: str
+        slug: str
+        rating: Optional[float] = None
+        description: Optional[str] = None
+        series: Optional[_FeaturedSeries] = None
+        tags: Optional[dict[str, list[_Tag]]] = None
+        canonical_id: Optional[int] = None
+        editions: list["_EditionData"] = []
+
+    class _EditionData(msgspec.Struct):
+        id: int
+        title: str
+        isbn_13: Optional[str] = None
+        isbn_10: Optional[str] = None
+        asin: Optional[str] = None
+        contributors: Optional[list[_Contributor]] = None
+        image: Optional[_Image] = None
+        language: Optional[_Language] = None
+        publisher: Optional[_Publisher] = None
+        users_count: int = 0
+        release_date: Optional[date] = None
+        book: Optional[_BookData] = None
+
+    class _Response(msgspec.Struct):
+        data: Union[dict[str, msgspec.Raw], None, msgspec.UnsetType] = msgspec.UNSET
+        errors: Union[list[Any], msgspec.UnsetType] = msgspec.UNSET
+
+
+def _map_authors(contributors) -> list[Author]:
+    return [
+        make_author(
+            entry.author.name if entry.author else None,  # pyright: ignore[reportArgumentType]
+            entry.contribution or "Author",
+        )
+        for entry in contributors or []
+    ]
+
+
+def _map_series(series) -> Optional[Series]:
+    if series is None or series.series is None:
+        return None
+    return Series(name=intern(series.series.name), position=series.position)  # pyright: ignore[reportArgumentType]
+
+
+def _map_tags(tags) -> Optional[Tags]:
+    if not tags:
+        return None
+    return Tags(
+        genre=(tag.tag for tag in tags.get("Genre", [])),
+        mood=(tag.tag for tag in tags.get("Mood", [])),
+        content_warning=(tag.tag for tag in tags.get("Content Warning", [])),
+        tag=(tag.tag for tag in tags.get("Tag", [])),
+    )
+
+
+def _edition_source(edition) -> tuple:
+    # Only the raw detail fields, so the rest of the struct can be freed
+    return (
+        edition.isbn_13,
+        edition.asin,
+        edition.image.url if edition.image else None,
+        intern(edition.language.code3) if edition.language else None,
+        intern(edition.publisher.name) if edition.publisher else None,
+        edition.release_date,
+        edition.isbn_10,
+    )
+
+
+def _edition_details(source: tuple) -> tuple:
+    *fields, release_date, isbn_10 = source
+    if release_date:
+        release_date = datetime(release_date.year, release_date.month, release_date.day)
+    return (*fields, release_date or None, isbn_10)
+
+
+def _map_edition(edition) -> Edition:
+    return Edition.lazy(
+        id=edition.id,
+        title=edition.title,
+        authors=_map_authors(edition.contributors),
+        users_count=edition.users_count,
+        source=_edition_source(edition),
+        decode=_edition_details,
+    )
+
+
+def _map_book(book, editions: list[Edition]) -> Book:
+    return Book(
+        id=book.id,
+        title=book.title,
+        slug=book.slug,
+        series=_map_series(book.series),
+        rating=book.rating,
+        tags=_map_tags(book.tags),
+        description=book.description,
+        editions=editions,
+        canonical_id=book.canonical_id,
+    )
+
+
+def map_book_struct(book) -> Book:
+    return _map_book(book, [_map_edition(edition) for edition in book.editions])
+
+
+def map_edition_struct(edition) -> Book:
+    return _map_book(edition.book, [_map_edition(edition)])
+
+
+class TypedDecoder:
+    name = "hardcover-models"
+
+    def __init__(self):
+        if msgspec is None:
+            raise RuntimeError("TypedDecoder requires msgspec")
+        self._response = msgspec.json.Decoder(_Response)
+        self._books = msgspec.json.Decoder(Union[list[_BookData], _BookData, None])
+        self._editions = msgspec.json.Decoder(
+            Union[list[_EditionData], _EditionData, None]
+        )
+        self._any = msgspec.json.Decoder()
+
+    def _decoder_for(self, key: str):
+        # Batched queries prefix the root keys with an alias
+        if key.endswith("books"):
+            return self._books
+        if key.endswith("editions"):
+            return self._editions
+        return self._any
+
+    def decode(self, payload: bytes | bytearray) -> dict:
+        try:
+            response = self._response.decode(payload)
+            result: dict[str, Any] = {}
+            if response.data is not msgspec.UNSET:  # pyright: ignore[reportOptionalMemberAccess]
+                result["data"] = response.data and {
+                    key: self._decoder_for(key).decode(raw)
+                    for key, raw in response.data.items()
+                }
+            if response.errors is not msgspec.UNSET:  # pyright: ignore[reportOptionalMemberAccess]
+                result["errors"] = response.errors
+            return result
+        except msgspec.ValidationError as e:  # pyright: ignore[reportOptionalMemberAccess]
+            # Anything unexpected in the response goes the slow, lenient way
+            logger.debug("Falling back to untyped decoding: %s", e)
+            return loads(payload)
+
+
+def create_decoder() -> Optional[TypedDecoder]:
+    return TypedDecoder() if msgspec is not None else None
@@ -1,10 +1,42 @@
-from typing import Callable, List, Optional, TypeVar
-from pyjarowinkler import distance
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import partial
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TypeVar,
+)
+import asyncio
+import copy
+import heapq
+import sqlite3
+import threading
 
+from graphql.async_client import AsyncGraphQLClient
 from graphql.client import GraphQLClient
+from graphql.codec import ResponseDecoder
+from graphql.document import Document
 
 from . import queries
+from .decoding import map_book_struct, map_edition_struct
+from .matching import normalize_title
+from .mirror import Mirror
 from .models import Book, Edition, map_from_book_query, map_from_edition_query
+from .ranking import Candidate, RankingStats, at_least, scored, top_k, until_good_enough
+from .scoring import SimilarityScorer
+from .search import (
+    SearchCache,
+    SearchHit,
+    parse_search_hits,
+    prerank_hits,
+    windows,
+)
 
 from calibre.utils.logging import Log
 
@@ -12,6 +44,59 @@ T = TypeVar("T", Book, Edition)
 
 CONTRIBUTION_WEIGHTS = {"Author": 2.0}
 
+# Exact identifier lookups either run one round trip at a time, stopping at
+# the first hit, are all sent together as one aliased GraphQL request, or are
+# all in flight at once on an event loop (see identify_async). Racing also
+# starts the title search alongside the lookups, and drops whatever is still
+# running once the highest priority strategy has results.
+LOOKUP_SEQUENTIAL = "sequential"
+LOOKUP_BATCHED = "batched"
+LOOKUP_ASYNC = "async"
+LOOKUP_RACE = "race"
+
+
+# Editions fetched per book by the book queries, most read first
+EDITION_LIMIT = 25
+
+# Other editions' images kept with each match, for get_best_cover
+COVER_CANDIDATES = 5
+
+# Parsed identifiers of a request with none
+NO_IDENTIFIERS: tuple[Any, ...] = (None, "", "", None, None)
+
+# identify_many puts at most this many identifiers in one `_in` query, and
+# at most this many of those queries in one request
+BULK_CHUNK_SIZE = 100
+BULK_QUERIES_PER_REQUEST = 5
+
+
+class IdentifyRequest(NamedTuple):
+    title: Optional[str]
+    authors: Optional[list[str]]
+    identifiers: dict[str, str]
+
+
+@dataclass
+class BulkResults:
+    # Books found by identify_many's bulk lookups, keyed for fanning out
+    editions: dict[int, Book] = field(default_factory=dict)
+    isbn_asin: list[Book] = field(default_factory=list)
+    books: dict[int, Book] = field(default_factory=dict)
+    slugs: dict[str, list[Book]] = field(default_factory=dict)
+
+
+class RaceLost(Exception):
+    # Stops a sync race strategy that lost before its next request
+    pass
+
+
+class Lookup(NamedTuple):
+    description: str
+    query: Document
+    variables: dict
+    filter_by_title: bool = False
+    resolve_canonical: bool = False
+
 
 class HardcoverIdentifier:
     def __init__(
@@ -23,14 +108,48 @@ class HardcoverIdentifier:
         match_sensitivity: float,
         languages: list[str],
         timeout=30,
+        lookup_mode: str = LOOKUP_SEQUENTIAL,
+        async_client: Optional[AsyncGraphQLClient] = None,
+        concurrency: int = 4,
+        decoder: Optional[ResponseDecoder] = None,
+        scorer: Optional[SimilarityScorer] = None,
+        good_enough: Optional[float] = None,
+        edition_limit: Optional[int] = EDITION_LIMIT,
+        mirror: Optional[Mirror] = None,
+        search_cache: Optional[SearchCache] = None,
     ) -> None:
         self.log = log
         self.client = client
         self.client.set_token(api_key)
+        self.async_client = async_client
+        if async_client is not None:
+            async_client.set_token(api_key)
+        self.concurrency = concurrency
+        # Decodes book and edition responses straight into typed structs
+        self.decoder = decoder
+        self.scorer = scorer or SimilarityScorer()
+        # Once this many editions of a book score at least `good_enough`, the
+        # rest of its editions are not compared at all
+        self.good_enough = good_enough
+        self.ranking_stats = RankingStats()
+        # Book queries return at most this many editions per book (None for
+        # all of them), the rest are only fetched if none of those match
+        self.edition_limit = edition_limit
+        # Offset of the next page for books with editions left to fetch, and
+        # the title their editions were filtered by
+        self._edition_offsets: dict[int, int] = {}
+        self._edition_titles: dict[int, str] = {}
+        # Local copy of every book decoded, answered from before the API
+        self.mirror = mirror
+        # Search hits (or the lack of any) from earlier runs
+        self.search_cache = search_cache
+        # Set in each sync race strategy's thread, to stop it once it lost
+        self._race_state = threading.local()
         self.identifier = identifier
         self.match_sensitivity = match_sensitivity
         self.languages = self._validate_languages(languages)
         self.timeout = timeout
+        self.lookup_mode = lookup_mode
 
     def _validate_languages(self, languages: list[str]) -> list[str]:
         result = []
@@ -58,12 +177,7 @@ class HardcoverIdentifier:
             self.log.warn(f"{value} is not a valid integer")
             return None
 
-    def identify(
-        self,
-        title: Optional[str],
-        authors: Optional[list[str]],
-        identifiers: dict[str, str],
-    ):
+    def _parse_identifiers(self, identifiers: dict[str, str]):
         hardcover_slug_legacy = identifiers.get(self.identifier, None)
         hardcover_slug = identifiers.get(
             f"{self.identifier}-slug", hardcover_slug_legacy
@@ -74,140 +188,763 @@ class HardcoverIdentifier:
         )
         isbn = identifiers.get("isbn", "")
         asin = identifiers.get("mobi-asin", "")
+        return hardcover_edition, isbn, asin, hardcover_id, hardcover_slug
 
-        candidate_books: list[Book] = []
+    def identify(
+        self,
+        title: Optional[str],
+        authors: Optional[list[str]],
+        identifiers: dict[str, str],
+    ):
+        return self._select_editions(
+            self.find_candidates(title, authors, identifiers), authors
+        )
 
-        # Exact match with a Hardcover Edition ID
-        if hardcover_edition:
-            candidate_books = self.get_book_by_edition(hardcover_edition)
+    def identify_iter(
+        self,
+        title: Optional[str],
+        authors: Optional[list[str]],
+        identifiers: dict[str, str],
+    ) -> Iterator[Book]:
+        # The same books as identify, each yielded as soon as its edition is
+        # picked rather than once every candidate has been through the filters
+        yield from self.iter_matches(
+            self.find_candidates(title, authors, identifiers), authors
+        )
 
-        # Exact match with an ISBN or ASIN
-        if (isbn or asin) and not candidate_books:
-            candidate_books = self.get_book_by_isbn_asin(isbn, asin)
+    def find_candidates(
+        self,
+        title: Optional[str],
+        authors: Optional[list[str]],
+        identifiers: dict[str, str],
+    ) -> list[Book]:
+        # The books of the first strategy with results, before the author
+        # filter and edition choice
+        parsed = self._parse_identifiers(identifiers)
+        if books := self._identify_from_mirror(title, authors, *parsed):
+            return books
 
-        if hardcover_id and not candidate_books:
-            candidate_books = self.get_book_by_id(hardcover_id)
-            self.log.info("book", candidate_books)
-            if len(candidate_books) > 0:
-                candidate_books = self._filter_editions_by_title(candidate_books, title)
+        lookups = self._exact_lookups(*parsed)
+        if self.lookup_mode == LOOKUP_RACE:
+            strategies = [
+                partial(self._run_lookups, [lookup], title) for lookup in lookups
+            ]
+            if title:
+                strategies.append(partial(self._search_books, title, authors))
+            return self._race(strategies)
 
-        # Exact match with a Hardcover ID
-        if hardcover_slug and not candidate_books:
-            candidate_books = self.get_book_by_slug(hardcover_slug)
-            if len(candidate_books) > 0:
-                candidate_books = self._filter_editions_by_title(candidate_books, title)
+        if self.lookup_mode == LOOKUP_BATCHED and len(lookups) > 1:
+            candidate_books = self._run_lookups_batched(lookups, title)
+        else:
+            candidate_books = self._run_lookups(lookups, title)
 
         # Fuzzy Search by Title
         if title and not candidate_books:
-            author = None
-            if authors:
-                author = authors[0]
-            book_ids = self.search_book(title, author)
-            if len(book_ids) == 0:
-                self.log.warn(f"No books found for {title=}, {author=}")
-                return []
-            books = self.get_books_by_ids(book_ids)
-
-            # Get closest books by Title
-            candidate_books = self._order_by_similarity(
-                books, title, lambda book: book.title
+            candidate_books = self._search_books(title, authors)
+
+        return candidate_books
+
+    async def identify_async(
+        self,
+        title: Optional[str],
+        authors: Optional[list[str]],
+        identifiers: dict[str, str],
+    ):
+        candidate_books = await self.find_candidates_async(title, authors, identifiers)
+        # Filtering may page through more editions with the sync client, so
+        # it runs off the event loop
+        return await asyncio.to_thread(self._select_editions, candidate_books, authors)
+
+    async def find_candidates_async(
+        self,
+        title: Optional[str],
+        authors: Optional[list[str]],
+        identifiers: dict[str, str],
+    ) -> list[Book]:
+        # Same flow as find_candidates, but every exact lookup is awaited
+        # concurrently (at most `concurrency` at a time) and the highest
+        # priority hit wins
+        parsed = self._parse_identifiers(identifiers)
+        # Reading the mirror blocks, so it runs off the event loop
+        if books := await asyncio.to_thread(
+            self._identify_from_mirror, title, authors, *parsed
+        ):
+            return books
+
+        lookups = self._exact_lookups(*parsed)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(lookup: Lookup) -> list[Book]:
+            self.log.info(f"Finding by {lookup.description}")
+            books = await self._execute_async(lookup.query, lookup.variables)
+            return await self._resolve_lookup_async(lookup, books, title)
+
+        async def run(lookup: Lookup) -> list[Book]:
+            async with semaphore:
+                return await fetch(lookup)
+
+        if self.lookup_mode == LOOKUP_RACE:
+            strategies = [partial(fetch, lookup) for lookup in lookups]
+            if title:
+                strategies.append(partial(self._search_books_async, title, authors))
+            return await self._race_async(strategies)
+
+        results = await asyncio.gather(*(run(lookup) for lookup in lookups))
+        candidate_books = next((books for books in results if books), [])
+
+        # Fuzzy Search by Title
+        if title and not candidate_books:
+            candidate_books = await self._search_books_async(title, authors)
+        return candidate_books
+
+    def _race(self, strategies: list[Callable[[], list[Book]]]) -> list[Book]:
+        # Every strategy runs at once, but results are still taken in priority
+        # order: a strategy only wins once all those before it came back empty
+        if not strategies:
+            return []
+        lost = threading.Event()
+
+        def run(strategy: Callable[[], list[Book]]) -> list[Book]:
+            self._race_state.lost = lost
+            try:
+                return strategy()
+            finally:
+                self._race_state.lost = None
+
+        executor = ThreadPoolExecutor(
+            max_workers=len(strategies), thread_name_prefix="hardcover-race"
+        )
+        futures = [executor.submit(run, strategy) for strategy in strategies]
+        try:
+            for future in futures:
+                books = future.result()
+                if books:
+                    return books
+            return []
+        finally:
+            # Requests already on the wire finish in the background, but the
+            # losers send no more
+            lost.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _check_race(self):
+        lost = getattr(self._race_state, "lost", None)
+        if lost is not None and lost.is_set():
+            raise RaceLost()
+
+    async def _race_async(
+        self, strategies: list[Callable[[], Awaitable[list[Book]]]]
+    ) -> list[Book]:
+        # As _race, but the strategies that lost are cancelled outright
+        tasks = [asyncio.ensure_future(strategy()) for strategy in strategies]
+        try:
+            for task in tasks:
+                books = await task
+                if books:
+                    return books
+            return []
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _search_books(self, title: str, authors: Optional[list[str]]) -> list[Book]:
+        # Fuzzy Search by Title, fetching the best hits first
+        author = authors[0] if authors else None
+        hits = self.search_hits(title, author)
+        if len(hits) == 0:
+            self.log.warn(f"No books found for {title=}, {author=}")
+            return []
+        for book_ids in self._search_windows(hits, title, authors):
+            books = self._rank_window(self.get_books_by_ids(book_ids), title, authors)
+            if books:
+                return books
+        return []
+
+    async def _search_books_async(
+        self, title: str, authors: Optional[list[str]]
+    ) -> list[Book]:
+        author = authors[0] if authors else None
+        hits = await self.search_hits_async(title, author)
+        if len(hits) == 0:
+            self.log.warn(f"No books found for {title=}, {author=}")
+            return []
+        for book_ids in self._search_windows(hits, title, authors):
+            books = await self.get_books_by_ids_async(book_ids)
+            books = await asyncio.to_thread(self._rank_window, books, title, authors)
+            if books:
+                return books
+        return []
+
+    def _rank_window(
+        self, books: list[Book], title: str, authors: Optional[list[str]]
+    ) -> list[Book]:
+        # A search window's books matching the title, or none if none of them
+        # can match the authors either, so the next window gets a look
+        books = self._rank_search_results(books, title)
+        if not authors or any(
+            # Books with editions left to page through might still match
+            book.id in self._edition_offsets
+            or self._editions_by_author(book.editions, authors)
+            for book in books
+        ):
+            return books
+        self.log.info(f"No books by {authors=} in this window of search hits")
+        return []
+
+    def _search_windows(
+        self, hits: list[SearchHit], title: str, authors: Optional[list[str]]
+    ) -> Iterator[list[int]]:
+        if not any(hit.title for hit in hits):
+            # Nothing to rank the hits by, so they're all fetched at once
+            yield [hit.id for hit in hits]
+            return
+        ranked, distant = prerank_hits(
+            hits, title, authors, self.scorer, self.match_sensitivity
+        )
+        self.log.info(f"Pre-ranked {len(ranked)} of {len(hits)} search hits")
+        yield from windows(ranked)
+        yield from windows(distant)
+
+    def identify_many(
+        self, requests: list[IdentifyRequest] | list[tuple]
+    ) -> list[list[Book]]:
+        # Identifies many books at once, returning the matches for each request
+        # in order. Every edition id, ISBN/ASIN, Hardcover id and slug is looked
+        # up with `_in` queries per type (a few sent in each request), then the
+        # fuzzy searches left over run concurrently.
+        requests = [IdentifyRequest(*request) for request in requests]
+        parsed = [self._parse_identifiers(request.identifiers) for request in requests]
+        # Requests for the same book page through its editions separately
+        identifiers_for = [self._for_request() for _ in requests]
+        local = [
+            each._identify_from_mirror(request.title, request.authors, *identifiers)
+            for each, request, identifiers in zip(identifiers_for, requests, parsed)
+        ]
+        # Requests the mirror answered need no lookups
+        found = self._bulk_lookups(
+            [
+                NO_IDENTIFIERS if books else identifiers
+                for books, identifiers in zip(local, parsed)
+            ]
+        )
+
+        candidates = [
+            books or each._fan_out(found, request.title, *identifiers)
+            for each, books, request, identifiers in zip(
+                identifiers_for, local, requests, parsed
+            )
+        ]
+
+        # Fuzzy Search by Title
+        pending = [
+            index
+            for index, (request, books) in enumerate(zip(requests, candidates))
+            if request.title and not books
+        ]
+        if pending:
+            with ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="hardcover-search"
+            ) as executor:
+                searches = {
+                    index: executor.submit(
+                        identifiers_for[index]._search_books,
+                        requests[index].title,  # pyright: ignore[reportArgumentType]
+                        requests[index].authors,
+                    )
+                    for index in pending
+                }
+                for index, future in searches.items():
+                    try:
+                        candidates[index] = future.result()
+                    except Exception as e:
+                        # One failed search shouldn't lose the whole run
+                        self.log.error(
+                            f"Search failed for {requests[index].title=}: {e}"
+                        )
+
+        return [
+            each._select_editions(books, request.authors)
+            for each, books, request in zip(identifiers_for, candidates, requests)
+        ]
+
+    def _for_request(self) -> "HardcoverIdentifier":
+        # Shares the clients, caches and settings, with paging state of its own
+        identifier = copy.copy(self)
+        identifier._edition_offsets = {}
+        identifier._edition_titles = {}
+        return identifier
+
+    def _bulk_lookups(self, parsed: list[tuple]) -> BulkResults:
+        edition_ids = sorted({edition for edition, *_ in parsed if edition})
+        isbns = sorted({isbn for _, isbn, *_ in parsed if isbn})
+        asins = sorted({asin for _, _, asin, *_ in parsed if asin})
+        book_ids = sorted({book_id for *_, book_id, _ in parsed if book_id})
+        slugs = sorted({slug for *_, slug in parsed if slug})
+
+        operations: list[tuple[Document, dict]] = []
+        for chunk in _chunks(edition_ids):
+            operations.append((queries.FIND_BOOKS_BY_EDITIONS, {"ids": chunk}))
+        # ISBNs and ASINs are chunked together, as both go in the one query
+        codes = [("isbn", isbn) for isbn in isbns] + [("asin", asin) for asin in asins]
+        for chunk in _chunks(codes):
+            operations.append(
+                (
+                    queries.FIND_BOOKS_BY_ISBNS_OR_ASINS,
+                    {
+                        "isbns": [code for kind, code in chunk if kind == "isbn"],
+                        "asins": [code for kind, code in chunk if kind == "asin"],
+                    },
+                )
+            )
+        for chunk in _chunks(book_ids):
+            operations.append(
+                (queries.FIND_BOOKS_BY_IDS, {"ids": chunk, **self._book_variables()})
+            )
+        for chunk in _chunks(slugs):
+            operations.append(
+                (
+                    queries.FIND_BOOKS_BY_SLUGS,
+                    {"slugs": chunk, **self._book_variables()},
+                )
             )
 
-            candidate_books = self._filter_editions_by_title(candidate_books, title)
+        found = BulkResults()
+        if not operations:
+            return found
+        self.log.info(
+            f"Finding {len(edition_ids)} editions, {len(codes)} ISBNs / ASINs, "
+            f"{len(book_ids)} ids and {len(slugs)} slugs"
+        )
+        results = self._execute_batches(operations)  # pyright: ignore[reportArgumentType]
+        for (query, _), res in zip(operations, results):
+            books = self._map_result(res)
+            if query is queries.FIND_BOOKS_BY_EDITIONS:
+                found.editions.update((book.editions[0].id, book) for book in books)
+            elif query is queries.FIND_BOOKS_BY_ISBNS_OR_ASINS:
+                found.isbn_asin += books
+            elif query is queries.FIND_BOOKS_BY_IDS:
+                found.books.update((book.id, book) for book in books)
+            else:
+                for book in books:
+                    found.slugs.setdefault(book.slug, []).append(book)
+        # Most read first, as the single ISBN / ASIN lookup orders them
+        found.isbn_asin.sort(
+            key=lambda book: book.editions[0].users_count, reverse=True
+        )
 
+        # Canonical books that slugs point at, which weren't already fetched
+        canonical_ids = sorted(
+            {
+                book.canonical_id
+                for books in found.slugs.values()
+                for book in books
+                if book.canonical_id and book.canonical_id not in found.books
+            }
+        )
+        if canonical_ids:
+            results = self._execute_batches(
+                [
+                    (
+                        queries.FIND_BOOKS_BY_IDS,
+                        {"ids": chunk, **self._book_variables()},
+                    )
+                    for chunk in _chunks(canonical_ids)
+                ]
+            )
+            for res in results:
+                found.books.update((book.id, book) for book in self._map_result(res))
+        return found
+
+    def _execute_batches(
+        self, operations: list[tuple[Document, Optional[dict]]]
+    ) -> list[dict]:
+        # One request after another, so a large library never turns into one
+        # huge request
+        results = []
+        for start in range(0, len(operations), BULK_QUERIES_PER_REQUEST):
+            results += self._execute_batch_internal(
+                operations[start : start + BULK_QUERIES_PER_REQUEST]
+            )
+        return results
+
+    def _fan_out(
+        self,
+        found: BulkResults,
+        title: Optional[str],
+        hardcover_edition: Optional[int],
+        isbn: str,
+        asin: str,
+        hardcover_id: Optional[int],
+        hardcover_slug: Optional[str],
+    ) -> list[Book]:
+        # Picks one request's books out of the bulk results, with the same
+        # priority as _exact_lookups
+        if hardcover_edition and (book := found.editions.get(hardcover_edition)):
+            return [book]
+
+        if isbn or asin:
+            books = [
+                book
+                for book in found.isbn_asin
+                if (
+                    isbn
+                    and isbn in (book.editions[0].isbn_13, book.editions[0].isbn_10)
+                )
+                or (asin and asin == book.editions[0].asin)
+            ]
+            if books:
+                return books
+
+        if hardcover_id and (book := found.books.get(hardcover_id)):
+            books = self._filter_editions_by_title([book], title)
+            if books:
+                return books
+
+        if hardcover_slug and (books := found.slugs.get(hardcover_slug)):
+            books, canonical_ids = self._split_canonical_books(books)
+            books += [found.books[i] for i in canonical_ids if i in found.books]
+            if books:
+                return self._filter_editions_by_title(books, title)
+        return []
+
+    def _identify_from_mirror(
+        self,
+        title: Optional[str],
+        authors: Optional[list[str]],
+        hardcover_edition: Optional[int],
+        isbn: str,
+        asin: str,
+        hardcover_id: Optional[int],
+        hardcover_slug: Optional[str],
+    ) -> list[Book]:
+        # Goes through the lookups in the same order as the API would, but
+        # the mirror can't tell that something doesn't exist - so the first
+        # lookup it has no fresh record for leaves the rest to the API
+        mirror = self.mirror
+        if mirror is None:
+            return []
+        try:
+            if hardcover_edition:
+                return self._from_mirror(
+                    f"Edition ID {hardcover_edition}",
+                    mirror.by_edition(hardcover_edition),
+                )
+
+            if isbn or asin:
+                return self._from_mirror(
+                    f"ISBN / ASIN {isbn=} {asin=}", mirror.by_isbn_asin(isbn, asin)
+                )
+
+            if hardcover_id:
+                books = mirror.books([hardcover_id], self.languages)
+                if not books:
+                    return []
+                if books := self._filter_editions_by_title(books, title):
+                    return self._from_mirror(f"ID {hardcover_id}", books)
+
+            if hardcover_slug:
+                books = mirror.by_slug(hardcover_slug, self.languages)
+                books, canonical_ids = self._split_canonical_books(books)
+                if canonical_ids:
+                    canonical = mirror.books(canonical_ids, self.languages)
+                    if len(canonical) < len(canonical_ids):
+                        return []
+                    books += canonical
+                if not books:
+                    return []
+                if books := self._filter_editions_by_title(books, title):
+                    return self._from_mirror(f"Slug {hardcover_slug}", books)
+
+            if title:
+                author = authors[0] if authors else None
+                books = mirror.books(mirror.search(title, author), self.languages)
+                if books := self._rank_search_results(books, title):
+                    return self._from_mirror(f"{title=}, {author=}", books)
+        except sqlite3.Error as e:
+            self.log.warn(f"Unable to read the local mirror: {e}")
+        return []
+
+    def _from_mirror(self, description: str, books: list[Book]) -> list[Book]:
+        if books:
+            self.log.info(f"Found {description} in the local mirror")
+        return books
+
+    def _record(self, books: list[Book], complete: bool):
+        if self.mirror is None or not books:
+            return
+        try:
+            self.mirror.record(books, complete)
+        except sqlite3.Error as e:
+            self.log.warn(f"Unable to update the local mirror: {e}")
+
+    def _rank_search_results(self, books: list[Book], title: str) -> list[Book]:
+        # Get closest books by Title
+        candidate_books = self._order_by_similarity(
+            books, title, lambda book: book.title
+        )
+        return self._filter_editions_by_title(candidate_books, title)
+
+    def _select_editions(
+        self, candidate_books: list[Book], authors: Optional[list[str]]
+    ) -> list[Book]:
+        return _in_order(self._selected(candidate_books, authors))
+
+    def iter_matches(
+        self, candidate_books: list[Book], authors: Optional[list[str]]
+    ) -> Iterator[Book]:
+        # _select_editions as each book is confirmed, which isn't always in
+        # candidate order when some books page through more editions
+        for _, book in self._selected(candidate_books, authors):
+            yield book
+
+    def _selected(
+        self, candidate_books: list[Book], authors: Optional[list[str]]
+    ) -> Iterator[tuple[int, Book]]:
         # Filter by Authors
         if authors and candidate_books:
-            candidate_books = self._filter_editions_by_author(candidate_books, authors)
+            kept = self._iter_editions_by_author(candidate_books, authors)
+        else:
+            kept = enumerate(candidate_books)
 
-        books = []
-        for book in candidate_books:
+        for index, book in kept:
             edition = self.find_matching_edition(book.editions)
             self.log.info(f"Matched {book.slug=} to {edition=}")
             if edition:
-                book.editions = [edition]
-                books.append(book)
+                yield (
+                    index,
+                    replace(
+                        book,
+                        editions=[edition],
+                        cover_candidates=self._cover_candidates(book.editions),
+                    ),
+                )
+
+        self.log.debug(f"Ranking: {self.ranking_stats.summary()}")
+
+    def _exact_lookups(
+        self,
+        hardcover_edition: Optional[int],
+        isbn: str,
+        asin: str,
+        hardcover_id: Optional[int],
+        hardcover_slug: Optional[str],
+    ) -> list[Lookup]:
+        # Ordered by priority - the first lookup with results wins
+        lookups: list[Lookup] = []
+
+        # Exact match with a Hardcover Edition ID
+        if hardcover_edition:
+            lookups.append(
+                Lookup(
+                    f"Edition ID {hardcover_edition}",
+                    queries.FIND_BOOK_BY_EDITION,
+                    {"edition": hardcover_edition},
+                )
+            )
+
+        # Exact match with an ISBN or ASIN
+        if isbn or asin:
+            lookups.append(
+                Lookup(
+                    f"ISBN / ASIN {isbn=} {asin=}",
+                    queries.FIND_BOOK_BY_ISBN_OR_ASIN,
+                    {"isbn": isbn, "asin": asin},
+                )
+            )
+
+        # Exact match with a Hardcover ID
+        if hardcover_id:
+            lookups.append(
+                Lookup(
+                    f"ID {hardcover_id}",
+                    queries.FIND_BOOK_BY_ID,
+                    {"id": hardcover_id, **self._book_variables()},
+                    filter_by_title=True,
+                )
+            )
+
+        # Exact match with a Hardcover Slug
+        if hardcover_slug:
+            lookups.append(
+                Lookup(
+                    f"Slug {hardcover_slug}",
+                    queries.FIND_BOOK_BY_SLUG,
+                    {"slug": hardcover_slug, **self._book_variables()},
+                    filter_by_title=True,
+                    resolve_canonical=True,
+                )
+            )
+        return lookups
 
+    def _run_lookups(self, lookups: list[Lookup], title: Optional[str]) -> list[Book]:
+        for lookup in lookups:
+            self.log.info(f"Finding by {lookup.description}")
+            books = self._execute(lookup.query, lookup.variables)
+            books = self._resolve_lookup(lookup, books, title)
+            if books:
+                return books
+        return []
+
+    def _run_lookups_batched(
+        self, lookups: list[Lookup], title: Optional[str]
+    ) -> list[Book]:
+        descriptions = ", ".join(lookup.description for lookup in lookups)
+        self.log.info(f"Finding by {descriptions} in a single request")
+        results = self._execute_batch_internal(
+            [(lookup.query, lookup.variables) for lookup in lookups]
+        )
+        for lookup, res in zip(lookups, results):
+            books = self._resolve_lookup(lookup, self._map_result(res), title)
+            if books:
+                return books
+        return []
+
+    def _resolve_lookup(
+        self, lookup: Lookup, books: list[Book], title: Optional[str]
+    ) -> list[Book]:
+        if lookup.resolve_canonical:
+            books = self._resolve_canonical_books(books)
+        if lookup.filter_by_title and books:
+            books = self._filter_editions_by_title(books, title)
+        return books
+
+    async def _resolve_lookup_async(
+        self, lookup: Lookup, books: list[Book], title: Optional[str]
+    ) -> list[Book]:
+        if lookup.resolve_canonical:
+            books, canonical_ids = self._split_canonical_books(books)
+            if canonical_ids:
+                books += await self.get_books_by_ids_async(canonical_ids)
+        if lookup.filter_by_title and books:
+            books = await asyncio.to_thread(
+                self._filter_editions_by_title, books, title
+            )
         return books
 
     def _filter_editions_by_title(
         self, books: list[Book], title: Optional[str]
     ) -> list[Book]:
+        if not books:
+            return []
+        # Without a title, every book is compared to the first book's title
+        title = title or books[0].title
         for book in books:
-            if not title:
-                title = book.title
-            editions = self._order_by_similarity(
-                book.editions, title, lambda edition: edition.title, top_n=20
-            )
-            book.editions = editions
-        # Remove books that now have no editions
-        return [book for book in books if len(book.editions) > 0]
+            self._edition_titles[book.id] = title
+            # A full first page means the limit may have cut editions off
+            if self.edition_limit and len(book.editions) >= self.edition_limit:
+                self._edition_offsets[book.id] = self.edition_limit
+        return self._filter_books(
+            books, lambda book: self._editions_by_title(book.editions, title)
+        )
 
-    def _filter_editions_by_author(
+    def _editions_by_title(self, editions: list[Edition], title: str) -> list[Edition]:
+        return self._order_by_similarity(
+            editions,
+            title,
+            lambda edition: edition.title,
+            top_n=20,
+            stage="edition title",
+        )
+
+    def _iter_editions_by_author(
         self, books: list[Book], authors: list[str]
-    ) -> list[Book]:
+    ) -> Iterator[tuple[int, Book]]:
+        def select_page(book: Book) -> list[Edition]:
+            # Later pages haven't been through the title filter yet
+            editions = book.editions
+            if (title := self._edition_titles.get(book.id)) is not None:
+                editions = self._editions_by_title(editions, title)
+            return self._editions_by_author(editions, authors)
+
+        return self._iter_books(
+            books,
+            lambda book: self._editions_by_author(book.editions, authors),
+            select_page,
+        )
+
+    def _editions_by_author(
+        self, editions: list[Edition], authors: list[str]
+    ) -> list[Edition]:
         top_n = 10
-        for book in books:
-            candidates: list[tuple[float, Edition]] = []
-            for edition in book.editions:
-                self.log.debug("filtering edition", edition)
-                edition_authors = edition.authors
-                total_similarity = 0.0
-                for edition_author in edition_authors:
-                    weight = CONTRIBUTION_WEIGHTS.get(edition_author.contribution, 1.0)
-                    max_similarity = max(
-                        [
-                            distance.get_jaro_winkler_similarity(
-                                edition_author.name,
-                                author,
-                                ignore_case=True,
-                                scaling=0.0,
-                            )
-                            for author in authors
-                        ]
-                    )
-                    weighted_similarity = max_similarity * weight
-                    self.log.debug(
-                        f"weighted similarity between {authors} and {edition_author}: {weighted_similarity}"
-                    )
-                    total_similarity += weighted_similarity
-                similarity = 0.0
-                if edition_authors:
-                    similarity = total_similarity / len(edition_authors)
-                self.log.debug(
-                    f"overall similarity for {edition.title} ({edition.id}): {similarity}"
-                )
-                if similarity < self.match_sensitivity:
-                    self.log.debug(
-                        f"Dropping {edition.title} ({edition.id}) as it's too distant - similarity: {similarity}"
-                    )
-                    continue
-                candidates.append((similarity, edition))
-            candidates = sorted(candidates, key=lambda x: x[0], reverse=True)
-            if len(candidates) > top_n and top_n > 0:
-                candidates = candidates[:top_n]
-            editions = [item[1] for item in candidates]
-            book.editions = editions
-        # Remove books that now have no editions
-        return [book for book in books if len(book.editions) > 0]
-
-    def _filter_editions(
+
+        def drop(candidate: Candidate):
+            edition = candidate.item
+            self.log.debug(
+                f"Dropping {edition.title} ({edition.id}) as it's too distant - similarity: {candidate.score}"
+            )
+
+        candidates = scored(
+            editions,
+            lambda chunk: self.scorer.author_scores(
+                chunk, authors, CONTRIBUTION_WEIGHTS
+            ),
+        )
+        candidates = until_good_enough(
+            at_least(
+                candidates,
+                self.match_sensitivity,
+                self.ranking_stats.stage("edition author"),
+                drop,
+            ),
+            self.good_enough,
+            top_n,
+            len(editions),
+            self.ranking_stats.stage("edition author good enough"),
+        )
+        return top_k(
+            candidates, top_n, self.ranking_stats.stage("edition author top-k")
+        )
+
+    def _filter_books(
         self,
         books: list[Book],
-        search: str | Callable[[Book], str],
-        fn: Callable[[Edition], Optional[str]],
-        top_n=20,
+        select: Callable[[Book], list[Edition]],
+        select_page: Optional[Callable[[Book], list[Edition]]] = None,
     ) -> list[Book]:
-        for book in books:
-            if callable(search):
-                query = search(book)
-            else:
-                query = search
-            editions = self._order_by_similarity(book.editions, query, fn, top_n)
-            book.editions = editions
+        return _in_order(self._iter_books(books, select, select_page))
 
-        # Remove books that now have no editions
-        books = [book for book in books if len(book.editions) > 0]
-        return books
+    def _iter_books(
+        self,
+        books: list[Book],
+        select: Callable[[Book], list[Edition]],
+        select_page: Optional[Callable[[Book], list[Edition]]] = None,
+    ) -> Iterator[tuple[int, Book]]:
+        # Yields (position, book) for each book with the editions `select`
+        # picks, dropping books left with none. Books whose editions were cut
+        # off by the edition limit are paged through (`select_page` picking
+        # from each page) until one of their editions is picked or they run
+        # out - those come after the books picked from their first page.
+        select_page = select_page or select
+        pending: list[int] = []
+        for index, book in enumerate(books):
+            if editions := select(book):
+                yield index, replace(book, editions=editions)
+            elif book.id in self._edition_offsets:
+                pending.append(index)
+
+        while pending:
+            offsets: dict[int, list[int]] = {}
+            for index in pending:
+                offsets.setdefault(self._edition_offsets[books[index].id], []).append(
+                    index
+                )
+            pending = []
+            for offset, indices in offsets.items():
+                pages = self.get_edition_pages(
+                    [books[index].id for index in indices], offset
+                )
+                for index in indices:
+                    book = books[index]
+                    page = pages.get(book.id, [])
+                    if self.edition_limit and len(page) >= self.edition_limit:
+                        self._edition_offsets[book.id] = offset + self.edition_limit
+                    else:
+                        self._edition_offsets.pop(book.id, None)
+                    if editions := select_page(replace(book, editions=page)):
+                        yield index, replace(book, editions=editions)
+                    elif book.id in self._edition_offsets:
+                        pending.append(index)
 
     def _order_by_similarity(
         self,
@@ -215,61 +952,190 @@ class HardcoverIdentifier:
         query: str,
         search_fn: Callable[[T], Optional[str]],
         top_n=20,
+        stage="title",
     ) -> list[T]:
-        candidates: list[tuple[float, T]] = []
-        for item in items:
-            item_comparison = search_fn(item)
-            if not item_comparison:
-                continue
+        # Lazily scores the items against the query, dropping those under the
+        # match sensitivity and keeping the best top_n
+        target = normalize_title(query)
+        compared = [(item, text) for item in items if (text := search_fn(item))]
+
+        def drop(candidate: Candidate):
+            item, text = candidate.item
             try:
-                identifier = f"book:{item.slug}"  # pyright: ignore[reportAttributeAccessIssue]
+                identifier = f"book:{item.slug}"
             except AttributeError:
                 identifier = f"edition:{item.id}"
-            self.log.debug(f"Comparing {query} to {item_comparison} ({identifier})")
-            similarity = distance.get_jaro_winkler_similarity(query, item_comparison)
-            if similarity < self.match_sensitivity:
-                self.log.debug(
-                    f"Dropping {item_comparison} ({identifier}) as it's too distant"
-                )
-                continue
-            candidates.append((similarity, item))
-        candidates = sorted(candidates, key=lambda x: x[0], reverse=True)
-        if len(candidates) > top_n and top_n > 0:
-            candidates = candidates[:top_n]
-        return [item[1] for item in candidates]
+            self.log.debug(f"Dropping {text} ({identifier}) as it's too distant")
+
+        candidates = scored(
+            compared,
+            lambda chunk: self.scorer.title_scores(
+                target, [normalize_title(text) for _, text in chunk]
+            ),
+        )
+        candidates = until_good_enough(
+            at_least(
+                candidates,
+                self.match_sensitivity,
+                self.ranking_stats.stage(stage),
+                drop,
+            ),
+            self.good_enough,
+            top_n,
+            len(compared),
+            self.ranking_stats.stage(f"{stage} good enough"),
+        )
+        best = top_k(candidates, top_n, self.ranking_stats.stage(f"{stage} top-k"))
+        return [item for item, _ in best]
+
+    def _cover_candidates(self, editions: list[Edition]) -> tuple[str, ...]:
+        # Only the most read few, as reading an image decodes the edition
+        popular = heapq.nlargest(
+            COVER_CANDIDATES, editions, key=lambda e: e.users_count
+        )
+        return tuple(edition.image for edition in popular if edition.image)
 
     def find_matching_edition(self, editions: list[Edition]) -> Optional[Edition]:
-        sorted_editions = sorted(editions, key=lambda e: e.users_count, reverse=True)
         # Get the most 'popular' remaining edition
-        if sorted_editions:
-            return sorted_editions[0]
-        return None
+        return max(editions, key=lambda e: e.users_count, default=None)
 
-    def _execute_internal(self, query: str, variables: Optional[dict] = None) -> dict:
-        query_with_fragments = f"{queries.FRAGMENTS}{query}"
-        result = self.client.execute(query_with_fragments, variables, self.timeout)
-        return result
+    def _execute_internal(
+        self, query: Document, variables: Optional[dict] = None, typed=False
+    ) -> dict:
+        self._check_race()
+        if typed and self.decoder is not None:
+            return self.client.execute(query, variables, self.timeout, self.decoder)
+        return self.client.execute(query, variables, self.timeout)
+
+    def _execute_batch_internal(
+        self, operations: list[tuple[Document, Optional[dict]]]
+    ) -> list[dict]:
+        self._check_race()
+        if self.decoder is not None:
+            return self.client.execute_batch(operations, self.timeout, self.decoder)
+        return self.client.execute_batch(operations, self.timeout)
 
-    def _execute(self, query: str, variables: Optional[dict] = None) -> List[Book]:
-        res = self._execute_internal(query, variables)
+    def _map_result(self, res: dict, complete: bool = True) -> List[Book]:
         result: List[Book] = []
+        if not res:
+            return result
         key = list(res.keys())[0]
 
         entries = res.get(key, []) if isinstance(res.get(key), list) else [res.get(key)]
         for entry in entries:
+            # *_by_pk queries return null when nothing matches
+            if entry is None:
+                continue
+            typed = not isinstance(entry, dict)
             if key == "books":
-                result.append(map_from_book_query(entry))  # pyright: ignore[reportArgumentType]
+                result.append(
+                    map_book_struct(entry) if typed else map_from_book_query(entry)  # pyright: ignore[reportArgumentType]
+                )
             elif key == "editions":
-                result.append(map_from_edition_query(entry))  # pyright: ignore[reportArgumentType]
+                result.append(
+                    map_edition_struct(entry)
+                    if typed
+                    else map_from_edition_query(entry)  # pyright: ignore[reportArgumentType]
+                )
+        if key != "books":
+            # Edition lookups only bring back the matched editions of each book
+            self._record(result, complete=False)
+            return result
+        # Books cut off at the edition limit, and pages of more editions,
+        # don't hold all of the book's editions either
+        whole, partial = [], []
+        for book in result:
+            cut_off = self.edition_limit and len(book.editions) >= self.edition_limit
+            (whole if complete and not cut_off else partial).append(book)
+        self._record(whole, complete=True)
+        self._record(partial, complete=False)
         return result
 
-    def search_book(self, name: str, author: Optional[str]) -> list[int]:
+    def _execute(self, query: Document, variables: Optional[dict] = None) -> List[Book]:
+        return self._map_result(self._execute_internal(query, variables, typed=True))
+
+    async def _execute_internal_async(
+        self, query: Document, variables: Optional[dict] = None, typed=False
+    ) -> dict:
+        if self.async_client is None:
+            raise RuntimeError("identify_async requires an AsyncGraphQLClient")
+        if typed and self.decoder is not None:
+            return await self.async_client.execute(
+                query, variables, self.timeout, self.decoder
+            )
+        return await self.async_client.execute(query, variables, self.timeout)
+
+    async def _execute_async(
+        self, query: Document, variables: Optional[dict] = None
+    ) -> List[Book]:
+        res = await self._execute_internal_async(query, variables, typed=True)
+        # Mapping records the books in the mirror, which blocks
+        return await asyncio.to_thread(self._map_result, res)
+
+    @staticmethod
+    def _search_query(name: str, author: Optional[str]) -> str:
         query = name
         if author:
             query += f" {author}"
+        return query
+
+    def search_hits(self, name: str, author: Optional[str]) -> list[SearchHit]:
+        query = self._search_query(name, author)
+        hits = self._cached_search(query)
+        if hits is not None:
+            return hits
         self.log.info("Searching for ids by Name", query)
         variables = {"query": query}
         search = self._execute_internal(queries.SEARCH_BY_NAME, variables)
+        return self._cache_search(
+            query, search, self._parse_search_hits(search, name, query)
+        )
+
+    async def search_hits_async(
+        self, name: str, author: Optional[str]
+    ) -> list[SearchHit]:
+        query = self._search_query(name, author)
+        hits = self._cached_search(query)
+        if hits is not None:
+            return hits
+        self.log.info("Searching for ids by Name", query)
+        variables = {"query": query}
+        search = await self._execute_internal_async(queries.SEARCH_BY_NAME, variables)
+        return self._cache_search(
+            query, search, self._parse_search_hits(search, name, query)
+        )
+
+    def _cached_search(self, query: str) -> Optional[list[SearchHit]]:
+        if self.search_cache is None:
+            return None
+        try:
+            hits = self.search_cache.get(query)
+        except sqlite3.Error as e:
+            self.log.warn(f"Unable to read the search cache: {e}")
+            return None
+        if hits is not None:
+            self.log.info(f"Found {len(hits)} cached search hits for {query=}")
+        return hits
+
+    def _cache_search(
+        self, query: str, search: dict, hits: list[SearchHit]
+    ) -> list[SearchHit]:
+        # Errors come back without any ids, which isn't the same as no hits
+        answered = (search.get("search") or {}).get("ids") is not None
+        if self.search_cache is not None and answered:
+            try:
+                self.search_cache.put(query, hits)
+            except sqlite3.Error as e:
+                self.log.warn(f"Unable to update the search cache: {e}")
+        return hits
+
+    def _parse_search_hits(
+        self, search: dict, name: str, query: str
+    ) -> list[SearchHit]:
+        ids = self._parse_search_ids(search, name, query)
+        return parse_search_hits(search.get("search", {}).get("results"), ids)
+
+    def _parse_search_ids(self, search: dict, name: str, query: str) -> list[int]:
         ids = search.get("search", {}).get("ids", [])
         results = []
         for book_id in ids:
@@ -280,25 +1146,31 @@ class HardcoverIdentifier:
         self.log.info(f"Found {results=} for {query=}")
         return results
 
+    def _book_variables(self) -> dict:
+        return {"languages": self.languages, "limit": self.edition_limit}
+
+    def get_edition_pages(
+        self, book_ids: list[int], offset: int
+    ) -> dict[int, list[Edition]]:
+        self.log.info(f"Finding more editions from {offset} for book ids", book_ids)
+        variables = {"ids": book_ids, **self._book_variables(), "offset": offset}
+        res = self._execute_internal(queries.FIND_BOOK_EDITIONS, variables, typed=True)
+        books = self._map_result(res, complete=False)
+        return {book.id: book.editions for book in books}
+
     def get_books_by_ids(self, book_ids: list[int]) -> list[Book]:
         self.log.info("Finding by book id", book_ids)
-        variables = {"ids": book_ids, "languages": self.languages}
+        variables = {"ids": book_ids, **self._book_variables()}
         return self._execute(queries.FIND_BOOKS_BY_IDS, variables)
 
-    def get_book_by_isbn_asin(self, isbn: str, asin: str) -> list[Book]:
-        self.log.info(f"Finding by ISBN / ASIN {isbn=} {asin=}")
-        variables = {"isbn": isbn, "asin": asin}
-        return self._execute(queries.FIND_BOOK_BY_ISBN_OR_ASIN, variables)
-
-    def get_book_by_id(self, book_id: int) -> list[Book]:
-        self.log.info("Finding by ID", book_id)
-        variables = {"id": book_id, "languages": self.languages}
-        return self._execute(queries.FIND_BOOK_BY_ID, variables)
+    async def get_books_by_ids_async(self, book_ids: list[int]) -> list[Book]:
+        self.log.info("Finding by book id", book_ids)
+        variables = {"ids": book_ids, **self._book_variables()}
+        return await self._execute_async(queries.FIND_BOOKS_BY_IDS, variables)
 
-    def get_book_by_slug(self, slug: str) -> list[Book]:
-        self.log.info("Finding by Slug", slug)
-        variables = {"slug": slug, "languages": self.languages}
-        books = self._execute(queries.FIND_BOOK_BY_SLUG, variables)
+    def _split_canonical_books(self, books: list[Book]) -> tuple[list[Book], list[int]]:
+        # Duplicate books point at their canonical book, which may still
+        # need to be fetched
         result = []
         deduped_ids = []
         book_ids = [book.id for book in books]
@@ -309,12 +1181,26 @@ class HardcoverIdentifier:
                     deduped_ids.append(canonical_id)
                 continue
             result.append(book)
+        return result, deduped_ids
+
+    def _resolve_canonical_books(self, books: list[Book]) -> list[Book]:
+        result, deduped_ids = self._split_canonical_books(books)
         if deduped_ids:
             deduped_books = self.get_books_by_ids(deduped_ids)
             result += deduped_books
         return result
 
-    def get_book_by_edition(self, edition: int) -> list[Book]:
-        self.log.info("Finding by Edition ID", edition)
-        variables = {"edition": edition}
-        return self._execute(queries.FIND_BOOK_BY_EDITION, variables)
+    def get_books_by_editions(self, edition_ids: list[int]) -> dict[int, Book]:
+        # Each edition's book, keyed by edition id, in one batched request
+        parsed = [(edition, *NO_IDENTIFIERS[1:]) for edition in edition_ids]
+        return self._bulk_lookups(parsed).editions
+
+
+def _in_order(books: Iterable[tuple[int, Book]]) -> list[Book]:
+    return [book for _, book in sorted(books, key=lambda item: item[0])]
+
+
+def _chunks(values: list) -> list[list]:
+    return [
+        values[i : i + BULK_CHUNK_SIZE] for i in range(0, len(values), BULK_CHUNK_SIZE)
+    ]
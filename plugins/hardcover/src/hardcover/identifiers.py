@@ -0,0 +1,112 @@
+from typing import NamedTuple, Optional, Sequence
+import time
+
+from .storage import SQLiteStore
+
+# How long a book's slug, id, ISBN and cover URL are trusted for
+TTL = 30 * 24 * 60 * 60
+# Rows kept per table, the ones closest to expiring dropped first
+MAX_ENTRIES = 50_000
+
+
+class CachedBook(NamedTuple):
+    slug: str
+    book_id: Optional[int]
+    cover_url: Optional[str]
+    isbn: Optional[str] = None
+
+
+class IdentifierCache(SQLiteStore):
+    # What build_metadata learns about each book, kept on disk so a later
+    # download_cover (often in another worker process) can find the cover
+    # without running identify again. Calibre's own caches are per process.
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS slugs (
+    slug TEXT PRIMARY KEY,
+    book_id INTEGER,
+    cover_url TEXT,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS slugs_book_id ON slugs (book_id);
+CREATE INDEX IF NOT EXISTS slugs_expires ON slugs (expires);
+
+CREATE TABLE IF NOT EXISTS isbns (
+    isbn TEXT PRIMARY KEY,
+    slug TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS isbns_expires ON isbns (expires);
+"""
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = TTL,
+        max_entries: int = MAX_ENTRIES,
+        timeout: float = 30.0,
+    ):
+        super().__init__(path, timeout)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def put(self, books: Sequence[CachedBook]):
+        if not books:
+            return
+        now = time.time()
+        expires = now + self.ttl
+        with self.transaction() as db:
+            # Entries without a cover URL (e.g. from the library warm-up) keep
+            # the one already known, and when it expires
+            db.executemany(
+                "INSERT INTO slugs (slug, book_id, cover_url, expires)"
+                " VALUES (?, ?, ?, ?) ON CONFLICT (slug) DO UPDATE SET"
+                " book_id = coalesce(excluded.book_id, slugs.book_id),"
+                " cover_url = coalesce(excluded.cover_url, slugs.cover_url),"
+                " expires = CASE WHEN excluded.cover_url IS NULL"
+                " AND slugs.cover_url IS NOT NULL"
+                " THEN slugs.expires ELSE excluded.expires END",
+                [(book.slug, book.book_id, book.cover_url, expires) for book in books],
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO isbns (isbn, slug, expires) VALUES (?, ?, ?)",
+                [(book.isbn, book.slug, expires) for book in books if book.isbn],
+            )
+            for table in ("slugs", "isbns"):
+                self._evict(db, table, now)
+
+    def _evict(self, db, table: str, now: float):
+        # `table` is only ever one of the two above
+        db.execute(f"DELETE FROM {table} WHERE expires < ?", (now,))  # noqa: S608
+        (count,) = db.execute(f"SELECT count(*) FROM {table}").fetchone()  # noqa: S608
+        if count > self.max_entries:
+            db.execute(
+                f"DELETE FROM {table} WHERE rowid IN"  # noqa: S608
+                f" (SELECT rowid FROM {table} ORDER BY expires LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def book(self, slug: str) -> Optional[CachedBook]:
+        rows = self.query(
+            "SELECT slug, book_id, cover_url FROM slugs WHERE slug = ? AND expires >= ?",
+            (slug, time.time()),
+        )
+        return CachedBook(*rows[0]) if rows else None
+
+    def book_by_id(self, book_id: int) -> Optional[CachedBook]:
+        rows = self.query(
+            "SELECT slug, book_id, cover_url FROM slugs"
+            " WHERE book_id = ? AND expires >= ?",
+            (book_id, time.time()),
+        )
+        return CachedBook(*rows[0]) if rows else None
+
+    def slug_for_isbn(self, isbn: str) -> Optional[str]:
+        rows = self.query(
+            "SELECT slug FROM isbns WHERE isbn = ? AND expires >= ?",
+            (isbn, time.time()),
+        )
+        return rows[0]["slug"] if rows else None
+
+    def cover_url(self, slug: str) -> Optional[str]:
+        book = self.book(slug)
+        return book.cover_url if book else None
@@ -0,0 +1,66 @@
+from functools import lru_cache
+from typing import NamedTuple
+import re
+import unicodedata
+
+from pyjarowinkler import distance
+
+# Everything after a ":", " - ", "(" or "[" is treated as a subtitle
+_SUBTITLE_RE = re.compile(r"\s*(?::|\s[-–—]\s|\(|\[).*$")
+# Series markers such as "Vol. 2", "Book 3", "Part II" or "#4"
+_MARKER_RE = re.compile(
+    r"(?:\b(?:vol(?:ume)?|book|part|no)\.?\s*(?:\d+|[ivxlc]+)\b|#\s*\d+)"
+)
+_APOSTROPHE_RE = re.compile(r"['’`]")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]|_")
+
+
+class MatchTitle(NamedTuple):
+    full: str
+    # Without the subtitle, for comparing against titles that have none
+    base: str
+
+
+def _fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    # Recompose what is left (e.g. Hangul), as pyjarowinkler compares NFC
+    return unicodedata.normalize("NFC", stripped).casefold()
+
+
+def _clean(text: str) -> str:
+    text = _APOSTROPHE_RE.sub("", text)
+    return " ".join(_PUNCTUATION_RE.sub(" ", text).split())
+
+
+@lru_cache(maxsize=8192)
+def normalize_name(name: str) -> str:
+    # Casefolded, without diacritics or punctuation, so "J.R.R. Tolkien" and
+    # "J. R. R. Tolkien" compare equal
+    return _clean(_fold(name)) or name.casefold().strip()
+
+
+@lru_cache(maxsize=8192)
+def normalize_query(query: str) -> str:
+    # Casefolded words without diacritics or punctuation, so "Foo, Vol. 1"
+    # and "foo vol 1" are the same search
+    return _clean(_fold(query))
+
+
+@lru_cache(maxsize=8192)
+def normalize_title(title: str) -> MatchTitle:
+    folded = _fold(title)
+    full = _clean(_MARKER_RE.sub(" ", folded)) or folded.strip()
+    base = _clean(_MARKER_RE.sub(" ", _SUBTITLE_RE.sub("", folded))) or full
+    return MatchTitle(full, base)
+
+
+# Bounded memo of scores for normalized pairs, which recur across the title
+# and author filters and across books
+@lru_cache(maxsize=65536)
+def jaro_winkler(first: str, second: str, scaling: float = 0.1) -> float:
+    return distance.get_jaro_winkler_similarity(first, second, scaling=scaling)
+
+
+def name_similarity(first: str, second: str) -> float:
+    return jaro_winkler(normalize_name(first or ""), normalize_name(second or ""), 0.0)
@@ -0,0 +1,345 @@
+from dataclasses import asdict
+from datetime import datetime
+from typing import Callable, Optional, Sequence
+import json
+import sqlite3
+import time
+
+from .matching import normalize_name, normalize_title
+from .models import Book, Edition, Series, Tags, intern, make_author
+from .storage import SQLiteStore
+
+# Records older than this count as missing, so identify asks the API again
+MAX_AGE = 7 * 24 * 60 * 60
+# Books re-fetched per refresh, oldest first
+REFRESH_BATCH = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    slug TEXT,
+    canonical_id INTEGER,
+    data TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    -- When the book's editions were last fetched, rather than only the one
+    -- edition an edition or ISBN lookup returns with it
+    editions_fetched REAL
+);
+CREATE INDEX IF NOT EXISTS books_slug ON books (slug);
+CREATE INDEX IF NOT EXISTS books_fetched ON books (fetched);
+
+CREATE TABLE IF NOT EXISTS editions (
+    id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL,
+    isbn_13 TEXT,
+    isbn_10 TEXT,
+    asin TEXT,
+    language TEXT,
+    users_count INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    -- Whether the book's own editions query returned this edition, rather
+    -- than only an edition or ISBN lookup (which ignore the reading format)
+    listed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS editions_book ON editions (book_id);
+CREATE INDEX IF NOT EXISTS editions_isbn_13 ON editions (isbn_13);
+CREATE INDEX IF NOT EXISTS editions_isbn_10 ON editions (isbn_10);
+CREATE INDEX IF NOT EXISTS editions_asin ON editions (asin);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, authors, tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+
+def _dump_book(book: Book) -> str:
+    return json.dumps(
+        {
+            "id": book.id,
+            "title": book.title,
+            "slug": book.slug,
+            "series": asdict(book.series) if book.series else None,
+            "rating": book.rating,
+            "tags": book.tags.as_dict() if book.tags else None,
+            "description": book.description,
+            "canonical_id": book.canonical_id,
+        }
+    )
+
+
+def _load_book(data: str, editions: list[Edition]) -> Book:
+    book = json.loads(data)
+    return Book(
+        id=book["id"],
+        title=book["title"],
+        slug=book["slug"],
+        series=Series(intern(book["series"]["name"]), book["series"]["position"])  # pyright: ignore[reportArgumentType]
+        if book["series"]
+        else None,
+        rating=book["rating"],
+        tags=Tags(**book["tags"]) if book["tags"] else None,
+        description=book["description"],
+        editions=editions,
+        canonical_id=book["canonical_id"],
+    )
+
+
+def _dump_edition(edition: Edition) -> str:
+    data = edition.as_dict()
+    data["authors"] = [asdict(author) for author in edition.authors]
+    if edition.release_date:
+        data["release_date"] = edition.release_date.isoformat()
+    return json.dumps(data)
+
+
+def _load_edition(data: str) -> Edition:
+    edition = json.loads(data)
+    edition["authors"] = [make_author(**author) for author in edition["authors"]]
+    if edition["release_date"]:
+        edition["release_date"] = datetime.fromisoformat(edition["release_date"])
+    return Edition(**edition)
+
+
+def _terms(text: str) -> str:
+    # Normalized text is only words, so each can be quoted as it is
+    return " ".join(f'"{word}"' for word in text.split())
+
+
+def _placeholders(values: Sequence) -> str:
+    # Only ever "?"s, which is all that is formatted into the SQL here
+    return ", ".join("?" * len(values))
+
+
+class Mirror(SQLiteStore):
+    # A local copy of every book and edition the identifier decodes, which
+    # identify answers from first. Lookups return nothing for records that
+    # are missing or older than max_age, which then go to the API.
+    SCHEMA = SCHEMA
+
+    def __init__(self, path: str, max_age: float = MAX_AGE, timeout: float = 30.0):
+        super().__init__(path, timeout)
+        self.max_age = max_age
+        try:
+            self._connection().execute(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite without FTS5 - title searches always go to the API
+            self.fts = False
+
+    def _fresh(self) -> float:
+        return time.time() - self.max_age
+
+    def record(self, books: Sequence[Book], complete: bool = True):
+        # `complete` is False for books that came with only the editions an
+        # edition or ISBN lookup matched, which can't answer book lookups
+        now = time.time()
+        with self.transaction() as db:
+            for book in books:
+                db.execute(
+                    "INSERT INTO books"
+                    " (id, slug, canonical_id, data, fetched, editions_fetched)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (id) DO UPDATE SET"
+                    " slug = excluded.slug, canonical_id = excluded.canonical_id,"
+                    " data = excluded.data, fetched = excluded.fetched,"
+                    " editions_fetched ="
+                    " coalesce(excluded.editions_fetched, books.editions_fetched)",
+                    (
+                        book.id,
+                        book.slug,
+                        book.canonical_id,
+                        _dump_book(book),
+                        now,
+                        now if complete else None,
+                    ),
+                )
+                if complete:
+                    db.execute(
+                        "UPDATE editions SET listed = 0 WHERE book_id = ?", (book.id,)
+                    )
+                db.executemany(
+                    "INSERT INTO editions"
+                    " (id, book_id, isbn_13, isbn_10, asin, language, users_count,"
+                    " data, fetched, listed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (id) DO UPDATE SET"
+                    " book_id = excluded.book_id, isbn_13 = excluded.isbn_13,"
+                    " isbn_10 = excluded.isbn_10, asin = excluded.asin,"
+                    " language = excluded.language,"
+                    " users_count = excluded.users_count, data = excluded.data,"
+                    " fetched = excluded.fetched,"
+                    " listed = max(editions.listed, excluded.listed)",
+                    [
+                        (
+                            edition.id,
+                            book.id,
+                            edition.isbn_13 or None,
+                            edition.isbn_10 or None,
+                            edition.asin or None,
+                            edition.language,
+                            edition.users_count or 0,
+                            _dump_edition(edition),
+                            now,
+                            complete,
+                        )
+                        for edition in book.editions
+                    ],
+                )
+                if self.fts:
+                    self._index(db, book)
+
+    def _index(self, db: sqlite3.Connection, book: Book):
+        # Authors build up over the editions seen, which may be one at a time
+        authors = {
+            normalize_name(author.name)
+            for edition in book.editions
+            for author in edition.authors
+            if author.name
+        }
+        row = db.execute(
+            "SELECT authors FROM books_fts WHERE rowid = ?", (book.id,)
+        ).fetchone()
+        if row is not None:
+            authors.update(name for name in row["authors"].split("|") if name)
+            db.execute("DELETE FROM books_fts WHERE rowid = ?", (book.id,))
+        db.execute(
+            "INSERT INTO books_fts (rowid, title, authors) VALUES (?, ?, ?)",
+            (book.id, normalize_title(book.title).full, "|".join(sorted(authors))),
+        )
+
+    def _editions(
+        self, where: str, parameters: Sequence, languages: Optional[Sequence[str]]
+    ) -> list[sqlite3.Row]:
+        sql = f"SELECT book_id, data FROM editions WHERE {where} AND fetched >= ?"  # noqa: S608
+        parameters = [*parameters, self._fresh()]
+        if languages is not None:
+            sql += (
+                f" AND (language IS NULL OR language IN ({_placeholders(languages)}))"
+            )
+            parameters += languages
+        return self.query(sql + " ORDER BY users_count DESC", parameters)
+
+    def _with_books(self, editions: list[sqlite3.Row]) -> list[Book]:
+        # One book per edition, as the API's edition lookups return them
+        book_ids = list({row["book_id"] for row in editions})
+        books = {
+            row["id"]: row["data"]
+            for row in self.query(
+                f"SELECT id, data FROM books WHERE id IN ({_placeholders(book_ids)})",  # noqa: S608
+                book_ids,
+            )
+        }
+        return [
+            _load_book(books[row["book_id"]], [_load_edition(row["data"])])
+            for row in editions
+            if row["book_id"] in books
+        ]
+
+    def by_edition(self, edition_id: int) -> list[Book]:
+        return self._with_books(self._editions("id = ?", [edition_id], None))
+
+    def by_isbn_asin(self, isbn: str, asin: str) -> list[Book]:
+        conditions = []
+        parameters = []
+        if isbn:
+            conditions += ["isbn_13 = ?", "isbn_10 = ?"]
+            parameters += [isbn, isbn]
+        if asin:
+            conditions.append("asin = ?")
+            parameters.append(asin)
+        if not conditions:
+            return []
+        where = f"({' OR '.join(conditions)})"
+        return self._with_books(self._editions(where, parameters, None))
+
+    def books(self, book_ids: Sequence[int], languages: Sequence[str]) -> list[Book]:
+        # The fresh books of those given, in the same order, with their
+        # editions in the given languages (most read first)
+        return self._books(
+            f"id IN ({_placeholders(book_ids)})", book_ids, languages, book_ids
+        )
+
+    def by_slug(self, slug: str, languages: Sequence[str]) -> list[Book]:
+        return self._books("slug = ?", [slug], languages)
+
+    def _books(
+        self,
+        where: str,
+        parameters: Sequence,
+        languages: Sequence[str],
+        order: Optional[Sequence[int]] = None,
+    ) -> list[Book]:
+        rows = self.query(
+            f"SELECT id, data FROM books WHERE {where} AND editions_fetched >= ?",  # noqa: S608
+            [*parameters, self._fresh()],
+        )
+        if not rows:
+            return []
+        ids = [row["id"] for row in rows]
+        editions: dict[int, list[Edition]] = {book_id: [] for book_id in ids}
+        # Only the editions the book queries return, not every one looked up
+        where = f"book_id IN ({_placeholders(ids)}) AND listed"
+        for row in self._editions(where, ids, languages):
+            editions[row["book_id"]].append(_load_edition(row["data"]))
+        books = {
+            row["id"]: _load_book(row["data"], editions[row["id"]]) for row in rows
+        }
+        if order is None:
+            return list(books.values())
+        return [books[book_id] for book_id in order if book_id in books]
+
+    def search(self, title: str, author: Optional[str], limit: int = 50) -> list[int]:
+        # Ids of the books matching every word of the title (and author), best
+        # match first
+        if not self.fts:
+            return []
+        words = _terms(normalize_title(title).full)
+        if not words:
+            return []
+        match = f"title : ({words})"
+        if author and (names := _terms(normalize_name(author))):
+            match += f" AND authors : ({names})"
+        rows = self.query(
+            "SELECT rowid FROM books_fts WHERE books_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit),
+        )
+        return [row["rowid"] for row in rows]
+
+    def stale_book_ids(self, limit: int = REFRESH_BATCH) -> list[int]:
+        # Books past half their max age, oldest first, so a regular refresh
+        # gets to them before identify would have to
+        rows = self.query(
+            "SELECT id FROM books WHERE fetched < ? ORDER BY fetched LIMIT ?",
+            (time.time() - self.max_age / 2, limit),
+        )
+        return [row["id"] for row in rows]
+
+    def refresh(
+        self, fetch: Callable[[list[int]], list[Book]], limit: int = REFRESH_BATCH
+    ) -> int:
+        # Re-fetches the stalest books with `fetch`, which records them again
+        # through the identifier. Books the API no longer returns are dropped.
+        book_ids = self.stale_book_ids(limit)
+        if not book_ids:
+            return 0
+        found = {book.id for book in fetch(book_ids)}
+        self.forget([book_id for book_id in book_ids if book_id not in found])
+        return len(book_ids)
+
+    def forget(self, book_ids: Sequence[int]):
+        if not book_ids:
+            return
+        placeholders = _placeholders(book_ids)
+        with self.transaction() as db:
+            db.execute(f"DELETE FROM books WHERE id IN ({placeholders})", book_ids)  # noqa: S608
+            db.execute(
+                f"DELETE FROM editions WHERE book_id IN ({placeholders})",  # noqa: S608
+                book_ids,
+            )
+            if self.fts:
+                db.execute(
+                    f"DELETE FROM books_fts WHERE rowid IN ({placeholders})",  # noqa: S608
+                    book_ids,
+                )
@@ -1,43 +1,220 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional, Any
+from functools import lru_cache
+from typing import Any, Callable, Iterable, List, Optional
+import sys
 
+# Models are slotted, and the strings that repeat across editions (titles,
+# languages, publishers, roles and names) are interned, as a bulk run can
+# hold thousands of editions at once
 
-@dataclass
+
+def intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True, frozen=True)
 class Series:
     name: str
     position: Optional[float]
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Author:
     name: str
     contribution: str
 
 
-@dataclass
+@lru_cache(maxsize=4096)
+def make_author(name: str, contribution: str) -> Author:
+    # Authors are immutable, so every edition by the same people shares them
+    return Author(intern(name), intern(contribution))  # pyright: ignore[reportArgumentType]
+
+
+# Edition fields only build_metadata reads, decoded when first accessed
+DETAILS = (
+    "isbn_13",
+    "asin",
+    "image",
+    "language",
+    "publisher",
+    "release_date",
+    "isbn_10",
+)
+FIELDS = ("id", "title", "authors", "users_count", *DETAILS)
+
+
 class Edition:
-    id: int
-    isbn_13: Optional[str]
-    asin: Optional[str]
-    title: str
-    authors: List[Author]
-    image: Optional[str]
-    language: Optional[str]
-    publisher: Optional[str]
-    users_count: int
-    release_date: Optional[datetime]
+    # The filters only read the title, authors and users_count, and most
+    # editions are dropped by them - the other fields stay undecoded until
+    # one of them is read, by `decode(source)` returning them in DETAILS order.
+    # The source is only the raw detail fields, not the whole response entry.
+    __slots__ = (
+        "id",
+        "title",
+        "authors",
+        "users_count",
+        "_source",
+        "_decode",
+        *(f"_{field}" for field in DETAILS),
+    )
+
+    def __init__(
+        self,
+        id: int,
+        isbn_13: Optional[str],
+        asin: Optional[str],
+        title: str,
+        authors: List[Author],
+        image: Optional[str],
+        language: Optional[str],
+        publisher: Optional[str],
+        users_count: int,
+        release_date: Optional[datetime],
+        isbn_10: Optional[str] = None,
+    ):
+        self.id = id
+        self.title = intern(title)
+        self.authors = authors
+        self.users_count = users_count
+        self._decode = None
+        self._source = None
+        self._set_details(
+            (isbn_13, asin, image, language, publisher, release_date, isbn_10)
+        )
+
+    @classmethod
+    def lazy(
+        cls,
+        id: int,
+        title: str,
+        authors: List[Author],
+        users_count: int,
+        source: Any,
+        decode: Callable[[Any], tuple],
+    ) -> "Edition":
+        edition = cls.__new__(cls)
+        edition.id = id
+        edition.title = intern(title)
+        edition.authors = authors
+        edition.users_count = users_count
+        edition._source = source
+        edition._decode = decode
+        return edition
+
+    def _set_details(self, details: tuple):
+        isbn_13, asin, image, language, publisher, release_date, isbn_10 = details
+        self._isbn_13 = isbn_13
+        self._asin = asin
+        self._image = image
+        self._language = intern(language)
+        self._publisher = intern(publisher)
+        self._release_date = release_date
+        self._isbn_10 = isbn_10
+
+    def _details(self):
+        if self._decode is not None:
+            self._set_details(self._decode(self._source))
+            # The raw fields aren't needed once decoded
+            self._decode = None
+            self._source = None
+
+    @property
+    def decoded(self) -> bool:
+        return self._decode is None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Edition):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self) -> str:
+        if not self.decoded:
+            return f"Edition(id={self.id!r}, title={self.title!r}, ...)"
+        fields = ", ".join(f"{key}={value!r}" for key, value in self.as_dict().items())
+        return f"Edition({fields})"
+
+
+def _detail(name: str) -> property:
+    slot = f"_{name}"
+
+    def get(self: Edition):
+        self._details()
+        return getattr(self, slot)
+
+    def set(self: Edition, value):
+        self._details()
+        setattr(self, slot, value)
+
+    return property(get, set)
+
+
+for _name in DETAILS:
+    setattr(Edition, _name, _detail(_name))
 
 
-@dataclass
 class Tags:
-    genre: List[str]
-    mood: List[str]
-    content_warning: List[str]
-    tag: List[str]
+    # Every tag name in one tuple, with where each category ends - lists
+    # are only built when a category is read
+    __slots__ = ("_names", "_ends")
+
+    CATEGORIES = ("genre", "mood", "content_warning", "tag")
+
+    def __init__(
+        self,
+        genre: Iterable[str] = (),
+        mood: Iterable[str] = (),
+        content_warning: Iterable[str] = (),
+        tag: Iterable[str] = (),
+    ):
+        names: list[str] = []
+        ends = []
+        for category in (genre, mood, content_warning, tag):
+            names.extend(sys.intern(name) for name in category)
+            ends.append(len(names))
+        self._names = tuple(names)
+        self._ends = tuple(ends)
+
+    def _category(self, index: int) -> list[str]:
+        start = self._ends[index - 1] if index else 0
+        return list(self._names[start : self._ends[index]])
+
+    @property
+    def genre(self) -> list[str]:
+        return self._category(0)
+
+    @property
+    def mood(self) -> list[str]:
+        return self._category(1)
+
+    @property
+    def content_warning(self) -> list[str]:
+        return self._category(2)
 
+    @property
+    def tag(self) -> list[str]:
+        return self._category(3)
 
-@dataclass
+    def as_dict(self) -> dict[str, list[str]]:
+        return {
+            category: self._category(index)
+            for index, category in enumerate(self.CATEGORIES)
+        }
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Tags):
+            return NotImplemented
+        return self._names == other._names and self._ends == other._ends
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{key}={value!r}" for key, value in self.as_dict().items())
+        return f"Tags({fields})"
+
+
+@dataclass(slots=True)
 class Book:
     id: int
     title: str
@@ -48,6 +225,8 @@ class Book:
     description: Optional[str]
     editions: List[Edition]
     canonical_id: Optional[int]
+    # Images of the book's best other matching editions, for get_best_cover
+    cover_candidates: tuple[str, ...] = ()
 
 
 def create_authors(data: Optional[list[dict[str, Any]]]) -> list[Author]:
@@ -58,44 +237,56 @@ def create_authors(data: Optional[list[dict[str, Any]]]) -> list[Author]:
         author = entry.get("author", {})
         name = author.get("name")
         contribution = entry.get("contribution") or "Author"
-        authors.append(Author(name, contribution))
+        authors.append(make_author(name, contribution))
     return authors
 
 
 def create_series(data: Optional[dict[str, Any]]) -> Optional[Series]:
     if not data:
         return None
-    return Series(name=data["series"]["name"], position=data["position"])
+    return Series(name=intern(data["series"]["name"]), position=data["position"])  # pyright: ignore[reportArgumentType]
 
 
 def create_tags(data: Optional[dict[str, Any]]) -> Optional[Tags]:
     if not data:
         return None
     return Tags(
-        genre=[tag["tag"] for tag in data.get("Genre", [])],
-        mood=[tag["tag"] for tag in data.get("Mood", [])],
-        content_warning=[tag["tag"] for tag in data.get("Content Warning", [])],
-        tag=[tag["tag"] for tag in data.get("Tag", [])],
+        genre=(tag["tag"] for tag in data.get("Genre", [])),
+        mood=(tag["tag"] for tag in data.get("Mood", [])),
+        content_warning=(tag["tag"] for tag in data.get("Content Warning", [])),
+        tag=(tag["tag"] for tag in data.get("Tag", [])),
     )
 
 
-def map_edition_data(data: dict[str, Any]) -> Edition:
-    release_date = (
-        datetime.strptime(data["release_date"], "%Y-%m-%d")
-        if data["release_date"]
-        else None
+def _edition_source(data: dict[str, Any]) -> tuple:
+    # Only the raw detail fields, so the rest of the entry can be freed
+    return (
+        data["isbn_13"],
+        data["asin"],
+        (data.get("image") or {}).get("url"),
+        intern((data.get("language") or {}).get("code3")),
+        intern((data.get("publisher") or {}).get("name")),
+        data["release_date"],
+        data.get("isbn_10"),
     )
-    return Edition(
+
+
+def _edition_details(source: tuple) -> tuple:
+    *fields, release_date, isbn_10 = source
+    # fromisoformat is several times faster than strptime for plain dates
+    if release_date:
+        release_date = datetime.fromisoformat(release_date)
+    return (*fields, release_date or None, isbn_10)
+
+
+def map_edition_data(data: dict[str, Any]) -> Edition:
+    return Edition.lazy(
         id=data["id"],
-        isbn_13=data["isbn_13"],
-        asin=data["asin"],
         title=data["title"],
         authors=create_authors(data.get("contributors", [])),
-        image=(data.get("image") or {}).get("url"),
-        language=(data.get("language") or {}).get("code3"),
-        publisher=(data.get("publisher") or {}).get("name"),
         users_count=data.get("users_count", 0),
-        release_date=release_date,
+        source=_edition_source(data),
+        decode=_edition_details,
     )
 
 
@@ -1,27 +1,206 @@
+import asyncio
+import os
 import queue
+import sqlite3
 import threading
+import time
+from functools import cached_property
 from queue import Queue
 from typing import Optional
 
+from calibre import get_proxies
+from calibre.constants import cache_dir
 from calibre.ebooks.metadata.book.base import Metadata
 from calibre.utils.logging import Log
 
+from graphql.async_client import AsyncGraphQLClient, EventLoopThread
+from graphql.cache import ResponseCache
 from graphql.client import GraphQLClient
+from graphql.instrumentation import MetricsCollector
+from graphql.pool import ConnectionPool
+from graphql.ratelimit import RateLimiter, RetryPolicy
 
-from .identifier import HardcoverIdentifier
-from .models import Book
+from .covers import CoverCache, Covers
+from .decoding import create_decoder
+from .identifiers import CachedBook, IdentifierCache
+from .identifier import (
+    LOOKUP_ASYNC,
+    LOOKUP_BATCHED,
+    LOOKUP_RACE,
+    HardcoverIdentifier,
+    IdentifyRequest,
+)
+from .mirror import Mirror
+from .search import SearchCache
+from .models import Book, Edition
+from .warmup import read_library, warm_up
 from ._version import __version__
 
 
 class HardcoverProvider:
     ID_NAME = "hardcover"
     API_URL = "https://api.hardcover.app/v1/graphql"
+    # The library warm-up runs at most this often, across processes
+    WARM_UP_INTERVAL = 24 * 60 * 60
+    # Hardcover allows 60 requests a minute per token - stay just under it
+    REQUESTS_PER_SECOND = 55 / 60
 
     def __init__(self, source):
         self.source = source
         self.prefs = source.prefs
         useragent = f"hardcover-calibre-plugin/{__version__} (https://github.com/RobBrazier/calibre-plugins)"
-        self.client = GraphQLClient(self.API_URL, useragent)
+        # The limiter state lives on disk so calibre's separate metadata
+        # worker processes share the one per-token budget
+        rate_limiter = RateLimiter(
+            self.REQUESTS_PER_SECOND,
+            burst=5,
+            state_file=os.path.join(cache_dir(), "hardcover-ratelimit"),
+        )
+        # Bulk downloads repeat the same searches and book lookups, e.g. when
+        # download_cover re-runs identify, so keep responses for a while
+        cache = ResponseCache(ttl=15 * 60)
+        retry = RetryPolicy(deadline=60)
+        # Per-request timings from both clients, e.g. for the CLI's --timings
+        self.metrics = MetricsCollector()
+        self.client = GraphQLClient(
+            self.API_URL,
+            useragent,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            retry=retry,
+            observers=[self.metrics],
+        )
+        self.async_client = AsyncGraphQLClient(
+            self.API_URL,
+            useragent,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            retry=retry,
+            observers=[self.metrics],
+        )
+        # None when msgspec is unavailable, leaving the plain dict decoding
+        self.decoder = create_decoder()
+        # Sync identify calls in async mode all share this one private loop
+        self.event_loop = EventLoopThread("hardcover-identify")
+        self.useragent = useragent
+        # The on-disk caches below are opened on first use
+        self.cache_path = os.path.join(cache_dir(), "hardcover-cache.sqlite")
+        # Opened on first use, while the local mirror option is on
+        self._mirror: Optional[Mirror] = None
+        self._mirror_lock = threading.Lock()
+        self._mirror_refreshed = False
+
+    @cached_property
+    def search_cache(self) -> Optional[SearchCache]:
+        # Searches that found nothing are remembered across runs too, so
+        # re-downloading metadata for unmatched books costs no requests
+        try:
+            return SearchCache(self.cache_path)
+        except sqlite3.Error:
+            return None
+
+    @cached_property
+    def identifier_cache(self) -> Optional[IdentifierCache]:
+        # Slugs, ids and cover URLs outlive the worker process that found them
+        try:
+            return IdentifierCache(self.cache_path)
+        except sqlite3.Error:
+            return None
+
+    @cached_property
+    def covers(self) -> Covers:
+        # Covers are kept on disk between runs, indexed in the same database
+        try:
+            cover_cache: Optional[CoverCache] = CoverCache(
+                self.cache_path, os.path.join(cache_dir(), "hardcover-covers")
+            )
+        except (sqlite3.Error, OSError):
+            cover_cache = None
+        # Through the same proxies as calibre's own browser
+        pool = ConnectionPool(maxsize=4, proxies=get_proxies(debug=False))
+        return Covers(self.useragent, cover_cache, pool)
+
+    def close(self):
+        # Stops any cover downloads still queued and closes every connection
+        if "covers" in self.__dict__:
+            self.covers.close()
+        self.client.close()
+        self.event_loop.close()
+
+    def get_mirror(self, log: Log) -> Optional[Mirror]:
+        if not self.prefs.get("local_mirror", False):
+            return None
+        with self._mirror_lock:
+            if self._mirror is None:
+                try:
+                    self._mirror = Mirror(
+                        os.path.join(cache_dir(), "hardcover-mirror.sqlite")
+                    )
+                except sqlite3.Error as e:
+                    log.warn(f"Unable to open the local mirror: {e}")
+            return self._mirror
+
+    def _refresh_mirror(self, identifier: HardcoverIdentifier):
+        # Once a session, re-fetch the stalest mirrored books in the background
+        if identifier.mirror is None or self._mirror_refreshed:
+            return
+        self._mirror_refreshed = True
+        threading.Thread(
+            target=self._run_mirror_refresh,
+            args=(identifier,),
+            name="hardcover-mirror-refresh",
+            daemon=True,
+        ).start()
+
+    def _run_mirror_refresh(self, identifier: HardcoverIdentifier):
+        try:
+            count = identifier.mirror.refresh(identifier.get_books_by_ids)  # pyright: ignore[reportOptionalMemberAccess]
+            identifier.log.info(f"Refreshed {count} books in the local mirror")
+        except Exception as e:
+            identifier.log.warn(f"Unable to refresh the local mirror: {e}")
+
+    def warm_up(self, log: Log, library_path: Optional[str] = None):
+        # Preloads the identifier cache from the library in the background,
+        # so cover downloads for linked books need no identify
+        if self.identifier_cache is None:
+            return
+        marker = os.path.join(cache_dir(), "hardcover-warmup")
+        try:
+            if time.time() - os.path.getmtime(marker) < self.WARM_UP_INTERVAL:
+                return
+        except OSError:
+            pass
+        try:
+            with open(marker, "w"):
+                pass
+        except OSError as e:
+            log.warn(f"Unable to start the cache warm-up: {e}")
+            return
+        threading.Thread(
+            target=self._run_warm_up,
+            args=(log, library_path),
+            name="hardcover-warm-up",
+            daemon=True,
+        ).start()
+
+    def _run_warm_up(self, log: Log, library_path: Optional[str]):
+        try:
+            if library_path is None:
+                from calibre.utils.config import prefs
+
+                library_path = prefs["library_path"]
+            if not library_path:
+                return
+            books = read_library(os.path.join(library_path, "metadata.db"))
+            identifier = self._create_identifier(log)
+            count = warm_up(
+                self.identifier_cache,  # pyright: ignore[reportArgumentType]
+                books,
+                identifier.get_books_by_editions,
+            )
+            log.info(f"Warmed the identifier cache with {count} books")
+        except Exception as e:
+            log.warn(f"Unable to warm the identifier cache: {e}")
 
     def get_book_url(self, identifiers) -> tuple[str, str, str] | None:
         hardcover_slug: str | None = identifiers.get(
@@ -35,6 +214,66 @@ class HardcoverProvider:
             )
         return None
 
+    def get_cached_cover_url(self, identifiers) -> Optional[str]:
+        # Calibre's in-memory caches first, then the ones on disk
+        slug = identifiers.get(f"{self.ID_NAME}-slug") or identifiers.get(self.ID_NAME)
+        isbn = identifiers.get("isbn")
+        if not slug and isbn:
+            slug = self.source.cached_isbn_to_identifier(isbn)
+        if slug and (url := self.source.cached_identifier_to_cover_url(slug)):
+            return url
+        if self.identifier_cache is None:
+            return None
+        try:
+            cached = self._cached_book(
+                slug, isbn, identifiers.get(f"{self.ID_NAME}-id")
+            )
+        except sqlite3.Error:
+            return None
+        if cached is None or not cached.cover_url:
+            return None
+        self.source.cache_identifier_to_cover_url(cached.slug, cached.cover_url)
+        return cached.cover_url
+
+    def _cached_book(
+        self, slug: Optional[str], isbn: Optional[str], book_id: Optional[str]
+    ) -> Optional[CachedBook]:
+        cache: IdentifierCache = self.identifier_cache  # pyright: ignore[reportAssignmentType]
+        if not slug and isbn:
+            slug = cache.slug_for_isbn(isbn)
+        if slug:
+            return cache.book(slug)
+        if book_id and book_id.isdigit():
+            return cache.book_by_id(int(book_id))
+        return None
+
+    def _remember(self, log: Log, book: Book, edition: Edition):
+        if self.identifier_cache is None:
+            return
+        try:
+            self.identifier_cache.put(
+                [CachedBook(book.slug, book.id, edition.image, edition.isbn_13)]
+            )
+        except sqlite3.Error as e:
+            log.warn(f"Unable to cache identifiers for {book.slug}: {e}")
+
+    def _create_identifier(self, log: Log, timeout=30) -> HardcoverIdentifier:
+        return HardcoverIdentifier(
+            self.client,
+            log,
+            self.ID_NAME,
+            self.prefs.get("api_key"),
+            self.prefs.get("match_sensitivity"),
+            self.prefs.get("languages").split(","),
+            timeout,
+            self.prefs.get("lookup_mode", LOOKUP_BATCHED),
+            self.async_client,
+            decoder=self.decoder,
+            good_enough=self.prefs.get("good_enough_score") or None,
+            mirror=self.get_mirror(log),
+            search_cache=self.search_cache,
+        )
+
     def identify(
         self,
         log: Log,
@@ -45,20 +284,72 @@ class HardcoverProvider:
         identifiers={},
         timeout=30,
     ):
-        identifier = HardcoverIdentifier(
-            self.client,
-            log,
-            self.ID_NAME,
-            self.prefs.get("api_key"),
-            self.prefs.get("match_sensitivity"),
-            self.prefs.get("languages").split(","),
-            timeout,
+        identifier = self._create_identifier(log, timeout)
+        # Racing goes through the event loop too, so losers can be cancelled
+        if identifier.lookup_mode in (LOOKUP_ASYNC, LOOKUP_RACE):
+            candidate_books = self.event_loop.run(
+                identifier.find_candidates_async(title, authors, identifiers)
+            )
+        else:
+            candidate_books = identifier.find_candidates(title, authors, identifiers)
+
+        self._stream(log, result_queue, abort, identifier, candidate_books, authors)
+        self._refresh_mirror(identifier)
+        return None
+
+    async def identify_async(
+        self,
+        log: Log,
+        result_queue: queue.Queue,
+        abort: threading.Event,
+        title: Optional[str] = None,
+        authors: Optional[list[str]] = None,
+        identifiers={},
+        timeout=30,
+    ):
+        identifier = self._create_identifier(log, timeout)
+        candidate_books = await identifier.find_candidates_async(
+            title, authors, identifiers
+        )
+        # Filtering may page through more editions with the sync client, so
+        # it runs off the event loop
+        await asyncio.to_thread(
+            self._stream, log, result_queue, abort, identifier, candidate_books, authors
         )
-        books = identifier.identify(title, authors, identifiers)
+        self._refresh_mirror(identifier)
+        return None
 
-        for book in books:
+    def _stream(
+        self,
+        log: Log,
+        result_queue: queue.Queue,
+        abort: threading.Event,
+        identifier: HardcoverIdentifier,
+        candidate_books: list[Book],
+        authors: Optional[list[str]],
+    ):
+        # Each book goes to calibre as soon as its edition is picked, rather
+        # than once the filters are done with every candidate
+        for book in identifier.iter_matches(candidate_books, authors):
             self.enqueue(log, result_queue, abort, book)
-        return None
+
+    def identify_many(
+        self,
+        log: Log,
+        requests: list[IdentifyRequest],
+        timeout=30,
+    ) -> list[list[Metadata]]:
+        # Metadata for each (title, authors, identifiers) request, in order
+        identifier = self._create_identifier(log, timeout)
+        results = []
+        for books in identifier.identify_many(requests):
+            metadata = [self.build_metadata(log, book) for book in books]
+            metadata = [meta for meta in metadata if meta]
+            for meta in metadata:
+                self.source.clean_downloaded_metadata(meta)
+            results.append(metadata)
+        self._refresh_mirror(identifier)
+        return results
 
     def init_metadata(self, title: str, authors: list[str]):
         return Metadata(title, authors)
@@ -88,6 +379,10 @@ class HardcoverProvider:
         if edition.image:
             meta.has_cover = True
             self.source.cache_identifier_to_cover_url(book.slug, edition.image)
+            self.covers.remember_candidates(edition.image, book.cover_candidates)
+            # Start downloading now - calibre asks for the cover next
+            if self.prefs.get("prefetch_covers", True):
+                self.covers.prefetch(edition.image)
         else:
             meta.has_cover = False
         if edition.publisher:
@@ -99,11 +394,20 @@ class HardcoverProvider:
             meta.rating = book.rating * 2
         if edition.release_date:
             meta.pubdate = edition.release_date
+        self._remember(log, book, edition)
         if book.tags:
             # Combine Tags and Genre
             meta.tags = book.tags.tag + book.tags.genre
         return meta
 
+    def download_cover(
+        self, log: Log, url: str, timeout=30, get_best_cover=False
+    ) -> bytes:
+        if get_best_cover:
+            url = self.covers.best(self.covers.candidates(url), timeout) or url
+        log("Downloading cover from: ", url)
+        return self.covers.fetch(url, timeout)
+
     def enqueue(
         self, log: Log, result_queue: Queue, shutdown: threading.Event, book: Book
     ):
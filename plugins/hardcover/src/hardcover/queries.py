@@ -1,4 +1,8 @@
-SEARCH_BY_NAME = """
+# Compiled once at import: minified, with only the fragments each query uses
+from graphql.document import compile_document
+
+SEARCH_BY_NAME = compile_document(
+    """
 query Search($query: String!) {
   search(query: $query, query_type: "Book", per_page: 50) {
     ids
@@ -6,12 +10,14 @@ query Search($query: String!) {
   }
 }
 """
+)
 
 FRAGMENTS = """
 fragment EditionData on editions {
   title
   id
   isbn_13
+  isbn_10
   asin
   contributors: cached_contributors
   image: cached_image
@@ -39,8 +45,9 @@ fragment BookData on books {
 }
 """
 
-FIND_BOOK_BY_SLUG = """
-query FindBookBySlug($slug: String, $languages: [String!]) {
+FIND_BOOK_BY_SLUG = compile_document(
+    """
+query FindBookBySlug($slug: String, $languages: [String!], $limit: Int) {
   books(
     where: {
       slug: {_eq: $slug}
@@ -58,15 +65,19 @@ query FindBookBySlug($slug: String, $languages: [String!]) {
         }
       }
       order_by: {users_count: desc_nulls_last, language_id: desc_nulls_last}
+      limit: $limit
     ) {
       ...EditionData
     }
   }
 }
-"""
+""",
+    FRAGMENTS,
+)
 
-FIND_BOOK_BY_ID = """
-query FindBookById($id: Int!, $languages: [String!]) {
+FIND_BOOK_BY_ID = compile_document(
+    """
+query FindBookById($id: Int!, $languages: [String!], $limit: Int) {
   books: books_by_pk(id: $id) {
     ...BookData
     editions(
@@ -80,14 +91,18 @@ query FindBookById($id: Int!, $languages: [String!]) {
         }
       }
       order_by: {users_count: desc_nulls_last, language_id: desc_nulls_last}
+      limit: $limit
     ) {
       ...EditionData
     }
   }
 }
-"""
+""",
+    FRAGMENTS,
+)
 
-FIND_BOOK_BY_ISBN_OR_ASIN = """
+FIND_BOOK_BY_ISBN_OR_ASIN = compile_document(
+    """
 query FindBookByIsbnOrAsin($isbn: String, $asin: String) {
   editions(
     where: {
@@ -114,9 +129,12 @@ query FindBookByIsbnOrAsin($isbn: String, $asin: String) {
     }
   }
 }
-"""
+""",
+    FRAGMENTS,
+)
 
-FIND_BOOK_BY_EDITION = """
+FIND_BOOK_BY_EDITION = compile_document(
+    """
 query FindBookByEdition($edition: Int!) {
   editions: editions_by_pk(id: $edition) {
     ...EditionData
@@ -125,11 +143,13 @@ query FindBookByEdition($edition: Int!) {
     }
   }
 }
-"""
-
+""",
+    FRAGMENTS,
+)
 
-FIND_BOOKS_BY_IDS = """
-query FindBooksByIds($ids: [Int!], $languages: [String!]) {
+FIND_BOOKS_BY_IDS = compile_document(
+    """
+query FindBooksByIds($ids: [Int!], $languages: [String!], $limit: Int) {
   books(
     where: {
       id: {_in: $ids}
@@ -153,9 +173,131 @@ query FindBooksByIds($ids: [Int!], $languages: [String!]) {
         users_count: desc_nulls_last,
         language_id: desc_nulls_last
       }
+      limit: $limit
     ) {
       ...EditionData
     }
   }
 }
-"""
+""",
+    FRAGMENTS,
+)
+
+# The next page of editions for books whose first page had no match
+FIND_BOOK_EDITIONS = compile_document(
+    """
+query FindBookEditions(
+  $ids: [Int!],
+  $languages: [String!],
+  $limit: Int,
+  $offset: Int
+) {
+  books(
+    where: {
+      id: {_in: $ids}
+    }
+  ) {
+    ...BookData
+    editions(
+      where: {
+        reading_format_id: {_in: [1, 4]},
+        language: {
+          _or: [
+            {code3: {_in: $languages}},
+            {code3: {_is_null: true}}
+          ]
+        }
+      }
+      order_by: {users_count: desc_nulls_last, language_id: desc_nulls_last}
+      limit: $limit
+      offset: $offset
+    ) {
+      ...EditionData
+    }
+  }
+}
+""",
+    FRAGMENTS,
+)
+
+# Bulk lookups for identify_many, one query per identifier type
+
+FIND_BOOKS_BY_EDITIONS = compile_document(
+    """
+query FindBooksByEditions($ids: [Int!]) {
+  editions(
+    where: {
+      id: {_in: $ids}
+    }
+  ) {
+    ...EditionData
+    book {
+      ...BookData
+    }
+  }
+}
+""",
+    FRAGMENTS,
+)
+
+FIND_BOOKS_BY_ISBNS_OR_ASINS = compile_document(
+    """
+query FindBooksByIsbnsOrAsins($isbns: [String!], $asins: [String!]) {
+  editions(
+    where: {
+      _and: [
+        {
+          _or: [
+            {isbn_13: {_in: $isbns}},
+            {isbn_10: {_in: $isbns}},
+            {asin: {_in: $asins}}
+          ]
+        },
+        {
+          reading_format_id: {_in: [1, 4]}
+        }
+      ]
+    }
+    order_by: {
+      users_count: desc_nulls_last
+    }
+  ) {
+    ...EditionData
+    book {
+      ...BookData
+    }
+  }
+}
+""",
+    FRAGMENTS,
+)
+
+FIND_BOOKS_BY_SLUGS = compile_document(
+    """
+query FindBooksBySlugs($slugs: [String!], $languages: [String!], $limit: Int) {
+  books(
+    where: {
+      slug: {_in: $slugs}
+    }
+  ) {
+    ...BookData
+    editions(
+      where: {
+        reading_format_id: {_in: [1, 4]},
+        language: {
+          _or: [
+            {code3: {_in: $languages}},
+            {code3: {_is_null: true}}
+          ]
+        }
+      }
+      order_by: {users_count: desc_nulls_last, language_id: desc_nulls_last}
+      limit: $limit
+    ) {
+      ...EditionData
+    }
+  }
+}
+""",
+    FRAGMENTS,
+)
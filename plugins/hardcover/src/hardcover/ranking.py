@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+import heapq
+
+T = TypeVar("T")
+
+# Candidates are scored this many at a time, so the scorer can still batch
+# while stages further down stop pulling once they have what they need
+CHUNK_SIZE = 32
+
+
+class Candidate(NamedTuple):
+    score: float
+    # Position in the input, which breaks ties between equal scores
+    index: int
+    item: Any
+
+
+@dataclass
+class StageStats:
+    seen: int = 0
+    dropped: int = 0
+
+
+class RankingStats:
+    def __init__(self):
+        self.stages: dict[str, StageStats] = {}
+
+    def stage(self, name: str) -> StageStats:
+        return self.stages.setdefault(name, StageStats())
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{name} dropped {stats.dropped}/{stats.seen}"
+            for name, stats in self.stages.items()
+        )
+
+
+def scored(
+    items: Iterable[T],
+    score: Callable[[list[T]], Sequence[float]],
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Candidate]:
+    iterator = iter(items)
+    index = 0
+    while chunk := list(islice(iterator, chunk_size)):
+        for similarity, item in zip(score(chunk), chunk):
+            yield Candidate(similarity, index, item)
+            index += 1
+
+
+def at_least(
+    candidates: Iterable[Candidate],
+    minimum: float,
+    stats: StageStats,
+    on_drop: Optional[Callable[[Candidate], None]] = None,
+) -> Iterator[Candidate]:
+    for candidate in candidates:
+        stats.seen += 1
+        if candidate.score < minimum:
+            stats.dropped += 1
+            if on_drop is not None:
+                on_drop(candidate)
+            continue
+        yield candidate
+
+
+def until_good_enough(
+    candidates: Iterable[Candidate],
+    good_enough: Optional[float],
+    count: int,
+    total: int,
+    stats: StageStats,
+) -> Iterator[Candidate]:
+    # Stops pulling (and scoring) candidates once `count` of them reached the
+    # good enough score - the rest of the `total` inputs count as dropped
+    stats.seen += total
+    if good_enough is None or count <= 0:
+        yield from candidates
+        return
+    found = 0
+    for candidate in candidates:
+        yield candidate
+        if candidate.score >= good_enough:
+            found += 1
+            if found >= count:
+                stats.dropped += total - candidate.index - 1
+                return
+
+
+def top_k(candidates: Iterable[Candidate], k: int, stats: StageStats) -> list:
+    # Best first, keeping input order between equal scores, in O(n log k)
+    seen = 0
+
+    def counted() -> Iterator[Candidate]:
+        nonlocal seen
+        for candidate in candidates:
+            seen += 1
+            yield candidate
+
+    if k > 0:
+        best = heapq.nlargest(k, counted(), key=lambda c: c.score)
+    else:
+        best = sorted(counted(), key=lambda c: c.score, reverse=True)
+    stats.seen += seen
+    stats.dropped += seen - len(best)
+    return [candidate.item for candidate in best]
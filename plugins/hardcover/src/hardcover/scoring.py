@@ -0,0 +1,171 @@
+from typing import Optional, Protocol, Sequence
+
+from .matching import MatchTitle, jaro_winkler, normalize_name
+from .models import Edition
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from rapidfuzz import process as rapidfuzz_process
+    from rapidfuzz.distance import Jaro
+except ImportError:
+    rapidfuzz_process = None
+
+# pyjarowinkler rounds every score to this many decimals
+DECIMALS = 2
+PREFIX_LENGTH = 4
+
+
+class SimilarityBackend(Protocol):
+    name: str
+
+    def matrix(
+        self, queries: Sequence[str], choices: Sequence[str], scaling: float
+    ) -> Sequence[Sequence[float]]: ...
+
+
+class PyJaroWinklerBackend:
+    # The reference implementation, one (memoized) call per pair
+    name = "pyjarowinkler"
+
+    def matrix(
+        self, queries: Sequence[str], choices: Sequence[str], scaling: float
+    ) -> list[list[float]]:
+        return [
+            [jaro_winkler(query, choice, scaling) for choice in choices]
+            for query in queries
+        ]
+
+
+class RapidFuzzBackend:
+    # Jaro scores for the whole matrix in one C call, with pyjarowinkler's
+    # prefix boost and rounding reproduced on top in numpy
+    name = "rapidfuzz"
+
+    def __init__(self):
+        if rapidfuzz_process is None or np is None:
+            raise RuntimeError("RapidFuzzBackend requires rapidfuzz and numpy")
+
+    @staticmethod
+    def _prefixes(strings: Sequence[str], padding: int):
+        codes = np.full((len(strings), PREFIX_LENGTH), padding, dtype=np.int64)
+        for row, string in enumerate(strings):
+            prefix = [ord(c) for c in string[:PREFIX_LENGTH]]
+            codes[row, : len(prefix)] = prefix
+        return codes
+
+    def matrix(self, queries: Sequence[str], choices: Sequence[str], scaling: float):
+        jaro = rapidfuzz_process.cdist(
+            queries, choices, scorer=Jaro.normalized_similarity, dtype=np.float64
+        )
+        if scaling:
+            # Padding differs on each side, so it never counts as a match
+            same = (
+                self._prefixes(queries, -1)[:, None, :]
+                == (self._prefixes(choices, -2)[None, :, :])
+            )
+            prefix = np.cumprod(same, axis=2).sum(axis=2)
+            jaro = jaro + (prefix * scaling * (1 - jaro))
+        return _round(jaro)
+
+
+def _round(scores):
+    # np.round can differ from round() on values just below a half, e.g.
+    # 0.835 is 0.83499..., so those few are rounded the way pyjarowinkler does
+    scaled = scores * 10**DECIMALS
+    rounded = np.round(scores, DECIMALS)
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-9)
+    flat = rounded.reshape(-1)
+    for index in ties:
+        flat[index] = round(float(scores.flat[index]), DECIMALS)
+    return rounded
+
+
+BACKENDS = {
+    PyJaroWinklerBackend.name: PyJaroWinklerBackend,
+    RapidFuzzBackend.name: RapidFuzzBackend,
+}
+
+
+def create_backend(name: Optional[str] = None) -> SimilarityBackend:
+    if name is not None:
+        return BACKENDS[name]()
+    if rapidfuzz_process is not None and np is not None:
+        return RapidFuzzBackend()
+    return PyJaroWinklerBackend()
+
+
+class SimilarityScorer:
+    # Scores whole candidate lists at once: every distinct pair is compared in
+    # one backend call, then weighted per candidate
+    def __init__(self, backend: Optional[SimilarityBackend] = None):
+        self.backend = backend or create_backend()
+
+    def title_scores(
+        self, query: MatchTitle, candidates: Sequence[MatchTitle]
+    ) -> list[float]:
+        # A subtitle on only one side shouldn't count against the match, so
+        # those pairs compare the titles without subtitles
+        query_has_subtitle = query.full != query.base
+        pairs = [
+            (True, candidate.base)
+            if query_has_subtitle != (candidate.full != candidate.base)
+            else (False, candidate.full)
+            for candidate in candidates
+        ]
+        columns: dict[str, int] = {}
+        for _, choice in pairs:
+            columns.setdefault(choice, len(columns))
+        full_row, base_row = self.backend.matrix(
+            [query.full, query.base], list(columns), 0.1
+        )
+        return [
+            float((base_row if base else full_row)[columns[choice]])
+            for base, choice in pairs
+        ]
+
+    def author_scores(
+        self,
+        editions: Sequence[Edition],
+        authors: Sequence[str],
+        weights: dict[str, float],
+    ) -> list[float]:
+        # Mean over each edition's contributors of their best match against
+        # any of the given authors, weighted by contribution
+        queries = [normalize_name(author or "") for author in authors]
+        names: dict[str, int] = {}
+        index: list[int] = []
+        factors: list[float] = []
+        owners: list[int] = []
+        for owner, edition in enumerate(editions):
+            for author in edition.authors:
+                name = normalize_name(author.name or "")
+                index.append(names.setdefault(name, len(names)))
+                factors.append(weights.get(author.contribution, 1.0))
+                owners.append(owner)
+        if not names or not queries:
+            return [0.0] * len(editions)
+
+        matrix = self.backend.matrix(list(names), queries, 0.0)
+        if np is None:
+            best = [max(row) for row in matrix]
+            totals = [0.0] * len(editions)
+            counts = [0] * len(editions)
+            for i, factor, owner in zip(index, factors, owners):
+                totals[owner] += best[i] * factor
+                counts[owner] += 1
+            return [
+                total / count if count else 0.0 for total, count in zip(totals, counts)
+            ]
+
+        best = np.asarray(matrix, dtype=np.float64).max(axis=1)
+        weighted = best[np.asarray(index)] * np.asarray(factors)
+        totals = np.bincount(owners, weights=weighted, minlength=len(editions))
+        counts = np.bincount(owners, minlength=len(editions))
+        scores = np.divide(
+            totals, counts, out=np.zeros(len(editions)), where=counts > 0
+        )
+        return scores.tolist()
@@ -0,0 +1,148 @@
+from typing import Any, Iterator, NamedTuple, Optional, Sequence
+import json
+import time
+
+from .matching import name_similarity, normalize_query, normalize_title
+from .scoring import SimilarityScorer
+from .storage import SQLiteStore
+
+# Books fetched in full for the best search hits at first, doubling each
+# time none of them match
+SEARCH_WINDOW = 5
+
+
+# How long searches with hits, and searches with none, are cached for
+POSITIVE_TTL = 3 * 24 * 60 * 60
+NEGATIVE_TTL = 24 * 60 * 60
+
+
+class SearchHit(NamedTuple):
+    id: int
+    # None when the search didn't return the hit's document
+    title: Optional[str]
+    authors: list[str]
+
+
+def parse_search_hits(results: Any, ids: list[int]) -> list[SearchHit]:
+    # `results` holds the search documents, which carry enough to rank the
+    # hits before fetching any books - `ids` stays the authoritative order
+    if isinstance(results, str):
+        try:
+            results = json.loads(results)
+        except ValueError:
+            results = None
+    documents: dict[int, dict] = {}
+    hits = results.get("hits") if isinstance(results, dict) else None
+    for hit in hits or []:
+        document = hit.get("document") if isinstance(hit, dict) else None
+        if not isinstance(document, dict):
+            continue
+        try:
+            documents[int(document["id"])] = document
+        except (KeyError, TypeError, ValueError):
+            continue
+    return [
+        SearchHit(
+            book_id,
+            documents.get(book_id, {}).get("title"),
+            [
+                name
+                for name in documents.get(book_id, {}).get("author_names") or []
+                if name
+            ],
+        )
+        for book_id in ids
+    ]
+
+
+def prerank_hits(
+    hits: list[SearchHit],
+    title: str,
+    authors: Optional[Sequence[str]],
+    scorer: SimilarityScorer,
+    threshold: float,
+) -> tuple[list[SearchHit], list[SearchHit]]:
+    # Orders hits best first, hits by one of the authors ahead of the others
+    # and hits without a document last. Hits whose title is too distant are
+    # returned separately, to be fetched only once the rest didn't match: the
+    # search document can have another title (e.g. a translation) than
+    # editions that would still match.
+    titled = [hit for hit in hits if hit.title]
+    if not titled:
+        return hits, []
+    scores = scorer.title_scores(
+        normalize_title(title),
+        [normalize_title(hit.title) for hit in titled],  # pyright: ignore[reportArgumentType]
+    )
+    ranked = []
+    distant = []
+    for position, (hit, score) in enumerate(zip(titled, scores)):
+        by_author = not authors or any(
+            name_similarity(name, author) >= threshold
+            for name in hit.authors
+            for author in authors
+        )
+        key = (not by_author, -score, position, hit)
+        (ranked if score >= threshold else distant).append(key)
+    ranked.sort()
+    distant.sort()
+    untitled = [hit for hit in hits if not hit.title]
+    return [hit for *_, hit in ranked] + untitled, [hit for *_, hit in distant]
+
+
+def windows(hits: list[SearchHit], size: int = SEARCH_WINDOW) -> Iterator[list[int]]:
+    # Ids of the hits to fetch next, in windows that double in size
+    start = 0
+    while start < len(hits):
+        yield [hit.id for hit in hits[start : start + size]]
+        start += size
+        size *= 2
+
+
+class SearchCache(SQLiteStore):
+    # Search hits on disk, keyed by the normalized query. Searches that
+    # found nothing are kept too (for a shorter time), so books that didn't
+    # match aren't searched for again on every run.
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    query TEXT PRIMARY KEY,
+    hits TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_expires ON searches (expires);
+"""
+
+    def __init__(
+        self,
+        path: str,
+        positive_ttl: float = POSITIVE_TTL,
+        negative_ttl: float = NEGATIVE_TTL,
+        timeout: float = 30.0,
+    ):
+        super().__init__(path, timeout)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+
+    def get(self, query: str) -> Optional[list[SearchHit]]:
+        # None when the query isn't cached, an empty list for no results
+        rows = self.query(
+            "SELECT hits FROM searches WHERE query = ? AND expires >= ?",
+            (normalize_query(query), time.time()),
+        )
+        if not rows:
+            return None
+        return [
+            SearchHit(book_id, title, authors)
+            for book_id, title, authors in json.loads(rows[0]["hits"])
+        ]
+
+    def put(self, query: str, hits: list[SearchHit]):
+        now = time.time()
+        ttl = self.positive_ttl if hits else self.negative_ttl
+        with self.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO searches (query, hits, expires)"
+                " VALUES (?, ?, ?)",
+                (normalize_query(query), json.dumps(hits), now + ttl),
+            )
+            db.execute("DELETE FROM searches WHERE expires < ?", (now,))
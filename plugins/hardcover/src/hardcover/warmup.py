@@ -0,0 +1,89 @@
+from typing import Callable, NamedTuple, Optional
+from urllib.request import pathname2url
+import sqlite3
+
+from .identifiers import CachedBook, IdentifierCache
+from .models import Book
+
+# The identifiers calibre stores for books matched by this plugin (plus ISBNs)
+IDENTIFIER_TYPES = (
+    "hardcover",
+    "hardcover-slug",
+    "hardcover-id",
+    "hardcover-edition",
+    "isbn",
+)
+
+
+class LibraryBook(NamedTuple):
+    slug: Optional[str]
+    book_id: Optional[int]
+    edition_id: Optional[int]
+    isbn: Optional[str]
+
+
+def _int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value and value.isdigit() else None
+
+
+def read_library(path: str, timeout: float = 30.0) -> list[LibraryBook]:
+    # The Hardcover identifiers of every linked book in calibre's
+    # metadata.db, opened read only next to calibre's own connection
+    db = sqlite3.connect(
+        f"file:{pathname2url(path)}?mode=ro", uri=True, timeout=timeout
+    )
+    try:
+        rows = db.execute(
+            "SELECT book, type, val FROM identifiers WHERE type IN (?, ?, ?, ?, ?)",
+            IDENTIFIER_TYPES,
+        ).fetchall()
+    finally:
+        db.close()
+    identifiers: dict[int, dict[str, str]] = {}
+    for book, kind, value in rows:
+        identifiers.setdefault(book, {})[kind] = value
+    books = []
+    for ids in identifiers.values():
+        book = LibraryBook(
+            ids.get("hardcover-slug") or ids.get("hardcover"),
+            _int(ids.get("hardcover-id")),
+            _int(ids.get("hardcover-edition")),
+            ids.get("isbn"),
+        )
+        if book.slug or book.edition_id:
+            books.append(book)
+    return books
+
+
+def warm_up(
+    cache: IdentifierCache,
+    books: list[LibraryBook],
+    fetch_editions: Callable[[list[int]], dict[int, Book]],
+) -> int:
+    # Caches what the library already knows (slugs, ids and ISBNs), and the
+    # cover URLs of linked editions not cached yet with batched fetches.
+    # Returns how many books were cached.
+    entries = []
+    missing: dict[int, LibraryBook] = {}
+    for book in books:
+        cached = cache.book(book.slug) if book.slug else None
+        if book.edition_id and not (cached and cached.cover_url):
+            missing[book.edition_id] = book
+        elif book.slug:
+            entries.append(CachedBook(book.slug, book.book_id, None, book.isbn))
+    if missing:
+        for edition_id, found in fetch_editions(sorted(missing)).items():
+            book = missing.pop(edition_id)
+            edition = found.editions[0]
+            isbn = book.isbn or edition.isbn_13
+            entries.append(CachedBook(found.slug, found.id, edition.image, isbn))
+            # The library may still have a slug the book has since changed
+            if book.slug and book.slug != found.slug:
+                entries.append(CachedBook(book.slug, found.id, edition.image))
+    entries += [
+        CachedBook(book.slug, book.book_id, None, book.isbn)
+        for book in missing.values()
+        if book.slug
+    ]
+    cache.put(entries)
+    return len(entries)
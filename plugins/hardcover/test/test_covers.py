@@ -0,0 +1,182 @@
+from contextlib import contextmanager
+from urllib import error
+import io
+import struct
+import time
+import pytest
+
+from hardcover.covers import ACCESS_RESOLUTION, CoverCache, Covers, image_size
+
+
+def png(width: int, height: int) -> bytes:
+    return (
+        b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\rIHDR" + struct.pack(">II", width, height)
+    )
+
+
+def jpeg(width: int, height: int) -> bytes:
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9
+    frame = b"\xff\xc0" + struct.pack(">HBHH", 17, 8, height, width) + b"\x00" * 10
+    return b"\xff\xd8" + app0 + frame
+
+
+class Response(io.BytesIO):
+    def __init__(self, status: int, body: bytes = b"", headers=None):
+        super().__init__(body)
+        self.status = status
+        self.reason = "OK" if status < 400 else "Error"
+        self.headers = headers or {}
+
+
+class FakePool:
+    def __init__(self, responses: dict[str, list[Response]]):
+        self.responses = responses
+        self.requests: list[tuple[str, dict]] = []
+
+    @contextmanager
+    def request(self, method, url, body=None, headers=None, timeout=30, timing=None):
+        self.requests.append((url, headers))
+        yield self.responses[url].pop(0)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache_ = CoverCache(str(tmp_path / "cache.sqlite"), str(tmp_path / "covers"))
+    yield cache_
+    cache_.close()
+
+
+def test_image_size():
+    assert image_size(png(400, 600)) == (400, 600)
+    assert image_size(b"GIF89a" + struct.pack("<HH", 32, 48)) == (32, 48)
+    assert image_size(jpeg(800, 1200)) == (800, 1200)
+    webp = b"RIFF\x00\x00\x00\x00WEBPVP8X" + b"\x00" * 8
+    webp += (299).to_bytes(3, "little") + (449).to_bytes(3, "little")
+    assert image_size(webp) == (300, 450)
+    assert image_size(b"\xff\xd8\xff\xe0") is None
+    assert image_size(b"not an image") is None
+
+
+def test_cache_shares_files_between_urls(cache):
+    cache.put("https://a/1.png", b"cover")
+    cache.put("https://a/2.png", b"cover")
+    assert cache.read(cache.entry("https://a/1.png")) == b"cover"
+    assert (
+        cache.entry("https://a/1.png")["digest"]
+        == cache.entry("https://a/2.png")["digest"]
+    )
+    assert cache.total_size() == 5
+
+
+def test_cache_evicts_least_recently_used(cache, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr("hardcover.covers.time.time", lambda: now)
+    cache.max_size = 10
+    cache.put("https://a/1.png", b"12345")
+    now += 1
+    cache.put("https://a/2.png", b"67890")
+    now += ACCESS_RESOLUTION + 1
+    cache.read(cache.entry("https://a/1.png"))
+    cache.put("https://a/3.png", b"abcde")
+    assert cache.entry("https://a/2.png") is None
+    assert cache.read(cache.entry("https://a/1.png")) == b"12345"
+    assert cache.total_size() == 10
+
+
+def test_cache_reads_only_write_stale_access_times(cache, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr("hardcover.covers.time.time", lambda: now)
+    cache.put("https://a/1.png", b"cover")
+    transaction = cache.transaction
+    writes = []
+    monkeypatch.setattr(cache, "transaction", lambda: writes.append(1) or transaction())
+
+    now += 60
+    cache.read(cache.entry("https://a/1.png"))
+    assert writes == []
+    now += ACCESS_RESOLUTION
+    cache.read(cache.entry("https://a/1.png"))
+    assert writes == [1]
+    assert cache.entry("https://a/1.png")["accessed"] == now
+
+
+def test_fetch_revalidates_stale_covers(cache):
+    url = "https://assets/cover.jpg"
+    pool = FakePool({url: [Response(200, b"cover", {"ETag": '"v1"'}), Response(304)]})
+    covers = Covers("test", cache, pool)
+    assert covers.fetch(url) == b"cover"
+    # Fresh, so no request at all
+    assert covers.fetch(url) == b"cover"
+    assert len(pool.requests) == 1
+    covers.fresh_for = 0
+    assert covers.fetch(url) == b"cover"
+    assert pool.requests[1][1]["If-None-Match"] == '"v1"'
+    covers.close()
+
+
+def test_fetch_falls_back_to_stale_covers(cache):
+    url = "https://assets/cover.jpg"
+    pool = FakePool({url: [Response(200, b"cover"), Response(503)]})
+    covers = Covers("test", cache, pool, fresh_for=0)
+    assert covers.fetch(url) == b"cover"
+    assert covers.fetch(url) == b"cover"
+    covers.close()
+
+
+def test_fetch_follows_redirects_and_raises():
+    pool = FakePool(
+        {
+            "https://a/1": [Response(302, headers={"Location": "https://b/1"})],
+            "https://b/1": [Response(200, b"cover")],
+            "https://a/2": [Response(404)],
+        }
+    )
+    covers = Covers("test", None, pool)
+    assert covers.fetch("https://a/1") == b"cover"
+    with pytest.raises(error.HTTPError):
+        covers.fetch("https://a/2")
+    covers.close()
+
+
+def test_fetch_follows_relative_redirects():
+    pool = FakePool(
+        {
+            "https://a/covers/1": [Response(302, headers={"Location": "../large/1"})],
+            "https://a/large/1": [Response(200, b"cover")],
+        }
+    )
+    covers = Covers("test", None, pool)
+    assert covers.fetch("https://a/covers/1") == b"cover"
+    covers.close()
+
+
+def test_invalid_urls_fail_like_unreachable_ones():
+    pool = FakePool({"https://a/1": [Response(302, headers={"Location": "ftp://b/1"})]})
+    covers = Covers("test", None, pool)
+    with pytest.raises(error.URLError):
+        covers.fetch("https://a/1")
+    assert covers.probe("not a url") is None
+    covers.close()
+
+
+def test_best_picks_the_largest_cover():
+    pool = FakePool(
+        {
+            "https://a/small": [Response(206, png(100, 150))],
+            "https://a/large": [Response(206, jpeg(800, 1200))],
+            "https://a/broken": [Response(404)],
+        }
+    )
+    covers = Covers("test", None, pool)
+    covers.remember_candidates(
+        "https://a/small", ["https://a/large", "https://a/broken"]
+    )
+    candidates = covers.candidates("https://a/small")
+    assert candidates == ["https://a/small", "https://a/large", "https://a/broken"]
+    assert covers.best(candidates) == "https://a/large"
+    assert all(headers["Range"] for _, headers in pool.requests)
+    assert covers.best(["https://a/only"]) == "https://a/only"
+    covers.close()
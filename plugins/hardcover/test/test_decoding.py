@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+import pytest
+
+from hardcover.decoding import TypedDecoder, map_book_struct, map_edition_struct
+from hardcover.models import map_from_book_query, map_from_edition_query
+from .utils import create_book_response, create_edition
+
+pytest.importorskip("msgspec")
+
+FIXTURE_DIR = Path(__file__).parent.resolve() / "data"
+
+
+def test_decode_books_matches_dict_mapping():
+    payload = (FIXTURE_DIR / "find_books_by_id.json").read_bytes()
+
+    decoded = TypedDecoder().decode(payload)["data"]["books"]
+    expected = json.loads(payload)["data"]["books"]
+
+    assert [map_book_struct(book) for book in decoded] == [
+        map_from_book_query(book) for book in expected
+    ]
+
+
+def test_decode_batched_editions():
+    edition = create_edition(
+        "Title", 1, isbn="123", authors=["Author"], release_date="2020-01-02"
+    )
+    edition["book"] = create_book_response("Title", "title", unwrapped=True)
+    edition["book"]["tags"] = {"Genre": [{"tag": "Fantasy"}]}
+    payload = json.dumps({"data": {"b0_editions": [edition], "b1_books": None}})
+
+    data = TypedDecoder().decode(payload.encode())["data"]
+
+    assert data["b1_books"] is None
+    (decoded,) = data["b0_editions"]
+    assert map_edition_struct(decoded) == map_from_edition_query(edition)
+
+
+def test_decode_falls_back_to_dicts():
+    payload = b'{"data": {"books": [{"id": "not an int"}]}, "errors": []}'
+
+    assert TypedDecoder().decode(payload) == json.loads(payload)
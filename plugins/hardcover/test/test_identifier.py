@@ -1,10 +1,22 @@
-from unittest.mock import call
+import asyncio
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, call
 from pathlib import Path
 import json
 import pytest
 
 from hardcover import queries
-from hardcover.identifier import HardcoverIdentifier
+from graphql.async_client import AsyncGraphQLClient
+from hardcover.mirror import Mirror
+from hardcover.models import Book, map_from_book_query
+from hardcover.search import SearchCache
+from hardcover.identifier import (
+    EDITION_LIMIT,
+    LOOKUP_BATCHED,
+    LOOKUP_RACE,
+    HardcoverIdentifier,
+)
 from .utils import create_book_response, create_edition
 from calibre.utils import logging as calibre_logging
 
@@ -25,40 +37,36 @@ def identifier(mock_gql_client, monkeypatch):
     return identifier
 
 
-def get_full_query(query: str) -> str:
-    return f"{queries.FRAGMENTS}{query}"
-
-
 @pytest.mark.parametrize(
     "identifiers, query, variables",
     [
         pytest.param(
             {"hardcover-edition": EDITION_ID},
-            get_full_query(queries.FIND_BOOK_BY_EDITION),
+            queries.FIND_BOOK_BY_EDITION,
             {"edition": EDITION_ID},
             id="hardcover-edition",
         ),
         pytest.param(
             {"hardcover": SLUG},
-            get_full_query(queries.FIND_BOOK_BY_SLUG),
-            {"slug": SLUG, "languages": ["eng"]},
+            queries.FIND_BOOK_BY_SLUG,
+            {"slug": SLUG, "languages": ["eng"], "limit": EDITION_LIMIT},
             id="hardcover-slug",
         ),
         pytest.param(
             {"isbn": ISBN},
-            get_full_query(queries.FIND_BOOK_BY_ISBN_OR_ASIN),
+            queries.FIND_BOOK_BY_ISBN_OR_ASIN,
             {"isbn": ISBN, "asin": ""},
             id="isbn",
         ),
         pytest.param(
             {"mobi-asin": ASIN},
-            get_full_query(queries.FIND_BOOK_BY_ISBN_OR_ASIN),
+            queries.FIND_BOOK_BY_ISBN_OR_ASIN,
             {"isbn": "", "asin": ASIN},
             id="asin",
         ),
         pytest.param(
             {"isbn": ISBN, "mobi-asin": ASIN},
-            get_full_query(queries.FIND_BOOK_BY_ISBN_OR_ASIN),
+            queries.FIND_BOOK_BY_ISBN_OR_ASIN,
             {"isbn": ISBN, "asin": ASIN},
             id="isbn+asin",
         ),
@@ -98,31 +106,31 @@ def test_identify_by_identifiers(
     [
         pytest.param(
             {"hardcover-edition": EDITION_ID},
-            get_full_query(queries.FIND_BOOK_BY_EDITION),
+            queries.FIND_BOOK_BY_EDITION,
             {"edition": EDITION_ID},
             id="hardcover-edition",
         ),
         pytest.param(
             {"hardcover": SLUG},
-            get_full_query(queries.FIND_BOOK_BY_SLUG),
-            {"slug": SLUG, "languages": ["eng"]},
+            queries.FIND_BOOK_BY_SLUG,
+            {"slug": SLUG, "languages": ["eng"], "limit": EDITION_LIMIT},
             id="hardcover-slug",
         ),
         pytest.param(
             {"isbn": ISBN},
-            get_full_query(queries.FIND_BOOK_BY_ISBN_OR_ASIN),
+            queries.FIND_BOOK_BY_ISBN_OR_ASIN,
             {"isbn": ISBN, "asin": ""},
             id="isbn",
         ),
         pytest.param(
             {"mobi-asin": ASIN},
-            get_full_query(queries.FIND_BOOK_BY_ISBN_OR_ASIN),
+            queries.FIND_BOOK_BY_ISBN_OR_ASIN,
             {"isbn": "", "asin": ASIN},
             id="asin",
         ),
         pytest.param(
             {"isbn": ISBN, "mobi-asin": ASIN},
-            get_full_query(queries.FIND_BOOK_BY_ISBN_OR_ASIN),
+            queries.FIND_BOOK_BY_ISBN_OR_ASIN,
             {"isbn": ISBN, "asin": ASIN},
             id="isbn+asin",
         ),
@@ -143,9 +151,7 @@ def test_identify_by_identifiers_no_results(
     mock_gql_client.execute.assert_has_calls(
         [
             call(query, variables, 30),
-            call(
-                get_full_query(queries.SEARCH_BY_NAME), {"query": "Title Authors"}, 30
-            ),
+            call(queries.SEARCH_BY_NAME, {"query": "Title Authors"}, 30),
         ]
     )
 
@@ -192,13 +198,13 @@ def test_identify_by_title_and_author(identifier: HardcoverIdentifier, mock_gql_
     mock_gql_client.execute.assert_has_calls(
         [
             call(
-                get_full_query(queries.SEARCH_BY_NAME),
+                queries.SEARCH_BY_NAME,
                 {"query": f"{title} {authors[0]}"},
                 30,
             ),
             call(
-                get_full_query(queries.FIND_BOOKS_BY_IDS),
-                {"ids": result_ids, "languages": ["eng"]},
+                queries.FIND_BOOKS_BY_IDS,
+                {"ids": result_ids, "languages": ["eng"], "limit": EDITION_LIMIT},
                 30,
             ),
         ]
@@ -211,3 +217,645 @@ def test_identify_no_title(identifier: HardcoverIdentifier, mock_gql_client):
     assert len(results) == 0
 
     assert not mock_gql_client.execute.called
+
+
+def test_identify_batched_lookups(identifier: HardcoverIdentifier, mock_gql_client):
+    title = "The Hobbit"
+    identifier.lookup_mode = LOOKUP_BATCHED
+    book = create_book_response(
+        title=title,
+        slug=SLUG,
+        editions=[create_edition(title=title, id=EDITION_ID)],
+    )
+    mock_gql_client.execute_batch.return_value = [
+        {"editions": None},
+        {"editions": []},
+        book,
+    ]
+
+    results = identifier.identify(
+        title, None, {"hardcover-edition": EDITION_ID, "isbn": ISBN, "hardcover": SLUG}
+    )
+
+    assert [book.slug for book in results] == [SLUG]
+    mock_gql_client.execute_batch.assert_called_once_with(
+        [
+            (queries.FIND_BOOK_BY_EDITION, {"edition": EDITION_ID}),
+            (
+                queries.FIND_BOOK_BY_ISBN_OR_ASIN,
+                {"isbn": ISBN, "asin": ""},
+            ),
+            (
+                queries.FIND_BOOK_BY_SLUG,
+                {"slug": SLUG, "languages": ["eng"], "limit": EDITION_LIMIT},
+            ),
+        ],
+        30,
+    )
+    assert not mock_gql_client.execute.called
+
+
+def test_identify_async_prefers_highest_priority(
+    identifier: HardcoverIdentifier,
+):
+    title = "The Hobbit"
+    async_client = MagicMock(spec=AsyncGraphQLClient)()
+    async_client.execute = AsyncMock()
+    identifier.async_client = async_client
+    edition_book = create_edition(title=title, id=EDITION_ID)
+    responses = {
+        queries.FIND_BOOK_BY_EDITION: {"editions": None},
+        queries.FIND_BOOK_BY_ISBN_OR_ASIN: {
+            "editions": [
+                {
+                    **edition_book,
+                    "book": create_book_response(title, "isbn", unwrapped=True),
+                }
+            ]
+        },
+        queries.FIND_BOOK_BY_SLUG: create_book_response(
+            title=title, slug=SLUG, editions=[edition_book]
+        ),
+    }
+
+    async def execute(query, variables, timeout):
+        for key, response in responses.items():
+            if query == key:
+                return response
+
+    async_client.execute.side_effect = execute
+
+    results = asyncio.run(
+        identifier.identify_async(
+            title,
+            None,
+            {"hardcover-edition": EDITION_ID, "isbn": ISBN, "hardcover": SLUG},
+        )
+    )
+
+    assert [book.slug for book in results] == ["isbn"]
+    assert async_client.execute.await_count == 3
+
+
+def test_identify_async_records_off_the_loop(identifier: HardcoverIdentifier):
+    title = "The Hobbit"
+    async_client = MagicMock(spec=AsyncGraphQLClient)()
+    async_client.execute = AsyncMock(
+        return_value=create_book_response(
+            title=title, slug=SLUG, editions=[create_edition(title=title, id=1)]
+        )
+    )
+    identifier.async_client = async_client
+    identifier.mirror = MagicMock()
+    identifier.mirror.by_slug.return_value = []
+    recorded_in = []
+    identifier.mirror.record.side_effect = lambda books, complete: recorded_in.append(
+        threading.current_thread()
+    )
+
+    async def identify():
+        loop_thread = threading.current_thread()
+        results = await identifier.identify_async(title, None, {"hardcover": SLUG})
+        return loop_thread, results
+
+    loop_thread, results = asyncio.run(identify())
+
+    assert [book.slug for book in results] == [SLUG]
+    assert recorded_in and loop_thread not in recorded_in
+
+
+def test_identify_race_keeps_priority(identifier: HardcoverIdentifier, mock_gql_client):
+    title = "The Hobbit"
+    identifier.lookup_mode = LOOKUP_RACE
+    edition_book = create_edition(title=title, id=EDITION_ID)
+    isbn_done = threading.Event()
+
+    def execute(query, variables, timeout):
+        if query == queries.FIND_BOOK_BY_EDITION:
+            # The higher priority lookup answers last, and empty
+            assert isbn_done.wait(5)
+            return {"editions": None}
+        if query == queries.FIND_BOOK_BY_ISBN_OR_ASIN:
+            isbn_done.set()
+            return {
+                "editions": [
+                    {
+                        **edition_book,
+                        "book": create_book_response(title, "isbn", unwrapped=True),
+                    }
+                ]
+            }
+        if query == queries.SEARCH_BY_NAME:
+            return {"search": {"ids": []}}
+        return create_book_response(title=title, slug=SLUG, editions=[edition_book])
+
+    mock_gql_client.execute.side_effect = execute
+
+    results = identifier.identify(
+        title, None, {"hardcover-edition": EDITION_ID, "isbn": ISBN, "hardcover": SLUG}
+    )
+
+    assert [book.slug for book in results] == ["isbn"]
+
+
+def test_identify_race_stops_losing_strategies(
+    identifier: HardcoverIdentifier, mock_gql_client
+):
+    title = "The Hobbit"
+    identifier.lookup_mode = LOOKUP_RACE
+    edition_book = create_edition(title=title, id=EDITION_ID)
+    search_started = threading.Event()
+    race_over = threading.Event()
+    search_done = threading.Event()
+    queried = []
+
+    def execute(query, variables, timeout):
+        queried.append(query)
+        if query == queries.SEARCH_BY_NAME:
+            # The search only answers once the edition lookup has won
+            search_started.set()
+            assert race_over.wait(5)
+            search_done.set()
+            return {"search": {"ids": ["1"]}}
+        assert search_started.wait(5)
+        return {
+            "editions": [
+                {
+                    **edition_book,
+                    "book": create_book_response(title, "edition", unwrapped=True),
+                }
+            ]
+        }
+
+    mock_gql_client.execute.side_effect = execute
+
+    results = identifier.identify(title, None, {"hardcover-edition": EDITION_ID})
+    race_over.set()
+
+    assert [book.slug for book in results] == ["edition"]
+    assert search_done.wait(5)
+    time.sleep(0.1)
+    assert queries.FIND_BOOKS_BY_IDS not in queried
+
+
+def test_identify_async_race_cancels_losers(identifier: HardcoverIdentifier):
+    title = "The Hobbit"
+    identifier.lookup_mode = LOOKUP_RACE
+    async_client = MagicMock(spec=AsyncGraphQLClient)()
+    async_client.execute = AsyncMock()
+    identifier.async_client = async_client
+    edition_book = create_edition(title=title, id=EDITION_ID)
+    cancelled = []
+
+    async def execute(query, variables, timeout):
+        if query == queries.FIND_BOOK_BY_EDITION:
+            return create_book_response(title, "edition", editions=[edition_book])
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+
+    async_client.execute.side_effect = execute
+
+    results = asyncio.run(
+        asyncio.wait_for(
+            identifier.identify_async(
+                title, None, {"hardcover-edition": EDITION_ID, "hardcover": SLUG}
+            ),
+            5,
+        )
+    )
+
+    assert [book.slug for book in results] == ["edition"]
+    assert set(cancelled) == {queries.FIND_BOOK_BY_SLUG, queries.SEARCH_BY_NAME}
+
+
+def test_identify_many_batches_lookups(
+    identifier: HardcoverIdentifier, mock_gql_client
+):
+    isbn_10 = "0618968636"
+    edition = create_edition(title="The Hobbit", id=EDITION_ID)
+    isbn_edition = {
+        **create_edition(title="Dune", id=2),
+        "isbn_10": isbn_10,
+        "book": create_book_response("Dune", "dune", unwrapped=True),
+    }
+    duplicate = create_book_response("Emma", "emma-duplicate", unwrapped=True)
+    duplicate["canonical_id"] = 30
+    canonical = create_book_response(
+        "Emma", "emma", editions=[create_edition(title="Emma", id=3)], unwrapped=True
+    )
+    canonical["id"] = 30
+
+    def execute_batch(operations, timeout):
+        responses = {
+            queries.FIND_BOOKS_BY_EDITIONS: {
+                "editions": [
+                    {
+                        **edition,
+                        "book": create_book_response(
+                            "The Hobbit", SLUG, unwrapped=True
+                        ),
+                    }
+                ]
+            },
+            queries.FIND_BOOKS_BY_ISBNS_OR_ASINS: {"editions": [isbn_edition]},
+            queries.FIND_BOOKS_BY_SLUGS: {"books": [duplicate]},
+            queries.FIND_BOOKS_BY_IDS: {"books": [canonical]},
+        }
+        return [responses[query] for query, _ in operations]
+
+    mock_gql_client.execute_batch.side_effect = execute_batch
+    mock_gql_client.execute.return_value = {"search": {"ids": []}}
+
+    results = identifier.identify_many(
+        [
+            ("The Hobbit", None, {"hardcover-edition": EDITION_ID}),
+            ("Dune", None, {"isbn": isbn_10}),
+            ("Emma", None, {"hardcover": "emma-duplicate"}),
+            ("Unknown", ["Nobody"], {}),
+        ]
+    )
+
+    assert [[book.slug for book in books] for books in results] == [
+        [SLUG],
+        ["dune"],
+        ["emma"],
+        [],
+    ]
+    assert mock_gql_client.execute_batch.call_args_list[0].args[0] == [
+        (queries.FIND_BOOKS_BY_EDITIONS, {"ids": [EDITION_ID]}),
+        (queries.FIND_BOOKS_BY_ISBNS_OR_ASINS, {"isbns": [isbn_10], "asins": []}),
+        (
+            queries.FIND_BOOKS_BY_SLUGS,
+            {"slugs": ["emma-duplicate"], "languages": ["eng"], "limit": EDITION_LIMIT},
+        ),
+    ]
+    assert mock_gql_client.execute_batch.call_args_list[1].args[0] == [
+        (
+            queries.FIND_BOOKS_BY_IDS,
+            {"ids": [30], "languages": ["eng"], "limit": EDITION_LIMIT},
+        ),
+    ]
+    mock_gql_client.execute.assert_called_once_with(
+        queries.SEARCH_BY_NAME, {"query": "Unknown Nobody"}, 30
+    )
+
+
+def test_get_books_by_editions_splits_large_batches(
+    identifier: HardcoverIdentifier, mock_gql_client
+):
+    mock_gql_client.execute_batch.side_effect = lambda operations, timeout: [
+        {"editions": []} for _ in operations
+    ]
+
+    identifier.get_books_by_editions(list(range(1, 1101)))
+
+    sizes = [
+        [len(variables["ids"]) for _, variables in call.args[0]]
+        for call in mock_gql_client.execute_batch.call_args_list
+    ]
+    assert sizes == [[100] * 5, [100] * 5, [100]]
+
+
+def test_identify_many_pages_each_request_separately(mock_gql_client):
+    author = "J. R. R. Tolkien"
+    identifier = HardcoverIdentifier(
+        mock_gql_client,
+        calibre_logging.ThreadSafeLog(),
+        "hardcover",
+        "api_key",
+        0.7,
+        ["eng"],
+        edition_limit=2,
+    )
+    # Both requests are for the same book, each title's edition on the first
+    # page has no author
+    first_page = [
+        create_edition(title="The Hobbit", id=1),
+        create_edition(title="The Silmarillion", id=2),
+    ]
+    pages = {
+        2: [
+            create_edition(title="The Hobbit", id=3, authors=[author]),
+            create_edition(title="The Silmarillion", id=4, authors=[author]),
+        ],
+        4: [],
+    }
+    book = create_book_response("The Hobbit", SLUG, editions=first_page, unwrapped=True)
+    book["id"] = 7
+    mock_gql_client.execute_batch.return_value = [{"books": [book]}]
+
+    def execute(query, variables, timeout):
+        response = create_book_response(
+            "The Hobbit", SLUG, editions=pages[variables["offset"]]
+        )
+        response["books"][0]["id"] = book["id"]
+        return response
+
+    mock_gql_client.execute.side_effect = execute
+
+    results = identifier.identify_many(
+        [
+            ("The Hobbit", [author], {"hardcover-id": str(book["id"])}),
+            ("The Silmarillion", [author], {"hardcover-id": str(book["id"])}),
+        ]
+    )
+
+    assert [[book.editions[0].id for book in books] for books in results] == [
+        [3],
+        [4],
+    ]
+
+
+def test_identify_pages_through_limited_editions(mock_gql_client):
+    title = "The Hobbit"
+    author = "J. R. R. Tolkien"
+    identifier = HardcoverIdentifier(
+        mock_gql_client,
+        calibre_logging.ThreadSafeLog(),
+        "hardcover",
+        "api_key",
+        0.7,
+        ["eng"],
+        edition_limit=2,
+    )
+    pages = {
+        # Neither edition on the first page matches the title, the title match
+        # on the second page has no author
+        0: [
+            create_edition(title="Unrelated", id=1, authors=[author]),
+            create_edition(title="Unrelated", id=2, authors=[author]),
+        ],
+        2: [
+            create_edition(title=title, id=3),
+            create_edition(title="Unrelated", id=4, authors=[author]),
+        ],
+        4: [create_edition(title=title, id=5, authors=[author])],
+    }
+
+    def execute(query, variables, timeout):
+        editions = pages[variables.get("offset", 0)]
+        return create_book_response(title=title, slug=SLUG, editions=editions)
+
+    mock_gql_client.execute.side_effect = execute
+
+    results = identifier.identify(title, [author], {"hardcover": SLUG})
+
+    assert [book.editions[0].id for book in results] == [5]
+    assert mock_gql_client.execute.call_args_list[1:] == [
+        call(
+            queries.FIND_BOOK_EDITIONS,
+            {"ids": [0], "languages": ["eng"], "limit": 2, "offset": offset},
+            30,
+        )
+        for offset in (2, 4)
+    ]
+
+
+def test_iter_matches_yields_books_as_they_are_confirmed(mock_gql_client):
+    title = "The Hobbit"
+    author = "J. R. R. Tolkien"
+    identifier = HardcoverIdentifier(
+        mock_gql_client,
+        calibre_logging.ThreadSafeLog(),
+        "hardcover",
+        "api_key",
+        0.7,
+        ["eng"],
+        edition_limit=2,
+    )
+
+    def book(book_id: int, editions: list[dict]) -> Book:
+        response = create_book_response(title, f"book-{book_id}", editions=editions)
+        response["books"][0]["id"] = book_id
+        return map_from_book_query(response["books"][0])
+
+    # The first book's first page has no edition by the author
+    paged = book(1, [create_edition(title=title, id=i, authors=[]) for i in (1, 2)])
+    matched = book(2, [create_edition(title=title, id=3, authors=[author])])
+    page = create_book_response(
+        title, "book-1", editions=[create_edition(title=title, id=4, authors=[author])]
+    )
+    page["books"][0]["id"] = 1
+    mock_gql_client.execute.return_value = page
+
+    candidates = identifier._filter_editions_by_title([paged, matched], title)
+    matches = identifier.iter_matches(candidates, [author])
+    assert next(matches).slug == "book-2"
+    mock_gql_client.execute.assert_not_called()
+    assert [book.slug for book in matches] == ["book-1"]
+    mock_gql_client.execute.assert_called_once()
+
+    # Collected, they're back in candidate order
+    candidates = identifier._filter_editions_by_title([paged, matched], title)
+    assert [
+        book.slug for book in identifier._select_editions(candidates, [author])
+    ] == ["book-1", "book-2"]
+
+
+def test_identify_fetches_best_search_hits_first(
+    identifier: HardcoverIdentifier, mock_gql_client
+):
+    title = "The Hobbit"
+    hits = [(i, f"Unrelated {i}") for i in range(1, 20)] + [(20, title)]
+    search = {
+        "search": {
+            "ids": [str(book_id) for book_id, _ in hits],
+            "results": {
+                "hits": [
+                    {"document": {"id": str(book_id), "title": hit_title}}
+                    for book_id, hit_title in hits
+                ]
+            },
+        }
+    }
+    book = create_book_response(
+        title=title, slug=SLUG, editions=[create_edition(title=title, id=EDITION_ID)]
+    )
+    mock_gql_client.execute.side_effect = [search, book]
+
+    results = identifier.identify(title, None, {})
+
+    assert [book.slug for book in results] == [SLUG]
+    mock_gql_client.execute.assert_called_with(
+        queries.FIND_BOOKS_BY_IDS,
+        {"ids": [20], "languages": ["eng"], "limit": EDITION_LIMIT},
+        30,
+    )
+
+
+def test_identify_fetches_distant_search_hits_last(
+    identifier: HardcoverIdentifier, mock_gql_client
+):
+    title = "The Lord of the Rings"
+    search = {
+        "search": {
+            "ids": ["1", "2"],
+            "results": {
+                "hits": [
+                    {"document": {"id": "1", "title": "Der Herr der Ringe"}},
+                    {"document": {"id": "2", "title": "The Lord of the Rings"}},
+                ]
+            },
+        }
+    }
+    # The hit with the right title has no matching edition, the one indexed
+    # under its German title does
+    unmatched = create_book_response(
+        title=title, slug="other", editions=[create_edition(title="Unrelated", id=2)]
+    )
+    book = create_book_response(
+        title=title,
+        slug=SLUG,
+        editions=[create_edition(title=title, id=EDITION_ID)],
+    )
+    mock_gql_client.execute.side_effect = [search, unmatched, book]
+
+    results = identifier.identify(title, None, {})
+
+    assert [book.slug for book in results] == [SLUG]
+    assert [
+        call.args[1]["ids"] for call in mock_gql_client.execute.call_args_list[1:]
+    ] == [
+        [2],
+        [1],
+    ]
+
+
+def test_identify_searches_on_past_windows_by_other_authors(
+    identifier: HardcoverIdentifier, mock_gql_client
+):
+    title = "The Hobbit"
+    author = "J. R. R. Tolkien"
+    search = {
+        "search": {
+            "ids": [str(book_id) for book_id in range(1, 7)],
+            "results": {
+                "hits": [
+                    {"document": {"id": str(book_id), "title": title}}
+                    for book_id in range(1, 7)
+                ]
+            },
+        }
+    }
+
+    def books(book_ids: list[int], by: str, contribution: str) -> dict:
+        response = {"books": []}
+        for book_id in book_ids:
+            edition = create_edition(title=title, id=book_id)
+            edition["contributors"] = [
+                {"author": {"name": by}, "contribution": contribution}
+            ]
+            book = create_book_response(
+                title, f"book-{book_id}", editions=[edition], unwrapped=True
+            )
+            book["id"] = book_id
+            response["books"].append(book)
+        return response
+
+    # Every book in the first window is by someone else
+    mock_gql_client.execute.side_effect = [
+        search,
+        books([1, 2, 3, 4, 5], "Someone Else", "Translator"),
+        books([6], author, "Author"),
+    ]
+
+    results = identifier.identify(title, [author], {})
+
+    assert [book.slug for book in results] == ["book-6"]
+
+
+def test_identify_answers_from_mirror(mock_gql_client, tmp_path):
+    title = "The Hobbit"
+    identifier = HardcoverIdentifier(
+        mock_gql_client,
+        calibre_logging.ThreadSafeLog(),
+        "hardcover",
+        "api_key",
+        0.7,
+        ["eng"],
+        mirror=Mirror(str(tmp_path / "mirror.sqlite")),
+    )
+    mock_gql_client.execute.return_value = create_book_response(
+        title=title, slug=SLUG, editions=[create_edition(title=title, id=EDITION_ID)]
+    )
+
+    # Nothing mirrored yet, so the API answers and the book gets recorded
+    first = identifier.identify(title, None, {"hardcover": SLUG})
+    assert mock_gql_client.execute.call_count == 1
+
+    assert identifier.identify(title, None, {"hardcover": SLUG}) == first
+    assert [book.slug for book in identifier.identify(title, None, {})] == [SLUG]
+    assert mock_gql_client.execute.call_count == 1
+
+    # The mirror can't rule out an edition lookup, so that goes to the API
+    identifier.identify(title, None, {"hardcover-edition": 1, "hardcover": SLUG})
+    assert mock_gql_client.execute.call_count == 2
+
+
+def test_identify_pages_past_partly_mirrored_books(mock_gql_client, tmp_path):
+    title = "The Hobbit"
+    author = "J. R. R. Tolkien"
+    identifier = HardcoverIdentifier(
+        mock_gql_client,
+        calibre_logging.ThreadSafeLog(),
+        "hardcover",
+        "api_key",
+        0.7,
+        ["eng"],
+        edition_limit=2,
+        mirror=Mirror(str(tmp_path / "mirror.sqlite")),
+    )
+    pages = {
+        0: [
+            create_edition(title="Unrelated", id=1, authors=[author]),
+            create_edition(title="Unrelated", id=2, authors=[author]),
+        ],
+        2: [
+            create_edition(title=title, id=3),
+            create_edition(title="Unrelated", id=4, authors=[author]),
+        ],
+        4: [create_edition(title=title, id=5, authors=[author])],
+    }
+
+    def execute(query, variables, timeout):
+        editions = pages[variables.get("offset", 0)]
+        return create_book_response(title=title, slug=SLUG, editions=editions)
+
+    mock_gql_client.execute.side_effect = execute
+
+    first = identifier.identify(title, [author], {"hardcover": SLUG})
+    assert [book.editions[0].id for book in first] == [5]
+    assert mock_gql_client.execute.call_count == 3
+
+    # Only some of the book's editions were mirrored, so the API answers
+    again = identifier.identify(title, None, {"hardcover": SLUG})
+    assert [book.editions[0].id for book in again] == [3]
+    assert mock_gql_client.execute.call_count == 5
+
+
+def test_identify_caches_searches(mock_gql_client, tmp_path):
+    identifier = HardcoverIdentifier(
+        mock_gql_client,
+        calibre_logging.ThreadSafeLog(),
+        "hardcover",
+        "api_key",
+        0.7,
+        ["eng"],
+        search_cache=SearchCache(str(tmp_path / "cache.sqlite")),
+    )
+    mock_gql_client.execute.return_value = {"search": {"ids": [], "results": {}}}
+
+    assert identifier.identify("Foo, Vol. 1", ["Someone"], {}) == []
+    assert identifier.identify("foo vol 1", ["someone"], {}) == []
+    mock_gql_client.execute.assert_called_once_with(
+        queries.SEARCH_BY_NAME, {"query": "Foo, Vol. 1 Someone"}, 30
+    )
+
+    # Errors aren't remembered as a lack of hits
+    mock_gql_client.execute.return_value = {"errors": [{"message": "timeout"}]}
+    assert identifier.identify("Bar", ["Someone"], {}) == []
+    assert identifier.identify("Bar", ["Someone"], {}) == []
+    assert mock_gql_client.execute.call_count == 3
@@ -0,0 +1,49 @@
+import pytest
+
+from hardcover.identifiers import CachedBook, IdentifierCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache_ = IdentifierCache(str(tmp_path / "cache.sqlite"))
+    yield cache_
+    cache_.close()
+
+
+def test_lookups(cache):
+    cache.put(
+        [
+            CachedBook("the-hobbit", 1, "https://assets/hobbit.jpg", "9780261102217"),
+            CachedBook("the-silmarillion", 2, None),
+        ]
+    )
+    assert cache.slug_for_isbn("9780261102217") == "the-hobbit"
+    assert cache.cover_url("the-hobbit") == "https://assets/hobbit.jpg"
+    assert cache.book_by_id(2) == CachedBook("the-silmarillion", 2, None)
+    assert cache.cover_url("the-silmarillion") is None
+    assert cache.book("unknown") is None
+    assert cache.slug_for_isbn("unknown") is None
+
+
+def test_shared_between_connections(cache, tmp_path):
+    other = IdentifierCache(str(tmp_path / "cache.sqlite"))
+    other.put([CachedBook("the-hobbit", 1, "https://assets/hobbit.jpg")])
+    assert cache.cover_url("the-hobbit") == "https://assets/hobbit.jpg"
+    other.close()
+
+
+def test_expired_entries_miss(cache):
+    cache.ttl = -1
+    cache.put([CachedBook("the-hobbit", 1, "https://assets/hobbit.jpg", "978")])
+    assert cache.book("the-hobbit") is None
+    assert cache.slug_for_isbn("978") is None
+
+
+def test_evicts_oldest_entries(cache):
+    cache.max_entries = 2
+    for book_id in range(3):
+        cache.put([CachedBook(f"book-{book_id}", book_id, None, f"isbn-{book_id}")])
+    assert cache.book("book-0") is None
+    assert cache.slug_for_isbn("isbn-0") is None
+    assert cache.book("book-2") == CachedBook("book-2", 2, None)
+    assert len(cache.query("SELECT * FROM slugs")) == 2
@@ -0,0 +1,43 @@
+import pytest
+
+from hardcover.matching import (
+    MatchTitle,
+    name_similarity,
+    normalize_name,
+    normalize_title,
+)
+
+
+@pytest.mark.parametrize(
+    "title, expected",
+    [
+        pytest.param("The Hobbit", MatchTitle("the hobbit", "the hobbit"), id="plain"),
+        pytest.param(
+            "The Hobbit: or There and Back Again",
+            MatchTitle("the hobbit or there and back again", "the hobbit"),
+            id="subtitle",
+        ),
+        pytest.param(
+            "Les Misérables (Vol. 2)",
+            MatchTitle("les miserables", "les miserables"),
+            id="diacritics-and-volume",
+        ),
+        pytest.param(
+            "Ender's Game, Book 1", MatchTitle("enders game", "enders game"), id="book"
+        ),
+        pytest.param("The Book Thief", MatchTitle("the book thief", "the book thief")),
+        pytest.param("???", MatchTitle("???", "???"), id="only-punctuation"),
+    ],
+)
+def test_normalize_title(title, expected):
+    assert normalize_title(title) == expected
+
+
+def test_normalize_name():
+    assert normalize_name("J.R.R. Tolkien") == normalize_name("J. R. R. Tolkien")
+    assert normalize_name("Émile  Zola") == "emile zola"
+
+
+def test_name_similarity():
+    assert name_similarity("TOLKIEN", "tolkien") == 1.0
+    assert name_similarity(None, "tolkien") == 0.0  # pyright: ignore[reportArgumentType]
@@ -0,0 +1,142 @@
+from datetime import datetime
+import pytest
+
+from hardcover import mirror as mirror_module
+from hardcover.mirror import Mirror
+from hardcover.models import Author, Book, Edition, Series, Tags
+
+
+def make_edition(id: int, title: str, language="eng", users_count=1, **kwargs):
+    return Edition(
+        id=id,
+        isbn_13=kwargs.get("isbn_13"),
+        asin=kwargs.get("asin"),
+        title=title,
+        authors=[Author("J.R.R. Tolkien", "Author")],
+        image=None,
+        language=language,
+        publisher="Allen & Unwin",
+        users_count=users_count,
+        release_date=datetime(1937, 9, 21),
+        isbn_10=kwargs.get("isbn_10"),
+    )
+
+
+def make_book(id: int, title: str, slug: str, editions: list[Edition]) -> Book:
+    return Book(
+        id=id,
+        title=title,
+        slug=slug,
+        series=Series("Middle-earth", 1.0),
+        rating=4.2,
+        tags=Tags(["Fantasy"], [], [], ["Classic"]),
+        description="There and back again",
+        editions=editions,
+        canonical_id=None,
+    )
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    mirror = Mirror(str(tmp_path / "mirror.sqlite"))
+    yield mirror
+    mirror.close()
+
+
+@pytest.fixture
+def hobbit():
+    return make_book(
+        1,
+        "The Hobbit",
+        "the-hobbit",
+        [
+            make_edition(10, "The Hobbit", users_count=5, isbn_13="9780618968633"),
+            make_edition(11, "Le Hobbit", language="fre", users_count=9),
+            make_edition(12, "The Hobbit", users_count=7, isbn_10="0618968636"),
+        ],
+    )
+
+
+def test_books_round_trip(mirror: Mirror, hobbit: Book):
+    mirror.record([hobbit])
+
+    [book] = mirror.books([1], ["eng"])
+    assert book.series == hobbit.series
+    assert book.tags == hobbit.tags
+    # Editions in other languages are left out, most read first
+    assert [edition.id for edition in book.editions] == [12, 10]
+    assert book.editions[1] == hobbit.editions[0]
+    assert [b.id for b in mirror.by_slug("the-hobbit", ["eng", "fre"])] == [1]
+
+
+def test_edition_lookups(mirror: Mirror, hobbit: Book):
+    mirror.record([hobbit])
+
+    assert [b.editions[0].id for b in mirror.by_edition(11)] == [11]
+    assert [b.editions[0].id for b in mirror.by_isbn_asin("0618968636", "")] == [12]
+    assert [b.editions[0].id for b in mirror.by_isbn_asin("9780618968633", "")] == [10]
+    assert mirror.by_isbn_asin("", "") == []
+    assert mirror.by_edition(99) == []
+
+
+def test_incomplete_books_only_answer_edition_lookups(mirror: Mirror, hobbit: Book):
+    mirror.record(
+        [make_book(1, "The Hobbit", "the-hobbit", hobbit.editions[:1])], False
+    )
+
+    assert mirror.books([1], ["eng"]) == []
+    assert len(mirror.by_edition(10)) == 1
+
+
+def test_looked_up_editions_stay_out_of_books(mirror: Mirror, hobbit: Book):
+    # e.g. an audiobook, which the book's own editions query leaves out
+    audiobook = make_edition(13, "The Hobbit", users_count=99)
+    mirror.record([hobbit])
+    mirror.record([make_book(1, "The Hobbit", "the-hobbit", [audiobook])], False)
+    # Re-listed editions stay in, even when later looked up on their own
+    mirror.record(
+        [make_book(1, "The Hobbit", "the-hobbit", hobbit.editions[:1])], False
+    )
+
+    [book] = mirror.books([1], ["eng"])
+    assert [edition.id for edition in book.editions] == [12, 10]
+    assert [b.editions[0].id for b in mirror.by_edition(13)] == [13]
+
+
+def test_stale_records_miss(mirror: Mirror, hobbit: Book, monkeypatch):
+    mirror.record([hobbit])
+    now = mirror_module.time.time()
+    monkeypatch.setattr(mirror_module.time, "time", lambda: now + mirror.max_age + 1)
+
+    assert mirror.books([1], ["eng"]) == []
+    assert mirror.by_edition(10) == []
+
+
+def test_search(mirror: Mirror, hobbit: Book):
+    dune = make_book(2, "Dune", "dune", [make_edition(20, "Dune")])
+    mirror.record([hobbit, dune])
+
+    assert mirror.search("the hobbit", "J. R. R. Tolkien") == [1]
+    assert mirror.search("The Hobbit", "Frank Herbert") == []
+    assert mirror.search("dune", None) == [2]
+    assert mirror.search("...", None) == []
+
+
+def test_refresh(mirror: Mirror, hobbit: Book, monkeypatch):
+    dune = make_book(2, "Dune", "dune", [make_edition(20, "Dune")])
+    mirror.record([hobbit, dune])
+    now = mirror_module.time.time()
+    monkeypatch.setattr(mirror_module.time, "time", lambda: now + mirror.max_age)
+    fetched = []
+
+    def fetch(book_ids):
+        fetched.append(book_ids)
+        # Dune is gone from the API, the Hobbit gets recorded again
+        mirror.record([hobbit])
+        return [hobbit]
+
+    assert mirror.refresh(fetch) == 2
+    assert fetched == [[1, 2]]
+    assert mirror.stale_book_ids() == []
+    assert mirror.search("dune", None) == []
+    assert [b.id for b in mirror.books([1, 2], ["eng"])] == [1]
@@ -0,0 +1,176 @@
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Any, Optional
+import gc
+import json
+import tracemalloc
+import pytest
+
+from hardcover.models import Author, Edition, Tags, make_author, map_from_book_query
+from .utils import create_book_response, create_edition
+
+
+# The models as they were before: plain dataclasses with nothing shared
+@dataclass
+class PlainAuthor:
+    name: str
+    contribution: str
+
+
+@dataclass
+class PlainEdition:
+    id: int
+    isbn_13: Optional[str]
+    asin: Optional[str]
+    title: str
+    authors: list[PlainAuthor]
+    image: Optional[str]
+    language: Optional[str]
+    publisher: Optional[str]
+    users_count: int
+    release_date: Optional[datetime]
+
+
+@dataclass
+class PlainBook:
+    id: int
+    title: str
+    slug: str
+    tags: dict[str, list[str]]
+    editions: list[PlainEdition]
+
+
+def map_plain(data: dict[str, Any]) -> PlainBook:
+    return PlainBook(
+        id=data["id"],
+        title=data["title"],
+        slug=data["slug"],
+        tags={
+            key: [tag["tag"] for tag in data["tags"].get(category, [])]
+            for key, category in (("genre", "Genre"), ("tag", "Tag"))
+        },
+        editions=[
+            PlainEdition(
+                id=edition["id"],
+                isbn_13=edition["isbn_13"],
+                asin=edition["asin"],
+                title=edition["title"],
+                authors=[
+                    PlainAuthor(entry["author"]["name"], entry.get("contribution"))
+                    for entry in edition["contributors"]
+                ],
+                image=None,
+                language=edition["language"]["code3"],
+                publisher=edition["publisher"]["name"],
+                users_count=edition["users_count"],
+                release_date=datetime.fromisoformat(edition["release_date"]),
+            )
+            for edition in data["editions"]
+        ],
+    )
+
+
+def large_payload() -> bytes:
+    books = []
+    for book_id in range(50):
+        title = f"A Rather Long Book Title Number {book_id}"
+        book = create_book_response(
+            title,
+            f"book-{book_id}",
+            editions=[
+                {
+                    **create_edition(
+                        title=title,
+                        id=book_id * 1000 + edition_id,
+                        isbn=f"978{book_id:04d}{edition_id:06d}",
+                        authors=["Someone With A Name", "Another Contributor"],
+                        publisher="A Very Large Publishing House",
+                        release_date="2001-01-01",
+                    ),
+                    "contributors": [
+                        {"author": {"name": "Someone With A Name"}},
+                        {
+                            "author": {"name": "Another Contributor"},
+                            "contribution": "Illustrator",
+                        },
+                    ],
+                }
+                for edition_id in range(200)
+            ],
+            unwrapped=True,
+        )
+        book["tags"] = {"Genre": [{"tag": "Fantasy"}], "Tag": [{"tag": "Classic"}]}
+        books.append(book)
+    return json.dumps(books).encode()
+
+
+def retained(mapper, payload: bytes) -> int:
+    # Memory still held by the mapped books once the response is gone
+    gc.collect()
+    tracemalloc.start()
+    try:
+        books = [mapper(book) for book in json.loads(payload)]
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(books) == 50
+    return current
+
+
+def test_models_are_compact():
+    payload = large_payload()
+    plain = retained(map_plain, payload)
+    compact = retained(map_from_book_query, payload)
+    assert compact < plain * 0.6, (compact, plain)
+
+
+def test_models_share_strings():
+    book = map_from_book_query(json.loads(large_payload())[0])
+    first, second = book.editions[0], book.editions[1]
+    assert first.publisher is second.publisher
+    assert first.authors[0] is second.authors[0]
+    assert not hasattr(first, "__dict__")
+
+
+def test_tags():
+    tags = Tags(genre=["Fantasy"], tag=["Classic", "Dragons"])
+    assert tags.genre == ["Fantasy"]
+    assert tags.mood == []
+    assert tags.tag == ["Classic", "Dragons"]
+    assert tags == Tags(["Fantasy"], [], [], ["Classic", "Dragons"])
+    assert tags != Tags(["Fantasy", "Classic"], [], [], ["Dragons"])
+    assert tags.as_dict()["content_warning"] == []
+
+
+def test_authors_are_frozen():
+    author = make_author("J.R.R. Tolkien", "Author")
+    assert author is make_author("J.R.R. Tolkien", "Author")
+    assert author == Author("J.R.R. Tolkien", "Author")
+    with pytest.raises(AttributeError):
+        author.name = "Someone"  # pyright: ignore[reportAttributeAccessIssue]
+    assert replace(author, contribution="Editor").contribution == "Editor"
+
+
+def test_editions_decode_on_access():
+    data = json.loads(large_payload())[0]
+    book = map_from_book_query(data)
+    edition = book.editions[0]
+    assert not any(edition.decoded for edition in book.editions)
+    assert edition.title == data["title"]
+    assert not edition.decoded
+    assert edition.publisher == "A Very Large Publishing House"
+    assert edition.decoded
+    assert not book.editions[1].decoded
+    assert edition == Edition(
+        id=edition.id,
+        isbn_13=edition.isbn_13,
+        asin=None,
+        title=edition.title,
+        authors=edition.authors,
+        image=None,
+        language="eng",
+        publisher="A Very Large Publishing House",
+        users_count=edition.users_count,
+        release_date=datetime(2001, 1, 1),
+    )
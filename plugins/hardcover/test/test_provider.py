@@ -1,6 +1,10 @@
+import queue
+import threading
 import pytest
 from unittest.mock import MagicMock
 
+from hardcover.identifiers import CachedBook, IdentifierCache
+from hardcover.models import Author, Book, Edition
 from hardcover.provider import HardcoverProvider
 from .utils import MockMetadata
 import logging
@@ -10,21 +14,72 @@ logger = logging.getLogger(__name__)
 
 
 @pytest.fixture
-def provider(mock_source, monkeypatch):
+def provider(mock_source, monkeypatch, tmp_path):
+    monkeypatch.setattr("hardcover.provider.cache_dir", lambda: str(tmp_path))
     provider_ = HardcoverProvider(mock_source)
     monkeypatch.setattr(
         provider_,
         "init_metadata",
         MagicMock(side_effect=lambda title, authors: MockMetadata(title, authors)),
     )
+    monkeypatch.setattr(provider_, "covers", MagicMock())
+    monkeypatch.setattr(provider_, "identifier_cache", None)
     return provider_
 
 
+def create_book(book_id: int) -> Book:
+    edition = Edition(
+        id=book_id,
+        isbn_13=None,
+        asin=None,
+        title="The Hobbit",
+        authors=[Author("J.R.R. Tolkien", "Author")],
+        image=None,
+        language="eng",
+        publisher=None,
+        users_count=1,
+        release_date=None,
+    )
+    return Book(
+        id=book_id,
+        title="The Hobbit",
+        slug=f"book-{book_id}",
+        series=None,
+        rating=None,
+        tags=None,
+        description=None,
+        editions=[edition],
+        canonical_id=None,
+    )
+
+
 def test_get_book_url_no_identifier(provider: HardcoverProvider):
     identifiers = {}
     assert provider.get_book_url(identifiers) is None
 
 
+def test_caches_open_on_first_use(mock_source, monkeypatch, tmp_path):
+    monkeypatch.setattr("hardcover.provider.cache_dir", lambda: str(tmp_path))
+    provider_ = HardcoverProvider(mock_source)
+    assert not (tmp_path / "hardcover-cache.sqlite").exists()
+    assert provider_.search_cache is not None
+    assert (tmp_path / "hardcover-cache.sqlite").exists()
+    assert not (tmp_path / "hardcover-covers").exists()
+
+
+def test_close_shuts_down_covers(provider: HardcoverProvider):
+    covers = provider.covers
+    provider.close()
+    covers.close.assert_called_once()
+
+
+def test_close_leaves_unused_covers_alone(mock_source, monkeypatch, tmp_path):
+    monkeypatch.setattr("hardcover.provider.cache_dir", lambda: str(tmp_path))
+    provider_ = HardcoverProvider(mock_source)
+    provider_.close()
+    assert "covers" not in provider_.__dict__
+
+
 def test_get_book_url_with_identifier(provider: HardcoverProvider):
     identifiers = {"hardcover": "the-hobbit"}
     expected = (
@@ -34,3 +89,55 @@ def test_get_book_url_with_identifier(provider: HardcoverProvider):
     )
     result = provider.get_book_url(identifiers)
     assert result == expected
+
+
+def test_get_cached_cover_url_reads_through(provider: HardcoverProvider, tmp_path):
+    provider.identifier_cache = IdentifierCache(str(tmp_path / "cache.sqlite"))
+    provider.source.cached_isbn_to_identifier.return_value = None
+    provider.source.cached_identifier_to_cover_url.return_value = None
+    provider.identifier_cache.put(
+        [CachedBook("the-hobbit", 1, "https://assets/hobbit.jpg", "9780261102217")]
+    )
+    url = "https://assets/hobbit.jpg"
+    assert provider.get_cached_cover_url({"hardcover": "the-hobbit"}) == url
+    assert provider.get_cached_cover_url({"isbn": "9780261102217"}) == url
+    assert provider.get_cached_cover_url({"hardcover-id": "1"}) == url
+    assert provider.get_cached_cover_url({"hardcover": "unknown"}) is None
+    provider.source.cache_identifier_to_cover_url.assert_called_with("the-hobbit", url)
+
+
+def test_identify_enqueues_books_as_they_arrive(provider: HardcoverProvider):
+    result_queue = queue.Queue()
+    identifier = MagicMock(lookup_mode="sequential", mirror=None)
+    identifier.find_candidates.return_value = ["candidates"]
+    books = [create_book(1), create_book(2)]
+
+    def iter_matches(candidates, authors):
+        assert candidates == ["candidates"]
+        yield books[0]
+        # The first book is with calibre before the second is confirmed
+        assert result_queue.qsize() == 1
+        yield books[1]
+
+    identifier.iter_matches.side_effect = iter_matches
+    provider._create_identifier = MagicMock(return_value=identifier)
+    provider.identify(
+        MagicMock(), result_queue, threading.Event(), "The Hobbit", ["Tolkien"]
+    )
+    assert [result_queue.get().identifiers["hardcover-id"] for _ in books] == ["1", "2"]
+
+
+def test_identify_many_cleans_metadata(provider: HardcoverProvider):
+    identifier = MagicMock(mirror=None)
+    identifier.identify_many.return_value = [[create_book(1)], []]
+    provider._create_identifier = MagicMock(return_value=identifier)
+    results = provider.identify_many(
+        MagicMock(), [("The Hobbit", None, {}), ("Unknown", None, {})]
+    )
+    assert [
+        [meta.identifiers["hardcover-id"] for meta in metas] for metas in results
+    ] == [
+        ["1"],
+        [],
+    ]
+    provider.source.clean_downloaded_metadata.assert_called_once_with(results[0][0])
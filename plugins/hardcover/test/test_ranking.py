@@ -0,0 +1,80 @@
+from hardcover.ranking import (
+    RankingStats,
+    StageStats,
+    at_least,
+    scored,
+    top_k,
+    until_good_enough,
+)
+
+
+class CountingScorer:
+    def __init__(self, scores: dict[str, float]):
+        self.scores = scores
+        self.chunks: list[list[str]] = []
+
+    def __call__(self, chunk: list[str]) -> list[float]:
+        self.chunks.append(chunk)
+        return [self.scores[item] for item in chunk]
+
+
+def test_scored_is_lazy_and_chunked():
+    scorer = CountingScorer({"a": 0.1, "b": 0.2, "c": 0.3})
+    candidates = scored(["a", "b", "c"], scorer, chunk_size=2)
+    assert scorer.chunks == []
+    assert next(candidates) == (0.1, 0, "a")
+    assert scorer.chunks == [["a", "b"]]
+    assert [c.item for c in candidates] == ["b", "c"]
+    assert scorer.chunks == [["a", "b"], ["c"]]
+
+
+def test_at_least_counts_drops():
+    stats = StageStats()
+    dropped = []
+    candidates = scored(["a", "b", "c"], CountingScorer({"a": 0.9, "b": 0.5, "c": 0.7}))
+    kept = list(at_least(candidates, 0.7, stats, dropped.append))
+    assert [c.item for c in kept] == ["a", "c"]
+    assert [c.item for c in dropped] == ["b"]
+    assert stats == StageStats(seen=3, dropped=1)
+
+
+def test_until_good_enough_stops_scoring():
+    items = ["a", "b", "c", "d", "e"]
+    scorer = CountingScorer({"a": 0.95, "b": 0.5, "c": 0.96, "d": 1.0, "e": 1.0})
+    stats = StageStats()
+    candidates = until_good_enough(
+        scored(items, scorer, chunk_size=1), 0.9, 2, len(items), stats
+    )
+    assert top_k(candidates, 2, StageStats()) == ["c", "a"]
+    assert scorer.chunks == [["a"], ["b"], ["c"]]
+    assert stats == StageStats(seen=5, dropped=2)
+
+
+def test_until_good_enough_disabled():
+    items = ["a", "b"]
+    scorer = CountingScorer({"a": 1.0, "b": 1.0})
+    candidates = until_good_enough(scored(items, scorer), None, 1, 2, StageStats())
+    assert [c.item for c in candidates] == items
+
+
+def test_top_k_keeps_order_between_ties():
+    stats = StageStats()
+    scores = {"a": 0.5, "b": 0.9, "c": 0.7, "d": 0.9, "e": 0.2}
+    candidates = scored(list(scores), CountingScorer(scores))
+    assert top_k(candidates, 3, stats) == ["b", "d", "c"]
+    assert stats == StageStats(seen=5, dropped=2)
+
+
+def test_top_k_without_limit():
+    scores = {"a": 0.5, "b": 0.9}
+    candidates = scored(list(scores), CountingScorer(scores))
+    assert top_k(candidates, 0, StageStats()) == ["b", "a"]
+    assert top_k(iter([]), 5, StageStats()) == []
+
+
+def test_ranking_stats_summary():
+    stats = RankingStats()
+    stats.stage("title").seen += 4
+    stats.stage("title").dropped += 1
+    stats.stage("title top-k").seen += 3
+    assert stats.summary() == "title dropped 1/4, title top-k dropped 0/3"
@@ -0,0 +1,102 @@
+import random
+import pytest
+
+from hardcover.matching import (
+    MatchTitle,
+    jaro_winkler,
+    name_similarity,
+    normalize_title,
+)
+from hardcover.models import Author, Edition
+from hardcover.scoring import (
+    PyJaroWinklerBackend,
+    SimilarityScorer,
+    create_backend,
+)
+
+WEIGHTS = {"Author": 2.0}
+NAMES = ["J.R.R. Tolkien", "Christopher Tolkien", "Alan Lee", "Tolkien", "", "Ursula"]
+
+
+def random_title(rng: random.Random) -> str:
+    words = ["the", "hobbit", "lord", "rings", "silmarillion", "tales", "book 2"]
+    title = " ".join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+    return title + rng.choice(["", ": illustrated", " (annotated)"])
+
+
+def create_editions(rng: random.Random, count: int) -> list[Edition]:
+    return [
+        Edition(
+            id=i,
+            isbn_13=None,
+            asin=None,
+            title=random_title(rng),
+            authors=[
+                Author(rng.choice(NAMES), rng.choice(["Author", "Illustrator"]))
+                for _ in range(rng.randint(0, 3))
+            ],
+            image=None,
+            language=None,
+            publisher=None,
+            users_count=0,
+            release_date=None,
+        )
+        for i in range(count)
+    ]
+
+
+def reference_author_score(edition: Edition, authors: list[str]) -> float:
+    total = 0.0
+    for author in edition.authors:
+        weight = WEIGHTS.get(author.contribution, 1.0)
+        total += max(name_similarity(author.name, name) for name in authors) * weight
+    return total / len(edition.authors) if edition.authors else 0.0
+
+
+def reference_title_score(query: MatchTitle, candidate: MatchTitle) -> float:
+    if (query.full == query.base) != (candidate.full == candidate.base):
+        return jaro_winkler(query.base, candidate.base)
+    return jaro_winkler(query.full, candidate.full)
+
+
+@pytest.fixture(params=["pyjarowinkler", "rapidfuzz"])
+def scorer(request):
+    if request.param == "rapidfuzz":
+        pytest.importorskip("rapidfuzz")
+        pytest.importorskip("numpy")
+    return SimilarityScorer(create_backend(request.param))
+
+
+def test_author_scores_match_reference(scorer: SimilarityScorer):
+    rng = random.Random(42)  # noqa: S311
+    editions = create_editions(rng, 300)
+    authors = ["Tolkien, J. R. R.", "Alan Lee"]
+
+    assert scorer.author_scores(editions, authors, WEIGHTS) == [
+        reference_author_score(edition, authors) for edition in editions
+    ]
+
+
+def test_title_scores_match_reference(scorer: SimilarityScorer):
+    rng = random.Random(7)  # noqa: S311
+    titles = [normalize_title(random_title(rng)) for _ in range(300)]
+    for query in ("The Hobbit", "The Lord of the Rings: The Two Towers"):
+        target = normalize_title(query)
+        assert scorer.title_scores(target, titles) == [
+            reference_title_score(target, title) for title in titles
+        ]
+
+
+def test_title_scores_ignore_one_sided_subtitles(scorer: SimilarityScorer):
+    query = normalize_title("The Hobbit")
+    assert scorer.title_scores(query, [normalize_title("The Hobbit: Illustrated")]) == [
+        1.0
+    ]
+    query = normalize_title("Star Wars: Heir to the Empire")
+    candidate = normalize_title("Star Wars: Dark Force Rising")
+    assert scorer.title_scores(query, [candidate])[0] < 1.0
+
+
+def test_default_backend():
+    assert create_backend().name in ("pyjarowinkler", "rapidfuzz")
+    assert isinstance(create_backend("pyjarowinkler"), PyJaroWinklerBackend)
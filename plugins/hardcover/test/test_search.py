@@ -0,0 +1,74 @@
+import json
+
+from hardcover import search as search_module
+from hardcover.scoring import SimilarityScorer
+from hardcover.search import (
+    SearchCache,
+    SearchHit,
+    parse_search_hits,
+    prerank_hits,
+    windows,
+)
+
+
+def document(book_id: int, title: str, authors: list[str]) -> dict:
+    return {"document": {"id": str(book_id), "title": title, "author_names": authors}}
+
+
+def test_parse_search_hits():
+    results = {
+        "hits": [
+            document(2, "The Hobbit", ["J.R.R. Tolkien", None]),
+            {"document": {"title": "No id"}},
+            document(1, "Dune", []),
+        ]
+    }
+    assert parse_search_hits(results, [1, 2, 3]) == [
+        SearchHit(1, "Dune", []),
+        SearchHit(2, "The Hobbit", ["J.R.R. Tolkien"]),
+        SearchHit(3, None, []),
+    ]
+    assert parse_search_hits(json.dumps(results), [2]) == [
+        SearchHit(2, "The Hobbit", ["J.R.R. Tolkien"])
+    ]
+    assert parse_search_hits("not json", [1]) == [SearchHit(1, None, [])]
+
+
+def test_prerank_hits():
+    hits = [
+        SearchHit(1, "Unrelated", ["J.R.R. Tolkien"]),
+        SearchHit(2, "The Hobbit: Illustrated", ["Someone Else"]),
+        SearchHit(3, "The Hobbitt", ["J. R. R. Tolkien"]),
+        SearchHit(4, "The Hobbit", ["J.R.R. Tolkien"]),
+        SearchHit(5, None, []),
+    ]
+    ranked, distant = prerank_hits(
+        hits, "The Hobbit", ["J.R.R. Tolkien"], SimilarityScorer(), 0.7
+    )
+    assert [hit.id for hit in ranked] == [4, 3, 2, 5]
+    assert [hit.id for hit in distant] == [1]
+
+
+def test_windows_double():
+    hits = [SearchHit(i, "t", []) for i in range(12)]
+    assert list(windows(hits, 2)) == [[0, 1], [2, 3, 4, 5], [6, 7, 8, 9, 10, 11]]
+    assert list(windows([], 2)) == []
+
+
+def test_search_cache(tmp_path, monkeypatch):
+    cache = SearchCache(
+        str(tmp_path / "cache.sqlite"), positive_ttl=60, negative_ttl=10
+    )
+    hits = [SearchHit(1, "Foo, Vol. 1", ["Someone"]), SearchHit(2, None, [])]
+    cache.put("Foo, Vol. 1 Someone", hits)
+    cache.put("Nothing Here", [])
+
+    assert cache.get("foo vol 1   someone") == hits
+    assert cache.get("Foo Vol 2 Someone") is None
+    assert cache.get("nothing here") == []
+
+    # The negative entry expires first
+    now = search_module.time.time()
+    monkeypatch.setattr(search_module.time, "time", lambda: now + 30)
+    assert cache.get("Nothing Here") is None
+    assert cache.get("Foo Vol 1 Someone") == hits
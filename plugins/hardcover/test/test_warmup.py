@@ -0,0 +1,69 @@
+import sqlite3
+import pytest
+
+from hardcover.identifiers import CachedBook, IdentifierCache
+from hardcover.models import map_from_book_query
+from hardcover.warmup import LibraryBook, read_library, warm_up
+from .utils import create_book_response, create_edition
+
+
+@pytest.fixture
+def library(tmp_path):
+    path = str(tmp_path / "metadata.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE identifiers (id INTEGER PRIMARY KEY, book, type, val)")
+    db.executemany(
+        "INSERT INTO identifiers (book, type, val) VALUES (?, ?, ?)",
+        [
+            (1, "hardcover-slug", "the-hobbit"),
+            (1, "hardcover-id", "10"),
+            (1, "hardcover-edition", "100"),
+            (1, "isbn", "9780261102217"),
+            (2, "hardcover", "the-silmarillion"),
+            (3, "isbn", "9780000000000"),
+            (3, "goodreads", "123"),
+        ],
+    )
+    db.commit()
+    db.close()
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache_ = IdentifierCache(str(tmp_path / "cache.sqlite"))
+    yield cache_
+    cache_.close()
+
+
+def test_read_library(library):
+    assert sorted(read_library(library)) == [
+        LibraryBook("the-hobbit", 10, 100, "9780261102217"),
+        LibraryBook("the-silmarillion", None, None, None),
+    ]
+
+
+def test_warm_up(cache, library):
+    fetched = []
+
+    def fetch_editions(edition_ids):
+        fetched.append(edition_ids)
+        book = create_book_response(
+            "The Hobbit",
+            "the-hobbit",
+            editions=[create_edition("The Hobbit", 100, image_url="https://a/1.jpg")],
+            unwrapped=True,
+        )
+        book["id"] = 10
+        return {100: map_from_book_query(book)}
+
+    assert warm_up(cache, read_library(library), fetch_editions) == 2
+    assert fetched == [[100]]
+    assert cache.slug_for_isbn("9780261102217") == "the-hobbit"
+    assert cache.book("the-hobbit") == CachedBook("the-hobbit", 10, "https://a/1.jpg")
+    assert cache.book("the-silmarillion") == CachedBook("the-silmarillion", None, None)
+
+    # Books with a cached cover aren't fetched again, and keep their cover
+    warm_up(cache, read_library(library), fetch_editions)
+    assert fetched == [[100]]
+    assert cache.cover_url("the-hobbit") == "https://a/1.jpg"